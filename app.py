@@ -1,3 +1,5 @@
+import time
+_SCRIPT_RUN_STARTED = time.perf_counter()
 import streamlit as st
 import pandas as pd
 import random
@@ -5,27 +7,36 @@ import datetime
 import io
 import os
 import logging
-import re
-import smtplib
+import json
+import collections
+import dataclasses
+import sqlite3
 from typing import Optional, List, Dict, Any, Tuple
-from email.mime.text import MIMEText
-from email.mime.multipart import MIMEMultipart
-from email.mime.application import MIMEApplication
-from faker import Faker
-from reportlab.pdfgen import canvas
-from reportlab.lib.pagesizes import letter
-from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, Image
-from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
-from reportlab.lib import colors
-from reportlab.lib.units import inch
-from reportlab.lib.enums import TA_LEFT, TA_RIGHT, TA_CENTER
-from PIL import Image as PILImage, ImageDraw, ImageFont
+import shutil
+import tempfile
 import zipfile
+# ReportLab, PIL, Faker and the email modules are imported lazily by the features that use them.
+from artifact_cache import ArtifactCache, config_hash, bytes_hash
+from columnar_export import COLUMNAR_FORMATS
+from ingest import IngestError, format_errors, ingest_task_activity, ingest_timekeepers
+from invoice_summary import summarize_invoice, summary_to_csv, summary_to_json
+from pdf_layouts import layout_hash
+from periods import MAX_PLANNED_PERIODS, PARALLEL_MIN_JOBS, PERIOD_FREQUENCIES, WEEKDAY_PATTERNS, dispatch_period_rows, plan_periods
+from mandatory_items import compile_mandatory_items
+from ledes_validation import VALIDATION_MODES, ValidationRules, has_errors, validate_invoice, violations_report, violations_to_csv
+from numbering import NUMBER_PATTERNS, RUN_NUMBER_PATTERN, UniqueNames, persistent_numberer
+from run_catalog import RunCatalog, catalog_call, open_catalog
+from telemetry import METRICS, METRICS_DEFAULT_HOST, SMTP_FAILURES, SMTP_SEND_SECONDS, bind_log_context, configure_logging, record_run, serve_metrics
+from spool import ArtifactData, SpooledArtifact, open_artifact
+from mail_delivery import DeliveryPolicy, link_folder, plan_delivery, publish_links, send_plan
+from preview import RowView, facets, filter_rows, page_count, page_frame, summary_totals
+from timekeepers import TimekeeperRegistry
+from invoice_engine import (
+    BILLING_PROFILES, CONFIG, PDF_COMPRESSION_MODES, PDF_IMAGE_DPI_CHOICES, GenerationSettings, PdfOutputOptions, get_profile, _calculate_max_fees, _validate_image_bytes,
+    _create_ledes_1998b_content, _create_pdf_invoice, _create_receipt_image, _seed_invoice_rng,
+    _pack_files, _unpack_files,
+)
 
-# --- Receipt size configuration (for receipt PDFs) ---
-RECEIPT_SIZE_IN = (4, 6)  # width, height in inches; change to (3,5) for 3x5
-RECEIPT_DPI = 300         # print-quality DPI
-# -----------------------------------------------------
 #st.markdown("""
 #    <style>
 #        /* --- ERROR (Red) --- */
@@ -97,572 +108,121 @@ def apply_preset():
         st.session_state.fee_slider = preset["fees"]
         st.session_state.expense_slider = preset["expenses"]
 
-# ===============================
-# Billing Profiles Configuration
-# ===============================
-# Format: (Environment, Client Name, Client ID, Law Firm Name, Law Firm ID)
-BILLING_PROFILES = [
-    ("Onit ELM",    "A Onit Inc.",   "02-4388252", "Nelson & Murdock", "02-1234567"),
-    ("SimpleLegal", "Penguin LLC",   "C004",       "JDL",               "JDL001"),
-    ("Unity",       "Unity Demo",    "uniti-demo", "Gold USD",          "Gold USD"),
-]
-
-def get_profile(env: str):
-    """Return (client_name, client_id, law_firm_name, law_firm_id) for the environment."""
-    for p in BILLING_PROFILES:
-        if p[0] == env:
-            return (p[1], p[2], p[3], p[4])
-    p = BILLING_PROFILES[0]
-    return (p[1], p[2], p[3], p[4])
-
 
 # --- Logging Setup ---
-logging.basicConfig(level=logging.ERROR, format='%(asctime)s - %(levelname)s - %(message)s')
-
-# --- Constants ---
-CONFIG = {
-    'EXPENSE_CODES': {
-        "Copying": "E101", "Outside printing": "E102", "Word processing": "E103",
-        "Facsimile": "E104", "Telephone": "E105", "Online research": "E106",
-        "Delivery services/messengers": "E107", "Postage": "E108", "Local travel": "E109",
-        "Out-of-town travel": "E110", "Meals": "E111", "Court fees": "E112",
-        "Subpoena fees": "E113", "Witness fees": "E114", "Deposition transcripts": "E115",
-        "Trial transcripts": "E116", "Trial exhibits": "E117",
-        "Litigation support vendors": "E118", "Experts": "E119",
-        "Private investigators": "E120", "Arbitrators/mediators": "E121",
-        "Local counsel": "E122", "Other professionals": "E123", "Other": "E124",
-    },
-    'DEFAULT_TASK_ACTIVITY_DESC': [
-        ("L100", "A101", "Legal Research: Analyze legal precedents"),
-        ("L110", "A101", "Legal Research: Review statutes and regulations"),
-        ("L120", "A101", "Legal Research: Draft research memorandum"),
-        ("L130", "A102", "Case Assessment: Initial case evaluation"),
-        ("L140", "A102", "Case Assessment: Develop case strategy"),
-        ("L150", "A102", "Case Assessment: Identify key legal issues"),
-        ("L160", "A103", "Fact Investigation: Interview witnesses"),
-        ("L190", "A104", "Pleadings: Draft complaint/petition"),
-        ("L200", "A104", "Pleadings: Prepare answer/response"),
-        ("L210", "A104", "Pleadings: File motion to dismiss"),
-        ("L220", "A105", "Discovery: Draft interrogatories"),
-        ("L230", "A105", "Discovery: Prepare requests for production"),
-        ("L240", "A105", "Discovery: Review opposing party's discovery responses"),
-        ("L250", "A106", "Depositions: Prepare for deposition"),
-        ("L260", "A106", "Depositions: Attend deposition"),
-        ("L300", "A107", "Motions: Argue motion in court"),
-        ("L310", "A108", "Settlement/Mediation: Prepare for mediation"),
-        ("L320", "A108", "Settlement/Mediation: Attend mediation"),
-        ("L330", "A108", "Settlement/Mediation: Draft settlement agreement"),
-        ("L340", "A109", "Trial Preparation: Prepare witness for trial"),
-        ("L350", "A109", "Trial Preparation: Organize trial exhibits"),
-        ("L390", "A110", "Trial: Present closing argument"),
-        ("L400", "A111", "Appeals: Research appellate issues"),
-        ("L410", "A111", "Appeals: Draft appellate brief"),
-        ("L420", "A111", "Appeals: Argue before appellate court"),
-        ("L430", "A112", "Client Communication: Client meeting"),
-        ("L440", "A112", "Client Communication: Phone call with client"),
-        ("L450", "A112", "Client Communication: Email correspondence with client"),
-    ],
-    'MAJOR_TASK_CODES': {"L110", "L120", "L130", "L140", "L150", "L160", "L170", "L180", "L190"},
-    'DEFAULT_CLIENT_ID': "02-4388252",
-    'DEFAULT_LAW_FIRM_ID': "02-1234567",
-    'DEFAULT_INVOICE_DESCRIPTION': "Monthly Legal Services",
-    'MANDATORY_ITEMS': {
-        'KBCG': {
-            'desc': ("Commenced data entry into the KBCG e-licensing portal for Piers Walter Vermont "
-                     "form 1005 application; Drafted deficiency notice to send to client re: same; "
-                     "Scheduled follow-up call with client to review application status and address outstanding deficiencies."),
-            'tk_name': "Tom Delaganis",
-            'task': "L140",
-            'activity': "A107",
-            'is_expense': False
-        },
-        'John Doe': {
-            'desc': ("Reviewed and summarized deposition transcript of John Doe; prepared exhibit index; "
-                     "updated case chronology spreadsheet for attorney review"),
-            'tk_name': "Ryan Kinsey",
-            'task': "L120",
-            'activity': "A102",
-            'is_expense': False
-        },
-        'Uber E110': {
-            'desc': "Uber ride to client's office",
-            'expense_code': "E110",
-            'is_expense': True,
-            'requires_details': True # Flag for special handling
-        },
-        'Partner: Paralegal Tasks': {
-            'desc': "Prepared trial binder including witness lists and exhibit summaries.",
-            'tk_name': "Ryan Kinsey",
-            'task': "L140",
-            'activity': "A103",
-            'is_expense': False
-        },
-        'Airfare E110': {
-            'desc': "Airfare",
-            'expense_code': "E110",
-            'is_expense': True,
-            'requires_details': True # Flag for special handling
-        },
-    }
-}
-EXPENSE_DESCRIPTIONS = list(CONFIG['EXPENSE_CODES'].keys())
-OTHER_EXPENSE_DESCRIPTIONS = [desc for desc in EXPENSE_DESCRIPTIONS if CONFIG['EXPENSE_CODES'][desc] != "E101"]
-
-# --- Helper Functions ---
-def _find_timekeeper_by_name(timekeepers: List[Dict], name: str) -> Optional[Dict]:
-    """Find a timekeeper by name (case-insensitive)."""
-    if not timekeepers:
-        return None
-    for tk in timekeepers:
-        if str(tk.get("TIMEKEEPER_NAME", "")).strip().lower() == str(name).strip().lower():
-            return tk
-    return None
-
-def _force_timekeeper_on_row(row: Dict, forced_name: str, timekeepers: List[Dict]) -> Optional[Dict]:
+@st.cache_resource
+def _configure_telemetry() -> Dict[str, Any]:
     """
-    Assign timekeeper details to a row if a match is found.
-    Returns the updated row on success, or None on failure.
+    Queued logging and optional metrics export, set up once per server process from the
+    [telemetry] section of secrets.toml: log_format ("text" or "json"), log_level,
+    metrics_port (serves /metrics on metrics_host, default 127.0.0.1) and metrics_file
+    (rewritten after each run).
     """
-    if row.get("EXPENSE_CODE"):
-        return row
+    settings: Dict[str, Any] = {}
+    if st.secrets.load_if_toml_exists():
+        settings = dict(st.secrets.get("telemetry", {}))
+    level = getattr(logging, str(settings.get("log_level", "ERROR")).upper(), logging.ERROR)
+    try:
+        configure_logging(level, settings.get("log_format", "text"))
+    except ValueError as e:
+        configure_logging(level)
+        logging.error(f"Telemetry: {e}; logging as text")
+    if settings.get("metrics_port"):
+        try:
+            serve_metrics(int(settings["metrics_port"]), settings.get("metrics_host", METRICS_DEFAULT_HOST))
+        except (OSError, ValueError) as e:
+            logging.error(f"Metrics endpoint not started: {e}")
+    return settings
 
-    row["TIMEKEEPER_NAME"] = forced_name
-    tk = _find_timekeeper_by_name(timekeepers, forced_name)
-    
-    # If a matching timekeeper was found, populate details and return the row.
-    if tk:
-        row["TIMEKEEPER_ID"] = tk.get("TIMEKEEPER_ID", "")
-        row["TIMEKEEPER_CLASSIFICATION"] = tk.get("TIMEKEEPER_CLASSIFICATION", "")
+_telemetry_settings = _configure_telemetry()
+
+def _write_metrics_file() -> None:
+    """Rewrite the configured metrics textfile, if any, after a run."""
+    if _telemetry_settings.get("metrics_file"):
         try:
-            row["RATE"] = float(tk.get("RATE", 0.0))
-            hours = float(row.get("HOURS", 0))
-            row["LINE_ITEM_TOTAL"] = round(hours * float(row["RATE"]), 2)
-        except Exception as e:
-            logging.error(f"Error setting timekeeper rate: {e}")
-        return row
-    
-    # If no match was found, return None to signal that this row should be skipped.
-    return None
-
-def _process_description(description: str, faker_instance: Faker) -> str:
-    """Process description by replacing placeholders and dates."""
-    pattern = r"\\b(\\d{2}/\\d{2}/\\d{4})\\b"
-    if re.search(pattern, description):
-        days_ago = random.randint(15, 90)
-        new_date = (datetime.date.today() - datetime.timedelta(days=days_ago)).strftime("%m/%d/%Y")
-        description = re.sub(pattern, new_date, description)
-    description = description.replace("{NAME_PLACEHOLDER}", faker_instance.name())
-    return description
-
-def _is_valid_client_id(client_id: str) -> bool:
-    """Validate Client ID format (XX-XXXXXXX)."""
-    pattern = r"^\\d{2}-\\d{7}$"
-    return bool(re.match(pattern, client_id))
-
-def _is_valid_law_firm_id(law_firm_id: str) -> bool:
-    """Validate Law Firm ID format (XX-XXXXXXX)."""
-    pattern = r"^\\d{2}-\\d{7}$"
-    return bool(re.match(pattern, law_firm_id))
-
-def _calculate_max_fees(timekeeper_data: Optional[List[Dict]], billing_start_date: datetime.date, billing_end_date: datetime.date, max_daily_hours: int) -> int:
-    """Calculate maximum feasible fee lines based on timekeeper data and billing period."""
-    if not timekeeper_data:
-        return 1
-    num_timekeepers = len(timekeeper_data)
-    delta = billing_end_date - billing_start_date
-    num_days = max(1, delta.days + 1)
-    max_lines = int((num_timekeepers * num_days * max_daily_hours) / 0.5)
-    return max(1, min(200, max_lines))
-
-def _load_timekeepers(uploaded_file: Optional[Any]) -> Optional[List[Dict]]:
-    """Load timekeepers from CSV file."""
+            METRICS.write_textfile(_telemetry_settings["metrics_file"])
+        except OSError as e:
+            logging.error(f"Could not write metrics file: {e}")
+
+@st.cache_resource(max_entries=4, show_spinner="Validating upload...")
+def _ingest_upload(kind: str, file_id: str, _uploaded_file: Any) -> Any:
+    """Parse + validate an upload once per file; reruns reuse the result instead of re-reading it."""
+    if kind == "timekeepers":
+        return ingest_timekeepers(_uploaded_file)
+    return ingest_task_activity(_uploaded_file)
+
+def _show_ingest_report(result: Any, label: str) -> None:
+    """Surface rejected rows (with line numbers) and dropped duplicates for an upload."""
+    if result.error_count or result.duplicates:
+        st.warning(f"{label}: {result.summary()}")
+    if result.error_count:
+        with st.expander(f"{label}: rejected rows", expanded=False):
+            st.markdown(format_errors(result))
+
+def _load_timekeepers(uploaded_file: Optional[Any]) -> Tuple[Optional[List[Dict]], str]:
+    """Load timekeepers from CSV file; returns (records, digest computed once at ingest)."""
     if uploaded_file is None:
-        return None
+        return None, ""
     try:
-        df = pd.read_csv(uploaded_file)
-        required_cols = ["TIMEKEEPER_NAME", "TIMEKEEPER_CLASSIFICATION", "TIMEKEEPER_ID", "RATE"]
-        if not all(col in df.columns for col in required_cols):
-            st.error(f"Timekeeper CSV must contain the following columns: {', '.join(required_cols)}")
-            return None
-        return df.to_dict(orient='records')
+        result = _ingest_upload("timekeepers", uploaded_file.file_id, uploaded_file)
+    except IngestError as e:
+        st.error(f"Timekeeper CSV: {e}")
+        return None, ""
     except Exception as e:
         st.error(f"Error loading timekeeper file: {e}")
         logging.error(f"Timekeeper load error: {e}")
-        return None
-
-def _load_custom_task_activity_data(uploaded_file: Optional[Any]) -> Optional[List[Tuple[str, str, str]]]:
-    """Load custom task/activity data from CSV."""
+        return None, ""
+    _show_ingest_report(result, "Timekeeper CSV")
+    if not result.records:
+        st.error("Timekeeper CSV contains no valid timekeepers.")
+        return None, ""
+    return result.records, result.digest
+
+def _load_custom_task_activity_data(uploaded_file: Optional[Any]) -> Tuple[Optional[List[Tuple[str, str, str]]], str]:
+    """Load custom task/activity data from CSV; returns (records, digest computed once at ingest)."""
     if uploaded_file is None:
-        return None
+        return None, ""
     try:
-        df = pd.read_csv(uploaded_file)
-        required_cols = ["TASK_CODE", "ACTIVITY_CODE", "DESCRIPTION"]
-        if not all(col in df.columns for col in required_cols):
-            st.error(f"Custom Task/Activity CSV must contain the following columns: {', '.join(required_cols)}")
-            return None
-        if df.empty:
-            st.warning("Custom Task/Activity CSV file is empty.")
-            return []
-        custom_tasks = []
-        for _, row in df.iterrows():
-            custom_tasks.append((str(row["TASK_CODE"]), str(row["ACTIVITY_CODE"]), str(row["DESCRIPTION"])))
-        return custom_tasks
+        result = _ingest_upload("tasks", uploaded_file.file_id, uploaded_file)
+    except IngestError as e:
+        st.error(f"Custom Task/Activity CSV: {e}")
+        return None, ""
     except Exception as e:
         st.error(f"Error loading custom tasks file: {e}")
         logging.error(f"Custom tasks load error: {e}")
-        return None
-
-def _create_ledes_line_1998b(row: Dict, line_no: int, inv_total: float, bill_start: datetime.date, bill_end: datetime.date, invoice_number: str, matter_number: str) -> List[str]:
-    """Create a single LEDES 1998B line."""
-    try:
-        date_obj = datetime.datetime.strptime(row["LINE_ITEM_DATE"], "%Y-%m-%d").date()
-        hours = float(row["HOURS"])
-        rate = float(row["RATE"])
-        line_total = float(row["LINE_ITEM_TOTAL"])
-        is_expense = bool(row["EXPENSE_CODE"])
-        adj_type = "E" if is_expense else "F"
-        task_code = "" if is_expense else row.get("TASK_CODE", "")
-        activity_code = "" if is_expense else row.get("ACTIVITY_CODE", "")
-        expense_code = row.get("EXPENSE_CODE", "") if is_expense else ""
-        timekeeper_id = "" if is_expense else row.get("TIMEKEEPER_ID", "")
-        timekeeper_class = "" if is_expense else row.get("TIMEKEEPER_CLASSIFICATION", "")
-        timekeeper_name = "" if is_expense else row.get("TIMEKEEPER_NAME", "")
-        description = str(row.get("DESCRIPTION", "")).replace("|", " - ")
-        return [
-            bill_end.strftime("%Y%m%d"),
-            invoice_number,
-            str(row.get("CLIENT_ID", "")),
-            matter_number,
-            f"{inv_total:.2f}",
-            bill_start.strftime("%Y%m%d"),
-            bill_end.strftime("%Y%m%d"),
-            str(row.get("INVOICE_DESCRIPTION", "")),
-            str(line_no),
-            adj_type,
-            f"{hours:.1f}" if adj_type == "F" else f"{int(hours)}",
-            "0.00",
-            f"{line_total:.2f}",
-            date_obj.strftime("%Y%m%d"),
-            task_code,
-            expense_code,
-            activity_code,
-            timekeeper_id,
-            description,
-            str(row.get("LAW_FIRM_ID", "")),
-            f"{rate:.2f}",
-            timekeeper_name,
-            timekeeper_class,
-            matter_number
-        ]
-    except Exception as e:
-        logging.error(f"Error creating LEDES line: {e}")
-        return []
-
-def _create_ledes_1998b_content(rows, inv_total, bill_start, bill_end,
-                                invoice_number, matter_number, is_first_invoice=True) -> str:
-    lines = []
-    if is_first_invoice:
-        header = "LEDES1998B[]"
-        fields = ("INVOICE_DATE|INVOICE_NUMBER|CLIENT_ID|LAW_FIRM_MATTER_ID|INVOICE_TOTAL|BILLING_START_DATE|"
-                  "BILLING_END_DATE|INVOICE_DESCRIPTION|LINE_ITEM_NUMBER|EXP/FEE/INV_ADJ_TYPE|"
-                  "LINE_ITEM_NUMBER_OF_UNITS|LINE_ITEM_ADJUSTMENT_AMOUNT|LINE_ITEM_TOTAL|LINE_ITEM_DATE|"
-                  "LINE_ITEM_TASK_CODE|LINE_ITEM_EXPENSE_CODE|LINE_ITEM_ACTIVITY_CODE|TIMEKEEPER_ID|"
-                  "LINE_ITEM_DESCRIPTION|LAW_FIRM_ID|LINE_ITEM_UNIT_COST|TIMEKEEPER_NAME|"
-                  "TIMEKEEPER_CLASSIFICATION|CLIENT_MATTER_ID[]")
-        lines = [header, fields]
-
-    for i, row in enumerate(rows, start=1):
-        line = _create_ledes_line_1998b(row, i, inv_total, bill_start, bill_end, invoice_number, matter_number)
-        if line:
-            lines.append("|".join(map(str, line)) + "[]")
-
-    # LEDES 1998B: CRLF line endings + trailing CRLF at EOF
-    return "\r\n".join(lines) + "\r\n"
-
-def _generate_fees(fee_count: int, timekeeper_data: List[Dict], billing_start_date: datetime.date, billing_end_date: datetime.date, task_activity_desc: List[Tuple[str, str, str]], major_task_codes: set, max_hours_per_tk_per_day: int, faker_instance: Faker, client_id: str, law_firm_id: str, invoice_desc: str) -> List[Dict]:
-    """Generate fee line items for an invoice."""
-    rows = []
-    delta = billing_end_date - billing_start_date
-    num_days = max(1, delta.days + 1)
-    major_items = [item for item in task_activity_desc if item[0] in major_task_codes]
-    other_items = [item for item in task_activity_desc if item[0] not in major_task_codes]
-    daily_hours_tracker = {}
-    MAX_DAILY_HOURS = max_hours_per_tk_per_day
-
-    for _ in range(fee_count):
-        if not task_activity_desc:
-            break
-        tk_row = random.choice(timekeeper_data)
-        timekeeper_id = tk_row["TIMEKEEPER_ID"]
-        if major_items and random.random() < 0.7:
-            task_code, activity_code, description = random.choice(major_items)
-        elif other_items:
-            task_code, activity_code, description = random.choice(other_items)
-        else:
-            continue
-        random_day_offset = random.randint(0, num_days - 1)
-        line_item_date = billing_start_date + datetime.timedelta(days=random_day_offset)
-        line_item_date_str = line_item_date.strftime("%Y-%m-%d")
-        current_billed_hours = daily_hours_tracker.get((line_item_date_str, timekeeper_id), 0)
-        remaining_hours_capacity = MAX_DAILY_HOURS - current_billed_hours
-        if remaining_hours_capacity <= 0:
-            continue
-        hours_to_bill = round(random.uniform(0.5, min(8.0, remaining_hours_capacity)), 1)
-        if hours_to_bill == 0:
-            continue
-        hourly_rate = tk_row["RATE"]
-        line_item_total = round(hours_to_bill * hourly_rate, 2)
-        daily_hours_tracker[(line_item_date_str, timekeeper_id)] = current_billed_hours + hours_to_bill
-        description = _process_description(description, faker_instance)
-        row = {
-            "INVOICE_DESCRIPTION": invoice_desc, "CLIENT_ID": client_id, "LAW_FIRM_ID": law_firm_id,
-            "LINE_ITEM_DATE": line_item_date_str, "TIMEKEEPER_NAME": tk_row["TIMEKEEPER_NAME"],
-            "TIMEKEEPER_CLASSIFICATION": tk_row["TIMEKEEPER_CLASSIFICATION"],
-            "TIMEKEEPER_ID": timekeeper_id, "TASK_CODE": task_code,
-            "ACTIVITY_CODE": activity_code, "EXPENSE_CODE": "", "DESCRIPTION": description,
-            "HOURS": hours_to_bill, "RATE": hourly_rate, "LINE_ITEM_TOTAL": line_item_total
-        }
-        rows.append(row)
-    return rows
-
-
-
-def _generate_expenses(expense_count: int, billing_start_date: datetime.date, billing_end_date: datetime.date, client_id: str, law_firm_id: str, invoice_desc: str) -> List[Dict]:
-    """Generate expense line items for an invoice with realistic amounts."""
-    rows: List[Dict] = []
-    delta = billing_end_date - billing_start_date
-    num_days = max(1, delta.days + 1)
-    # Read tunable expense settings from UI
-    try:
-        import streamlit as st
-    except Exception:
-        st = None
-    mileage_rate_cfg = float(st.session_state.get("mileage_rate_e109", 0.65)) if st else 0.65
-    travel_rng = st.session_state.get("travel_range_e110", (100.0, 800.0)) if st else (100.0, 800.0)
-    tel_rng = st.session_state.get("telephone_range_e105", (5.0, 15.0)) if st else (5.0, 15.0)
-    copying_rate = float(st.session_state.get("copying_rate_e101", 0.24)) if st else 0.24
-    try:
-        travel_min, travel_max = float(travel_rng[0]), float(travel_rng[1])
-    except Exception:
-        travel_min, travel_max = 100.0, 800.0
-    try:
-        tel_min, tel_max = float(tel_rng[0]), float(tel_rng[1])
-    except Exception:
-        tel_min, tel_max = 5.0, 15.0
-
-
-    # Always include some Copying (E101)
-    e101_actual_count = random.randint(1, min(3, expense_count))
-    for _ in range(e101_actual_count):
-        description = "Copying"
-        expense_code = "E101"
-        hours = random.randint(50, 300)  # number of pages
-        rate = round(copying_rate, 2)  # per-page
-        random_day_offset = random.randint(0, num_days - 1)
-        line_item_date = billing_start_date + datetime.timedelta(days=random_day_offset)
-        line_item_total = round(hours * rate, 2)
-        row = {
-            "INVOICE_DESCRIPTION": invoice_desc, "CLIENT_ID": client_id, "LAW_FIRM_ID": law_firm_id,
-            "LINE_ITEM_DATE": line_item_date.strftime("%Y-%m-%d"), "TIMEKEEPER_NAME": "",
-            "TIMEKEEPER_CLASSIFICATION": "", "TIMEKEEPER_ID": "",
-            "TASK_CODE": "", "ACTIVITY_CODE": "", "EXPENSE_CODE": expense_code, "DESCRIPTION": description,
-            "HOURS": hours, "RATE": rate, "LINE_ITEM_TOTAL": line_item_total
-        }
-        rows.append(row)
-
-    # Remaining expenses with category-aware amounts
-    for _ in range(max(0, expense_count - e101_actual_count)):
-        description = random.choice(OTHER_EXPENSE_DESCRIPTIONS)
-        expense_code = CONFIG['EXPENSE_CODES'][description]
-        random_day_offset = random.randint(0, num_days - 1)
-        line_item_date = billing_start_date + datetime.timedelta(days=random_day_offset)
-
-        if expense_code == "E109":  # Local travel (mileage)
-            miles = random.randint(5, 50)
-            hours = miles  # store miles in HOURS
-            rate = mileage_rate_cfg  # mileage rate from UI
-            line_item_total = round(miles * rate, 2)
-        elif expense_code == "E110":  # Out-of-town travel (ticket/transport)
-            hours = 1
-            rate = round(random.uniform(travel_min, travel_max), 2)
-            line_item_total = rate
-        elif expense_code == "E105":  # Telephone
-            hours = 1
-            rate = round(random.uniform(tel_min, tel_max), 2)
-            line_item_total = rate
-        elif expense_code == "E107":  # Delivery/messenger
-            hours = 1
-            rate = round(random.uniform(20.0, 100.0), 2)
-            line_item_total = rate
-        elif expense_code == "E108":  # Postage
-            hours = 1
-            rate = round(random.uniform(5.0, 50.0), 2)
-            line_item_total = rate
-        elif expense_code == "E111":  # Meals
-            hours = 1
-            rate = round(random.uniform(15.0, 150.0), 2)
-            line_item_total = rate
-        else:
-            hours = random.randint(1, 5)
-            rate = round(random.uniform(10.0, 150.0), 2)
-            line_item_total = round(hours * rate, 2)
-
-        row = {
-            "INVOICE_DESCRIPTION": invoice_desc, "CLIENT_ID": client_id, "LAW_FIRM_ID": law_firm_id,
-            "LINE_ITEM_DATE": line_item_date.strftime("%Y-%m-%d"), "TIMEKEEPER_NAME": "",
-            "TIMEKEEPER_CLASSIFICATION": "", "TIMEKEEPER_ID": "",
-            "TASK_CODE": "", "ACTIVITY_CODE": "", "EXPENSE_CODE": expense_code, "DESCRIPTION": description,
-            "HOURS": hours, "RATE": rate, "LINE_ITEM_TOTAL": line_item_total
-        }
-        rows.append(row)
-
-    return rows
-
-def _generate_invoice_data(fee_count: int, expense_count: int, timekeeper_data: List[Dict], client_id: str, law_firm_id: str, invoice_desc: str, billing_start_date: datetime.date, billing_end_date: datetime.date, task_activity_desc: List[Tuple[str, str, str]], major_task_codes: set, max_hours_per_tk_per_day: int, include_block_billed: bool, faker_instance: Faker) -> Tuple[List[Dict], float]:
-    """Generate invoice data with fees and expenses."""
-    rows = []
-    rows.extend(_generate_fees(fee_count, timekeeper_data, billing_start_date, billing_end_date, task_activity_desc, major_task_codes, max_hours_per_tk_per_day, faker_instance, client_id, law_firm_id, invoice_desc))
-    rows.extend(_generate_expenses(expense_count, billing_start_date, billing_end_date, client_id, law_firm_id, invoice_desc))
-    
-    # Filter for fees only before creating block billed items
-    fee_rows = [row for row in rows if not row.get("EXPENSE_CODE")]
-    
-    if include_block_billed and fee_rows:
-        # Group fee rows by timekeeper and date to find candidates for block billing
-        from collections import defaultdict
-        daily_tk_groups = defaultdict(list)
-        for row in fee_rows:
-            key = (row["TIMEKEEPER_ID"], row["LINE_ITEM_DATE"])
-            daily_tk_groups[key].append(row)
-            
-        # Find groups with multiple tasks that are within the max daily hours limit
-        eligible_groups = []
-        for key, group_rows in daily_tk_groups.items():
-            if len(group_rows) > 1:
-                total_hours = sum(float(r["HOURS"]) for r in group_rows)
-                if total_hours <= max_hours_per_tk_per_day:
-                    eligible_groups.append(group_rows)
-
-        # If we found an eligible group, randomly pick one to convert into a block
-        if eligible_groups:
-            selected_rows = random.choice(eligible_groups)
-            
-            # Sum the hours and totals from the selected group
-            total_hours = sum(float(row["HOURS"]) for row in selected_rows)
-            total_amount_block = sum(float(row["LINE_ITEM_TOTAL"]) for row in selected_rows)
-            descriptions = [row["DESCRIPTION"] for row in selected_rows]
-            block_description = "; ".join(descriptions)
-            
-            # Since all rows in the group are for the same TK and date, we can safely take details from the first row
-            first_row = selected_rows[0]
-            
-            block_row = {
-                "INVOICE_DESCRIPTION": invoice_desc, "CLIENT_ID": client_id, "LAW_FIRM_ID": law_firm_id,
-                "LINE_ITEM_DATE": first_row["LINE_ITEM_DATE"], "TIMEKEEPER_NAME": first_row["TIMEKEEPER_NAME"],
-                "TIMEKEEPER_CLASSIFICATION": first_row["TIMEKEEPER_CLASSIFICATION"],
-                "TIMEKEEPER_ID": first_row["TIMEKEEPER_ID"], "TASK_CODE": first_row["TASK_CODE"],
-                "ACTIVITY_CODE": first_row["ACTIVITY_CODE"], "EXPENSE_CODE": "",
-                "DESCRIPTION": block_description, "HOURS": round(total_hours, 2), "RATE": first_row["RATE"],
-                "LINE_ITEM_TOTAL": round(total_amount_block, 2)
-            }
-            
-            # Remove the original individual rows and add the new consolidated block_row
-            rows_to_remove_ids = {id(row) for row in selected_rows}
-            new_rows = [row for row in rows if id(row) not in rows_to_remove_ids]
-            new_rows.append(block_row)
-            rows = new_rows
-
-    # Final total calculation
-    total_amount = sum(float(row["LINE_ITEM_TOTAL"]) for row in rows)
-    return rows, total_amount
-
-def _ensure_mandatory_lines(rows: List[Dict], timekeeper_data: List[Dict], invoice_desc: str, client_id: str, law_firm_id: str, billing_start_date: datetime.date, billing_end_date: datetime.date, selected_items: List[str]) -> Tuple[List[Dict], List[str]]:
-    """Ensure mandatory line items are included and return a list of any skipped items."""
-    delta = billing_end_date - billing_start_date
-    num_days = max(1, delta.days + 1)
-    skipped_items = []
-
-    for item_name in selected_items:
-        random_day_offset = random.randint(0, num_days - 1)
-        line_item_date = billing_start_date + datetime.timedelta(days=random_day_offset)
-        item = CONFIG['MANDATORY_ITEMS'][item_name]
-
-        # Special handling for items requiring UI details
-        if item.get('requires_details'):
-            if item_name == 'Airfare E110':
-                airline = st.session_state.get('airfare_airline', 'N/A')
-                flight_num = st.session_state.get('airfare_flight_number', 'N/A')
-                dep_city = st.session_state.get('airfare_departure_city', 'N/A')
-                arr_city = st.session_state.get('airfare_arrival_city', 'N/A')
-                is_roundtrip = st.session_state.get('airfare_roundtrip', False)
-                amount = float(st.session_state.get('airfare_amount', 0.0))
-                fare_class = st.session_state.get('airfare_fare_class', 'Economy/Coach')
-                trip_type = " (Roundtrip)" if is_roundtrip else ""
-                description = f"Airfare ({fare_class}): {airline} {flight_num}, {dep_city} to {arr_city}{trip_type}"
-                
-                row = {
-                    "INVOICE_DESCRIPTION": invoice_desc, "CLIENT_ID": client_id, "LAW_FIRM_ID": law_firm_id,
-                    "LINE_ITEM_DATE": line_item_date.strftime("%Y-%m-%d"), "TIMEKEEPER_NAME": "",
-                    "TIMEKEEPER_CLASSIFICATION": "", "TIMEKEEPER_ID": "", "TASK_CODE": "",
-                    "ACTIVITY_CODE": "", "EXPENSE_CODE": "E110", "DESCRIPTION": description,
-                    "HOURS": 1, "RATE": amount, "LINE_ITEM_TOTAL": amount,
-                    "airfare_details": {
-                        "airline": airline, "flight_number": flight_num,
-                        "departure_city": dep_city, "arrival_city": arr_city,
-                        "is_roundtrip": is_roundtrip, "amount": amount,
-                        "fare_class": fare_class
-                    }
-                }
-                rows.append(row)
-            elif item_name == 'Uber E110':
-                amount = float(st.session_state.get('uber_amount', 0.0))
-                description = item['desc']
-                row = {
-                    "INVOICE_DESCRIPTION": invoice_desc, "CLIENT_ID": client_id, "LAW_FIRM_ID": law_firm_id,
-                    "LINE_ITEM_DATE": line_item_date.strftime("%Y-%m-%d"), "TIMEKEEPER_NAME": "",
-                    "TIMEKEEPER_CLASSIFICATION": "", "TIMEKEEPER_ID": "", "TASK_CODE": "",
-                    "ACTIVITY_CODE": "", "EXPENSE_CODE": "E110", "DESCRIPTION": description,
-                    "HOURS": 1, "RATE": amount, "LINE_ITEM_TOTAL": amount
-                }
-                rows.append(row)
-        # Original logic for other items
-        elif item['is_expense']:
-            row = {
-                "INVOICE_DESCRIPTION": invoice_desc, "CLIENT_ID": client_id, "LAW_FIRM_ID": law_firm_id,
-                "LINE_ITEM_DATE": line_item_date.strftime("%Y-%m-%d"), "TIMEKEEPER_NAME": "",
-                "TIMEKEEPER_CLASSIFICATION": "", "TIMEKEEPER_ID": "", "TASK_CODE": "",
-                "ACTIVITY_CODE": "", "EXPENSE_CODE": item['expense_code'], "DESCRIPTION": item['desc'],
-                "HOURS": random.randint(1, 10), "RATE": round(random.uniform(5.0, 100.0), 2)
-            }
-            row["LINE_ITEM_TOTAL"] = round(row["HOURS"] * row["RATE"], 2)
-            rows.append(row)
-        else: # Fee items
-            row_template = {
-                "INVOICE_DESCRIPTION": invoice_desc, "CLIENT_ID": client_id, "LAW_FIRM_ID": law_firm_id,
-                "LINE_ITEM_DATE": line_item_date.strftime("%Y-%m-%d"), "TIMEKEEPER_NAME": item['tk_name'],
-                "TIMEKEEPER_CLASSIFICATION": "", "TIMEKEEPER_ID": "", "TASK_CODE": item['task'],
-                "ACTIVITY_CODE": item['activity'], "EXPENSE_CODE": "", "DESCRIPTION": item['desc'],
-                "HOURS": round(random.uniform(0.5, 8.0), 1), "RATE": 0.0
-            }
-            # Attempt to process the row
-            processed_row = _force_timekeeper_on_row(row_template, item['tk_name'], timekeeper_data)
-            
-            # Only add the row if the timekeeper was found
-            if processed_row:
-                rows.append(processed_row)
-            else:
-                skipped_items.append(item_name) # Otherwise, log it as skipped
-            
-    return rows, skipped_items
-
-def _validate_image_bytes(image_bytes: bytes) -> bool:
-    """Validate that the provided bytes represent a valid image."""
-    try:
-        img = PILImage.open(io.BytesIO(image_bytes))
-        img.verify()
-        return True
-    except Exception:
-        return False
+        return None, ""
+    _show_ingest_report(result, "Custom Task/Activity CSV")
+    if not result.records:
+        st.warning("Custom Task/Activity CSV has no valid rows.")
+    return result.records, result.digest
+
+@st.cache_resource
+def _default_task_catalog_digest() -> str:
+    """Digest of the built-in task catalog, hashed once per server process."""
+    return config_hash(CONFIG['DEFAULT_TASK_ACTIVITY_DESC'])
+
+def _show_artifact_sizes(files: List[Tuple[str, ArtifactData]]) -> None:
+    """Run report: the size of every generated artifact (entries inside receipts.zip are listed as receipts.zip/...)."""
+    if not files:
+        return
+    sizes = pd.DataFrame({
+        "File": [name for name, _ in files],
+        "Type": [os.path.splitext(name)[1].lstrip(".").upper() or "-" for name, _ in files],
+        "Size (KB)": [round(len(data) / 1024, 1) for _, data in files],
+    })
+    top_level = sum(len(data) for name, data in files if not name.startswith("receipts.zip/"))
+    # Rendered inside the generation status container, which can't hold an expander
+    st.markdown(f"**Artifact sizes:** {len(files)} file(s), {top_level / 1024:,.1f} KB to deliver")
+    by_type = sizes.groupby("Type")["Size (KB)"].agg(["count", "sum", "mean"]).round(1)
+    st.dataframe(by_type.rename(columns={"count": "Files", "sum": "Total (KB)", "mean": "Average (KB)"}), use_container_width=True)
+    st.dataframe(sizes, hide_index=True, use_container_width=True, height=min(400, 38 + 35 * len(files)))
+
+def _show_violations(violations: List[Any]) -> None:
+    """Run validation report: one row per rule and invoice (also inside the status container, so no expander)."""
+    errors = sum(v.severity == "error" for v in violations)
+    st.markdown(f"**Validation:** {errors} error(s), {len(violations) - errors} warning(s)")
+    st.dataframe(pd.DataFrame(violations_report(violations)), hide_index=True, use_container_width=True)
+    st.download_button("Download Validation Report", violations_to_csv(violations).encode("utf-8"), "validation_report.csv", "text/csv", key="download_validation_report")
 
 def _get_logo_bytes(uploaded_logo: Optional[Any], law_firm_id: str, use_custom: bool) -> bytes:
     """Get logo bytes from uploaded file or default path."""
@@ -689,6 +249,8 @@ def _get_logo_bytes(uploaded_logo: Optional[Any], law_firm_id: str, use_custom:
         logging.error(f"Logo load failed: {e}")
         st.warning(f"Logo file ({logo_file_name}) not found or invalid. Using placeholder.")
     
+    from PIL import Image as PILImage, ImageDraw, ImageFont
+
     img = PILImage.new("RGB", (128, 128), color="white")
     draw = ImageDraw.Draw(img)
     try:
@@ -702,425 +264,103 @@ def _get_logo_bytes(uploaded_logo: Optional[Any], law_firm_id: str, use_custom:
     return buf.getvalue()
 
 
-def _create_pdf_invoice(
-    df: pd.DataFrame,
-    total_amount: float,
-    invoice_number: str,
-    invoice_date: datetime.date,
-    billing_start_date: datetime.date,
-    billing_end_date: datetime.date,
-    client_id: str,
-    law_firm_id: str,
-    logo_bytes: bytes | None = None,
-    include_logo: bool = False,
-    client_name: str = "",
-    law_firm_name: str = ""
-) -> io.BytesIO:
-    """Generate a PDF invoice matching the provided format."""
-    buffer = io.BytesIO()
-    doc = SimpleDocTemplate(buffer, pagesize=letter)
-    elements = []
-    styles = getSampleStyleSheet()
-
-    # Styles
-    header_info_style = ParagraphStyle('HeaderInfo', parent=styles['Normal'], fontName='Helvetica-Bold', fontSize=12, leading=14, alignment=TA_LEFT)
-    client_info_style = ParagraphStyle('ClientInfo', parent=header_info_style, alignment=TA_RIGHT)
-    table_header_style = ParagraphStyle('TableHeader', parent=styles['Normal'], fontName='Helvetica-Bold', fontSize=10, leading=12, alignment=TA_CENTER, wordWrap='CJK')
-    table_data_style = ParagraphStyle('TableData', parent=styles['Normal'], fontName='Helvetica', fontSize=10, leading=12, alignment=TA_LEFT, wordWrap='CJK')
-    right_align_style = styles['Heading4']
-
-    # Header info
-    lf_name = law_firm_name or "Law Firm"
-    cl_name = client_name or "Client"
-    law_firm_info = f"{lf_name}<br/>{law_firm_id}<br/>One Park Avenue<br/>Manhattan, NY 10003"
-    client_info   = f"{cl_name}<br/>{client_id}<br/>1360 Post Oak Blvd<br/>Houston, TX 77056"
-    law_firm_para = Paragraph(law_firm_info, header_info_style)
-    client_para = Paragraph(client_info, client_info_style)
-
-    header_left_content = law_firm_para
-    if include_logo and logo_bytes:
-        try:
-            if not _validate_image_bytes(logo_bytes):
-                raise ValueError("Invalid logo bytes")
-            img = Image(io.BytesIO(logo_bytes), width=0.6 * inch, height=0.6 * inch, kind='direct', hAlign='LEFT')
-            img._restrictSize(0.6 * inch, 0.6 * inch)
-            img.alt = "Law Firm Logo"
-            inner_table_data = [[img, Paragraph(law_firm_info, header_info_style)]]
-            inner_table = Table(inner_table_data, colWidths=[0.7 * inch, None])
-            inner_table.setStyle(TableStyle([('VALIGN', (0, 0), (-1, -1), 'TOP'), ('LEFTPADDING', (1, 0), (1, 0), 6)]))
-            header_left_content = inner_table
-        except Exception as e:
-            logging.error(f"Error adding logo to PDF: {e}")
-            header_left_content = law_firm_para
-
-    header_data = [[header_left_content, client_para]]
-    header_table = Table(header_data, colWidths=[3.5 * inch, 4.0 * inch])
-    header_table.setStyle(TableStyle([
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (0, 0), 0),
-        ('RIGHTPADDING', (0, 0), (0, 0), 0),
-        ('TOPPADDING', (0, 0), (-1, -1), 0),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
-    ]))
-    elements.append(header_table)
-    elements.append(Spacer(1, 0.1 * inch))
-
-    # Invoice meta
-    invoice_info = f"Invoice #: {invoice_number}<br/>Invoice Date: {invoice_date.strftime('%Y-%m-%d')}<br/>Billing Period: {billing_start_date.strftime('%Y-%m-%d')} to {billing_end_date.strftime('%Y-%m-%d')}"
-    invoice_para = Paragraph(invoice_info, right_align_style)
-    invoice_table = Table([[invoice_para]], colWidths=[7.5 * inch])
-    invoice_table.setStyle(TableStyle([('ALIGN', (0, 0), (-1, -1), 'RIGHT'), ('VALIGN', (0, 0), (-1, -1), 'TOP')]))
-    elements.append(invoice_table)
-    elements.append(Spacer(1, 0.1 * inch))
-
-    # Table headers
-    data = [[
-        Paragraph("Date", table_header_style),
-        Paragraph("Task<br/>Code", table_header_style),
-        Paragraph("Activity<br/>Code", table_header_style),
-        Paragraph("Timekeeper", table_header_style),
-        Paragraph("Description", table_header_style),
-        Paragraph("Hours", table_header_style),
-        Paragraph("Rate", table_header_style),
-        Paragraph("Total", table_header_style),
-    ]]
-
-    # Rows
-    for _, row in df.iterrows():
-        date = row["LINE_ITEM_DATE"]
-        timekeeper = Paragraph(row["TIMEKEEPER_NAME"] if row["TIMEKEEPER_NAME"] else "N/A", table_data_style)
-        task_code = row.get("TASK_CODE", "") if not row["EXPENSE_CODE"] else ""
-        activity_code = row.get("ACTIVITY_CODE", "") if not row["EXPENSE_CODE"] else ""
-        description = Paragraph(row["DESCRIPTION"], table_data_style)
-        hours = f"{row['HOURS']:.1f}" if not row["EXPENSE_CODE"] else f"{int(row['HOURS'])}"
-        rate = f"${row['RATE']:.2f}" if row["RATE"] else "N/A"
-        total = f"${row['LINE_ITEM_TOTAL']:.2f}"
-        data.append([date, task_code, activity_code, timekeeper, description, hours, rate, total])
-
-    table = Table(data, colWidths=[0.8 * inch, 0.7 * inch, 0.7 * inch, 1.3 * inch, 1.8 * inch, 0.8 * inch, 0.8 * inch, 0.8 * inch])
-    table.setStyle(TableStyle([
-        ('BACKGROUND', (0, 0), (-1, 0), colors.grey),
-        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
-        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
-        ('FONTSIZE', (0, 0), (-1, 0), 10),
-        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
-        ('BACKGROUND', (0, 1), (-1, -1), colors.beige),
-        ('GRID', (0, 0), (-1, -1), 1, colors.black),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('ALIGN', (0, 0), (0, -1), 'CENTER'),
-        ('ALIGN', (1, 1), (2, -1), 'CENTER'),
-        ('ALIGN', (5, 0), (5, -1), 'CENTER'),
-        ('ALIGN', (6, 0), (6, -1), 'RIGHT'),
-        ('ALIGN', (7, 0), (7, -1), 'RIGHT'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 2),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 2),
-        ('TOPPADDING', (0, 0), (-1, -1), 2),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-    ]))
-    elements.append(table)
-
-    # Totals block (right-aligned)
-    if 'EXPENSE_CODE' in df.columns:
-        # Create a boolean mask for fees. Fees are where EXPENSE_CODE is empty or NaN.
-        is_fee = df['EXPENSE_CODE'].fillna('').eq('')
-        fees_total = df.loc[is_fee, 'LINE_ITEM_TOTAL'].sum()
-        expenses_total = df.loc[~is_fee, 'LINE_ITEM_TOTAL'].sum()
-    else:
-        # If no 'EXPENSE_CODE' column, all are fees
-        fees_total = df['LINE_ITEM_TOTAL'].sum()
-        expenses_total = 0.0
-
-
-    elements.append(Spacer(1, 0.2 * inch))
-
-    totals_style_label = ParagraphStyle('TotalsLabel', parent=styles['Normal'], fontName='Helvetica-Bold', fontSize=11, alignment=TA_RIGHT)
-    totals_style_amt   = ParagraphStyle('TotalsAmt',   parent=styles['Normal'], fontName='Helvetica-Bold', fontSize=11, alignment=TA_RIGHT)
-
-    totals_data = [
-        [Paragraph("Total Fees:", totals_style_label), Paragraph(f"${fees_total:,.2f}", totals_style_amt)],
-        [Paragraph("Total Expenses:", totals_style_label), Paragraph(f"${expenses_total:,.2f}", totals_style_amt)],
-        [Paragraph("Invoice Total:", totals_style_label), Paragraph(f"${total_amount:,.2f}", totals_style_amt)],
-    ]
-    totals_table = Table(totals_data, colWidths=[1.6 * inch, 1.2 * inch], hAlign='RIGHT')
-    totals_table.setStyle(TableStyle([
-        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
-        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
-        ('LEFTPADDING', (0, 0), (-1, -1), 4),
-        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
-        ('TOPPADDING', (0, 0), (-1, -1), 2),
-        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
-    ]))
-    elements.append(totals_table)
-
-    doc.build(elements)
-    buffer.seek(0)
-    return buffer
-
-
-def _create_receipt_image(expense_row: dict, faker_instance: Faker) -> Tuple[str, io.BytesIO]:
-    """Enhanced realistic receipt generator (see chat notes for details)."""
-    width, height = 600, 950
-    bg = (252, 252, 252)
-    fg = (20, 20, 20)
-    faint = (90, 90, 90)
-    line_y_gap = 28
-
-    # Default receipt style values
-    rcpt_scale = 1.0
-    rcpt_line_weight = 1
-    rcpt_dashed = False
-
-    TAX_MAP = {
-        "E111": 0.085,
-        "E110": 0.000,
-        "E109": 0.000,
-        "E108": 0.000,
-        "E115": 0.085,
-        "E116": 0.085,
-        "E117": 0.085,
+@st.cache_resource(max_entries=8)
+def _get_timekeeper_registry(records_hash: str, _records: List[Dict]) -> TimekeeperRegistry:
+    """Build the indexed timekeeper registry once per distinct upload."""
+    return TimekeeperRegistry.from_records(_records)
+
+@st.cache_resource
+def _get_artifact_cache() -> ArtifactCache:
+    """Process-wide artifact cache shared across reruns and sessions."""
+    return ArtifactCache()
+
+@st.cache_resource
+def _get_run_catalog() -> Optional[RunCatalog]:
+    """Process-wide run history catalog (None if the SQLite file can't be opened)."""
+    return open_catalog()
+
+def _catalog_call(method: str, *args, **kwargs) -> Any:
+    """Call a run catalog method; catalog failures are logged and never stop generation."""
+    return catalog_call(_get_run_catalog(), method, *args, **kwargs)
+
+def _cached_artifact(cache: ArtifactCache, key: str, factory, reuse: bool, stats: Dict[str, int]) -> bytes:
+    """Return the artifact for key, rebuilding it only on a miss (or when reuse is off)."""
+    if reuse:
+        data = cache.get(key)
+        if data is not None:
+            stats["hits"] += 1
+            return data
+    data = factory()
+    cache.put(key, data)
+    stats["misses"] += 1
+    return data
+
+@st.cache_resource(max_entries=4)
+def _preview_payload(rows_key: str) -> Dict[str, Any]:
+    """
+    One generated invoice's rows + summary, decoded from the artifact cache once and shared by the browser.
+    Raises KeyError on a miss (exceptions aren't cached, so a regenerated artifact is picked up next time).
+    """
+    data = _get_artifact_cache().get(rows_key)
+    if data is None:
+        raise KeyError(rows_key)
+    payload = json.loads(data)
+    payload.setdefault("summary", summarize_invoice(payload["rows"]))
+    return payload
+
+@st.cache_resource(max_entries=32)
+def _preview_view(rows_key: str, timekeeper: Optional[str], task_code: Optional[str], expense_code: Optional[str]) -> RowView:
+    """Filtered row positions + totals, computed once per filter combination (unfiltered totals come from the summary)."""
+    payload = _preview_payload(rows_key)
+    if timekeeper is None and task_code is None and expense_code is None:
+        return RowView(list(range(len(payload["rows"]))), summary_totals(payload["summary"]))
+    return filter_rows(payload["rows"], timekeeper, task_code, expense_code)
+
+@st.cache_data
+def _sample_csvs() -> Dict[str, bytes]:
+    """Sample CSV downloads, built once per process rather than on every rerun."""
+    sample_timekeeper = pd.DataFrame({
+        "TIMEKEEPER_NAME": ["Tom Delaganis", "Ryan Kinsey"],
+        "TIMEKEEPER_CLASSIFICATION": ["Partner", "Associate"],
+        "TIMEKEEPER_ID": ["TD001", "RK001"],
+        "RATE": [250.0, 200.0]
+    })
+    sample_custom = pd.DataFrame({
+        "TASK_CODE": ["L100"],
+        "ACTIVITY_CODE": ["A101"],
+        "DESCRIPTION": ["Legal Research: Analyze legal precedents"]
+    })
+    sample_manifest = pd.DataFrame({
+        "matter_number": ["2025-000101", "2025-000202"],
+        "profile": ["Onit ELM", "SimpleLegal"],
+        "billing_start_date": ["2025-05-01", "2025-05-01"],
+        "billing_end_date": ["2025-05-31", "2025-05-31"],
+        "invoices": [2, 1],
+        "fees": [25, 40],
+        "expenses": [5, 10],
+        "include_pdf": [True, False],
+    })
+    return {
+        "timekeeper": sample_timekeeper.to_csv(index=False).encode('utf-8'),
+        "custom_tasks": sample_custom.to_csv(index=False).encode('utf-8'),
+        "manifest": sample_manifest.to_csv(index=False).encode('utf-8'),
     }
 
-    def money(x):
-        return f"${x:,.2f}"
-
-    def mask_card():
-        brands = ["VISA", "MC", "AMEX", "DISC"]
-        brand = random.choice(brands)
-        if brand == "AMEX":
-            masked = f"{brand} ****-******-*{random.randint(1000,9999)}"
-        else:
-            masked = f"{brand} ****-****-****-{random.randint(1000,9999)}"
-        return masked
-
-    def auth_code():
-        return f"APPROVED  AUTH {random.randint(100000, 999999)}  REF {random.randint(1000,9999)}"
-
-    def pick_items(expense_code: str, desc: str, total: float):
-        items = []
-        if expense_code == "E111":
-            qtys = [1, 2]
-            entree_qty = random.choice(qtys)
-            entree_unit = round(total * 0.45 / max(entree_qty,1), 2)
-            drink_unit = round(total * 0.15, 2)
-            items = [
-                ("Entree", entree_qty, entree_unit, round(entree_qty*entree_unit,2)),
-                ("Beverage", 1, drink_unit, drink_unit),
-            ]
-        elif expense_code == "E110": # This is now for generic travel like rideshare
-            miles = random.randint(3, 20)
-            base = round(max(2.5, total * 0.15), 2)
-            per_mile = round(max(0.9, (total - base) / max(miles,1)), 2)
-            items = [
-                ("Base Fare", 1, base, base),
-                (f"Distance {miles} mi", 1, per_mile*miles, round(per_mile*miles,2)),
-            ]
-        elif expense_code == "E108":
-            weight = random.uniform(0.5, 4.0)
-            unit = round(total, 2)
-            items = [(f"USPS Priority Mail {weight:.1f} lb", 1, unit, unit)]
-        elif expense_code in ("E115","E116"):
-            pages = random.randint(50, 300)
-            unit = round(max(2.0, min(6.0, total/pages)), 2)
-            items = [(f"Transcript ({pages} pages)", pages, unit, round(pages*unit,2))]
-        else:
-            n = random.choice([2,3])
-            remaining = total
-            for i in range(n-1):
-                part = round(total * random.uniform(0.2, 0.5), 2)
-                remaining = round(remaining - part, 2)
-                items.append((f"{desc[:20]} {i+1}", 1, part, part))
-            items.append((f"{desc[:20]} {n}", 1, remaining, remaining))
-        return items
-
-    m_addr = faker_instance.address().replace("\\n", ", ")
-    m_phone = faker_instance.phone_number()
-    
-    try:
-        line_item_date = datetime.datetime.strptime(expense_row["LINE_ITEM_DATE"], "%Y-%m-%d").date()
-    except Exception:
-        line_item_date = datetime.datetime.today().date()
-    exp_code = str(expense_row.get("EXPENSE_CODE", "")).strip()
-    desc = str(expense_row.get("DESCRIPTION","")).strip() or "Item"
-    total_amount = float(expense_row.get("LINE_ITEM_TOTAL", 0.0))
-
-    # Check for specific airfare details to build the receipt content
-    airfare_details = expense_row.get("airfare_details")
-    if isinstance(airfare_details, dict):
-        merchant = airfare_details.get("airline", faker_instance.company())
-        # Create realistic line items for airfare
-        base_fare = round(total_amount * 0.75, 2)
-        taxes_fees = round(total_amount - base_fare, 2)
-        trip_type = "Roundtrip" if airfare_details.get("is_roundtrip") else "One-way"
-        fare_class = airfare_details.get("fare_class", "Coach")
-        flight_desc = f"Flight {airfare_details.get('flight_number', '')}"
-        route_desc = f"{airfare_details.get('departure_city', '')} -> {airfare_details.get('arrival_city', '')}"
-        items = [
-            (f"{trip_type} Airfare: {flight_desc}", 1, base_fare, base_fare),
-            (f"Class: {fare_class}", 0, 0, 0),
-            (f"Route: {route_desc}", 0, 0, 0),
-            ("Taxes and Carrier Fees", 1, taxes_fees, taxes_fees)
-        ]
-        tax = 0.0
-        tip = 0.0
+@st.cache_resource
+def _startup_metrics() -> Dict[str, Any]:
+    """Process-wide script timing: the first run is the cold start, later ones are reruns."""
+    return {"cold_start_s": None, "reruns": collections.deque(maxlen=50)}
+
+def _record_script_run(started: float) -> None:
+    """Record how long this script run took (called at the end of the script)."""
+    metrics = _startup_metrics()
+    elapsed = time.perf_counter() - started
+    if metrics["cold_start_s"] is None:
+        metrics["cold_start_s"] = elapsed
+        logging.info(f"Cold start script run: {elapsed * 1000:.0f} ms")
     else:
-        # Original logic if no specific airfare details are passed
-        merchant = faker_instance.company()
-        items = pick_items(exp_code, desc, total_amount)
-        tax_rate = TAX_MAP.get(exp_code, 0.085 if sum(i[3] for i in items) > 0 else 0.0)
-        tax = round(sum(i[3] for i in items) * tax_rate, 2)
-
-        tip = 0.0
-        if exp_code in ("E111", "E110"):
-            subtotal_for_tip = sum(i[3] for i in items)
-            target_total = total_amount
-            tip_guess = 0.15 if exp_code == "E111" else 0.10
-            tip = round(subtotal_for_tip * tip_guess, 2)
-            over = round((subtotal_for_tip + tax + tip) - target_total, 2)
-            if over > 0:
-                tip = max(0.0, round(tip - over, 2))
-            else:
-                tip = round(tip + abs(over), 2)
-    
-    subtotal = round(sum(x[3] for x in items), 2)
-    grand = round(subtotal + tax + tip, 2)
-    drift = round(total_amount - grand, 2)
-    if abs(drift) >= 0.01 and items:
-        name, qty, unit, line_total = items[-1]
-        line_total = round(line_total + drift, 2)
-        unit = round(line_total / max(qty, 1) if qty > 0 else line_total, 2)
-        items[-1] = (name, qty, unit, line_total)
-        subtotal = round(sum(x[3] for x in items), 2)
-        grand = round(subtotal + tax + tip, 2)
-
-    img = PILImage.new("RGB", (width, height), bg)
-    draw = ImageDraw.Draw(img)
-
-    try:
-        title_font = ImageFont.truetype("arial.ttf", max(12, int(34*rcpt_scale)))
-        header_font = ImageFont.truetype("arial.ttf", max(10, int(22*rcpt_scale)))
-        mono_font = ImageFont.truetype("arial.ttf", max(10, int(22*rcpt_scale)))
-        small_font = ImageFont.truetype("arial.ttf", max(8, int(18*rcpt_scale)))
-        tiny_font = ImageFont.truetype("arial.ttf", max(8, int(15*rcpt_scale)))
-    except Exception:
-        title_font = ImageFont.load_default()
-        header_font = ImageFont.load_default()
-        mono_font = ImageFont.load_default()
-        small_font = ImageFont.load_default()
-        tiny_font = ImageFont.load_default()
-
-    def draw_hr(y, pad_left=40, pad_right=40, weight=1, dashed=False):
-        if dashed:
-            x = pad_left
-            dash = 8
-            gap = 6
-            while x < width - pad_right:
-                x2 = min(x + dash, width - pad_right)
-                draw.line([(x, y), (x2, y)], fill=faint, width=weight)
-                x = x2 + gap
-        else:
-            draw.line([(pad_left, y), (width - pad_right, y)], fill=faint, width=weight)
-
-    y = 30
-    title = "RECEIPT"
-    tw = draw.textlength(title, font=title_font)
-    draw.text(((width - tw) / 2, y), title, font=title_font, fill=fg)
-    y += 42
-
-    for line in (merchant, m_addr, f"Tel: {m_phone}"):
-        draw.text((40, y), line, font=header_font, fill=fg)
-        y += 26
-    y += 6
-    draw_hr(y, weight=rcpt_line_weight, dashed=rcpt_dashed); y += 14
-
-    rnum = f"{random.randint(100000, 999999)}-{random.randint(10,99)}"
-    draw.text((40, y), f"Date: {line_item_date.strftime('%a %b %d, %Y')}", font=mono_font, fill=fg)
-    draw.text((width-300, y), f"Receipt #: {rnum}", font=mono_font, fill=fg)
-    y += 30
-    # Cashier line removed
-    draw_hr(y, weight=rcpt_line_weight, dashed=rcpt_dashed); y += 16
-
-    draw.text((40, y), "Item", font=small_font, fill=(90,90,90))
-    draw.text((width-255, y), "Qty", font=small_font, fill=(90,90,90))
-    draw.text((width-180, y), "Price", font=small_font, fill=(90,90,90))
-    draw.text((width-95, y), "Total", font=small_font, fill=(90,90,90))
-    y += 22
-
-    import textwrap as _tw
-    for name, qty, unit, line_total in items:
-        lines = _tw.wrap(name, width=32) or ["Item"]
-        first = True
-        for wrap_line in lines:
-            draw.text((40, y), wrap_line, font=mono_font, fill=fg)
-            if first:
-                if qty > 0: # Only show qty/price if relevant
-                    draw.text((width-245, y), str(qty), font=mono_font, fill=fg)
-                    draw.text((width-180, y), money(unit), font=mono_font, fill=fg)
-                draw.text((width-95, y), money(line_total), font=mono_font, fill=fg)
-                first = False
-            y += line_y_gap-8
-        y += 2
-    draw_hr(y, weight=rcpt_line_weight, dashed=rcpt_dashed); y += 14
-
-    def right_label(label, val):
-        nonlocal y
-        draw.text((width-220, y), label, font=mono_font, fill=fg)
-        draw.text((width-95, y), money(val), font=mono_font, fill=fg)
-        y += 24
-
-    right_label("Subtotal", subtotal)
-    if tax > 0:
-        right_label(f"Tax ({int(tax_rate*100)}%)", tax)
-    if tip > 0:
-        right_label("Tip", tip)
-    draw.text((width-220, y), "TOTAL", font=header_font, fill=fg)
-    draw.text((width-95, y), money(round(subtotal + tax + tip, 2)), font=header_font, fill=fg)
-    y += 30
-    draw_hr(y, weight=rcpt_line_weight, dashed=rcpt_dashed); y += 14
-
-    pm = mask_card()
-    draw.text((40, y), pm, font=mono_font, fill=fg)
-    y += 26
-    draw.text((40, y), auth_code(), font=mono_font, fill=(90,90,90))
-    y += 10
-    draw_hr(y, weight=rcpt_line_weight, dashed=rcpt_dashed); y += 14
-    
-    # Policy text removed
-
-    y = height - 80
-    x = 40
-    random.seed(rnum)
-    for _ in range(60):
-        bar_h = random.randint(20, 50)
-        bar_w = random.choice([1,1,2])
-        draw.rectangle([x, y, x+bar_w, y+bar_h], fill=(90,90,90))
-        x += bar_w + 3
-        if x > width - 40:
-            break
-
-    # --- Ensure final receipt is a readable physical size ---
-    target_w_in, target_h_in = RECEIPT_SIZE_IN
-    if img.width > img.height:  # landscape
-        target_w_px = int(max(target_w_in, target_h_in) * RECEIPT_DPI)
-        target_h_px = int(min(target_w_in, target_h_in) * RECEIPT_DPI)
-    else:  # portrait
-        target_w_px = int(min(target_w_in, target_h_in) * RECEIPT_DPI)
-        target_h_px = int(max(target_w_in, target_h_in) * RECEIPT_DPI)
-    if img.mode != "RGB":
-        img = img.convert("RGB")
-    if (img.width, img.height) != (target_w_px, target_h_px):
-        try:
-            from PIL import Image as _PILImageMod
-            img = img.resize((target_w_px, target_h_px), resample=_PILImageMod.LANCZOS)
-        except Exception:
-            img = img.resize((target_w_px, target_h_px))
-    # ---------------------------------------------------------
-
-    pdf_buffer = io.BytesIO()
-    img.save(pdf_buffer, format="PDF", resolution=RECEIPT_DPI)
-    pdf_buffer.seek(0)
-    
-    filename = f"Receipt_{exp_code}_{line_item_date.strftime('%Y%m%d')}.pdf"
-    return filename, pdf_buffer
+        metrics["reruns"].append(elapsed)
+        logging.info(f"Rerun: {elapsed * 1000:.0f} ms")
 
 def _customize_email_body(matter_number: str, invoice_number: str) -> Tuple[str, str]:
     """Customize email subject and body with matter and invoice number."""
@@ -1130,8 +370,9 @@ def _customize_email_body(matter_number: str, invoice_number: str) -> Tuple[str,
     body = body.format(matter_number=matter_number, invoice_number=invoice_number)
     return subject, body
 
-def _send_email_with_attachment(recipient_email: str, subject: str, body: str, attachments: List[Tuple[str, bytes]]) -> bool:
-    """Send email with attachments."""
+def _send_email_with_attachment(recipient_email: str, subject: str, body: str, attachments: List[Tuple[str, ArtifactData]],
+                                run_id: Optional[str] = None) -> bool:
+    """Send email with attachments, streamed; split into several emails or sent as links (under a per-run folder) when too large."""
     try:
         sender_email = st.secrets.email.email_from
         password = st.secrets.email.email_password
@@ -1139,24 +380,29 @@ def _send_email_with_attachment(recipient_email: str, subject: str, body: str, a
         st.error("Email credentials not configured in secrets.toml")
         return False
     
-    msg = MIMEMultipart()
-    msg['From'] = sender_email
-    msg['To'] = recipient_email
-    msg['Subject'] = subject
-
-    msg.attach(MIMEText(body, 'plain'))
-    for filename, data in attachments:
-        part = MIMEApplication(data, Name=filename)
-        part['Content-Disposition'] = f'attachment; filename="{filename}"'
-        msg.attach(part)
-    
+    import smtplib
+
+    policy = DeliveryPolicy.from_mapping(st.secrets.get("email", {}))
     try:
-        with smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
+        plan = plan_delivery(attachments, policy, body_bytes=len(body.encode("utf-8")))
+        if plan.linked:
+            body = f"{body}\n\n{publish_links(list(plan.linked), policy, link_folder(run_id))}"
+    except (ValueError, OSError) as e:
+        st.error(f"Email not sent: {e}")
+        logging.error(f"Email delivery planning failed: {e}")
+        return False
+
+    total = len(plan.messages)
+    try:
+        with SMTP_SEND_SECONDS.time(), smtplib.SMTP_SSL('smtp.gmail.com', 465) as server:
             server.login(sender_email, password)
-            server.send_message(msg)
-        st.success(f"Email sent successfully to {recipient_email}!")
+            send_plan(server, sender_email, recipient_email, subject, body, plan)
+        sent = f" as {total} emails" if total > 1 else ""
+        linked = f"; {len(plan.linked)} file(s) sent as links" if plan.linked else ""
+        st.success(f"Email sent successfully to {recipient_email}{sent}{linked}!")
         return True
     except Exception as e:
+        SMTP_FAILURES.inc()
         st.error(f"Error sending email: {e}")
         logging.error(f"Email sending failed: {e}")
         return False
@@ -1185,7 +431,8 @@ with st.expander("Help & FAQs"):
     ### FAQs
     - **What is Spend Agent mode?** Ensures specific mandatory line items (e.g., KBCG, John Doe, Uber E110) are included for testing or compliance. Select items in the Advanced Settings tab.
     - **How to format timekeeper CSV?** Columns: TIMEKEEPER_NAME, TIMEKEEPER_CLASSIFICATION, TIMEKEEPER_ID, RATE  
-      Example: "John Doe,Partner,TK001,300.0"
+      Example: "John Doe,Partner,TK001,300.0"  
+      Optional EFFECTIVE_DATE (YYYY-MM-DD): repeat a timekeeper's row with a new RATE and EFFECTIVE_DATE to model a rate change; each line uses the rate in effect on its date.
     - **How to format custom tasks CSV?** Columns: TASK_CODE, ACTIVITY_CODE, DESCRIPTION  
       Example: "L100,A101,Legal Research: Analyze legal precedents"
     - **How to use a custom logo?** Upload a valid JPG or PNG image file in the Advanced Settings tab when PDF output is enabled. Only JPEG and PNG formats are supported. Other formats (e.g., GIF, BMP) will be converted to PNG. Maximum file size is 5MB. Ensure the image is not corrupted and displays correctly in an image viewer. If no logo is uploaded, the default logo (assets/nelsonmurdock2.jpg or assets/icon.jpg) or a placeholder will be used.
@@ -1202,22 +449,18 @@ st.checkbox(
 
 # Sidebar
 st.sidebar.markdown("<h2 style='color: #1E1E1E;'>Quick Links</h2>", unsafe_allow_html=True)
-sample_timekeeper = pd.DataFrame({
-    "TIMEKEEPER_NAME": ["Tom Delaganis", "Ryan Kinsey"],
-    "TIMEKEEPER_CLASSIFICATION": ["Partner", "Associate"],
-    "TIMEKEEPER_ID": ["TD001", "RK001"],
-    "RATE": [250.0, 200.0]
-})
-csv_timekeeper = sample_timekeeper.to_csv(index=False).encode('utf-8')
-st.sidebar.download_button("Download Sample Timekeeper CSV", csv_timekeeper, "sample_timekeeper.csv", "text/csv")
-
-sample_custom = pd.DataFrame({
-    "TASK_CODE": ["L100"],
-    "ACTIVITY_CODE": ["A101"],
-    "DESCRIPTION": ["Legal Research: Analyze legal precedents"]
-})
-csv_custom = sample_custom.to_csv(index=False).encode('utf-8')
-st.sidebar.download_button("Download Sample Custom Tasks CSV", csv_custom, "sample_custom_tasks.csv", "text/csv")
+sample_csvs = _sample_csvs()
+st.sidebar.download_button("Download Sample Timekeeper CSV", sample_csvs["timekeeper"], "sample_timekeeper.csv", "text/csv")
+st.sidebar.download_button("Download Sample Custom Tasks CSV", sample_csvs["custom_tasks"], "sample_custom_tasks.csv", "text/csv")
+st.sidebar.download_button("Download Sample Bulk Run Manifest CSV", sample_csvs["manifest"], "sample_manifest.csv", "text/csv")
+
+with st.sidebar.expander("Diagnostics", expanded=False):
+    startup_metrics = _startup_metrics()
+    if startup_metrics["cold_start_s"] is not None:
+        st.caption(f"Cold start (first script run in this process): {startup_metrics['cold_start_s'] * 1000:,.0f} ms")
+    if startup_metrics["reruns"]:
+        reruns_ms = sorted(r * 1000 for r in startup_metrics["reruns"])
+        st.caption(f"Reruns: last {startup_metrics['reruns'][-1] * 1000:,.0f} ms • median {reruns_ms[len(reruns_ms) // 2]:,.0f} ms over {len(reruns_ms)} run(s)")
 
 # Dynamic Tabs
 tabs = ["Data Sources", "Invoice Details", "Fees & Expenses", "Output"]
@@ -1228,13 +471,16 @@ with tab_objects[0]:
 
     st.markdown("<h3 style='color: #1E1E1E;'>Data Sources</h3>", unsafe_allow_html=True)
     uploaded_timekeeper_file = st.file_uploader("Upload Timekeeper CSV (tk_info.csv)", type="csv")
-    timekeeper_data = _load_timekeepers(uploaded_timekeeper_file)
+    timekeeper_data, timekeeper_digest = _load_timekeepers(uploaded_timekeeper_file)
+    timekeeper_registry = _get_timekeeper_registry(timekeeper_digest, timekeeper_data) if timekeeper_data is not None else None
 
     # Timekeeper summary + preview
     if timekeeper_data is not None:
         tk_count = len(timekeeper_data)
         st.success(f"Loaded {tk_count} timekeepers.")
-        tk_df_preview = pd.DataFrame(timekeeper_data).head(10).reset_index(drop=True)
+        if timekeeper_registry is not None and timekeeper_registry.has_rate_changes():
+            st.info(f"Effective-dated rates found: {len(timekeeper_registry)} unique timekeepers; each line uses the rate in effect on its date.")
+        tk_df_preview = pd.DataFrame(timekeeper_data[:10])  # slice first; never frame the whole roster
         tk_df_preview.index = tk_df_preview.index + 1
         preview_count = min(10, len(timekeeper_data))
         st.markdown(f"**{preview_count}-Row Preview**")
@@ -1246,13 +492,14 @@ with tab_objects[0]:
         uploaded_custom_tasks_file = st.file_uploader("Upload Custom Line Items CSV (custom_details.csv)", type="csv")
 
     task_activity_desc = CONFIG['DEFAULT_TASK_ACTIVITY_DESC']
+    task_catalog_digest = _default_task_catalog_digest()
     if use_custom_tasks and uploaded_custom_tasks_file:
-        custom_tasks_data = _load_custom_task_activity_data(uploaded_custom_tasks_file)
+        custom_tasks_data, custom_tasks_digest = _load_custom_task_activity_data(uploaded_custom_tasks_file)
         if custom_tasks_data is not None:
             li_count = len(custom_tasks_data)
             st.success(f"Loaded {li_count} custom line items.")
             if custom_tasks_data:
-                task_activity_desc = custom_tasks_data
+                task_activity_desc, task_catalog_digest = custom_tasks_data, custom_tasks_digest
 
 with tab_objects[1]:
     st.markdown("<h2 style='color: #1E1E1E;'>Invoice Details</h2>", unsafe_allow_html=True)
@@ -1295,6 +542,9 @@ with tab_objects[1]:
     # Other invoice details
     matter_number_base = st.text_input("Matter Number:", "2025-XXXXXX")
     invoice_number_base = st.text_input("Invoice Number (Base):", "2025MMM-XXXXXX")
+    number_pattern = RUN_NUMBER_PATTERN
+    if st.checkbox("Unique Invoice Numbers Across Runs", value=False, key="persistent_numbering", help="Take numbers from a persistent local counter instead of restarting at -1 on every run, so repeated and parallel runs never reuse a number."):
+        number_pattern = st.selectbox("Number Pattern", list(NUMBER_PATTERNS), format_func=NUMBER_PATTERNS.get, key="number_pattern")
 
     LEDES_OPTIONS = ["1998B", "XML 2.1"]
     ledes_version = st.selectbox(
@@ -1313,6 +563,13 @@ with tab_objects[1]:
     first_day_of_previous_month = last_day_of_previous_month.replace(day=1)
     billing_start_date = st.date_input("Billing Start Date", value=first_day_of_previous_month)
     billing_end_date = st.date_input("Billing End Date", value=last_day_of_previous_month)
+    cal1, cal2 = st.columns(2)
+    with cal1:
+        st.checkbox("Bill Business Days Only", value=False, key="business_days_only", help="Line items fall on weekdays only.")
+    with cal2:
+        st.checkbox("Skip US Federal Holidays", value=False, key="exclude_us_holidays", help="No line items on observed US federal holidays.")
+    st.selectbox("Daily Activity Pattern", list(WEEKDAY_PATTERNS), key="weekday_pattern", help="Relative amount of work billed on each weekday; days weighted 0 get no line items.")
+    st.text_area("Additional Holidays (YYYY-MM-DD, one per line)", value="", key="extra_holidays", height=68, help="Firm-specific closures; no line items are dated on these days.")
     invoice_desc = st.text_area(
         "Invoice Description (One per period, each on a new line)",
         value="Professional Services Rendered",
@@ -1439,12 +696,21 @@ with tab_objects[3]:
     st.markdown("<h2 style='color: #1E1E1E;'>Output</h2>", unsafe_allow_html=True)
     include_block_billed = st.checkbox("Include Block Billed Line Items", value=True)
     include_pdf = st.checkbox("Include PDF Invoice", value=False)
+    include_summary = st.checkbox("Include Summary Sidecar (JSON + CSV)", value=False, help="Per-invoice totals by timekeeper, task code, expense code and day, plus hours per timekeeper-day.")
     
     uploaded_logo = None
     logo_width = None
     logo_height = None
     
+    pdf_summary_sections = []
     if include_pdf:
+        ps1, ps2 = st.columns(2)
+        with ps1:
+            if st.checkbox("Add Timekeeper Summary to PDF", value=False, help="Hours, effective rate and amount per timekeeper."):
+                pdf_summary_sections.append("timekeeper")
+        with ps2:
+            if st.checkbox("Add Task Code Summary to PDF", value=False, help="Lines, hours and amount per UTBMS task code."):
+                pdf_summary_sections.append("task_code")
         include_logo = st.checkbox("Include Logo in PDF", value=True, help="Uncheck to exclude logo from PDF header, using only law firm text.")
         if include_logo:
             use_custom_logo = st.checkbox("Use Custom Logo", value=False)
@@ -1461,11 +727,19 @@ with tab_objects[3]:
     generate_multiple = st.checkbox("Generate Multiple Invoices", help="Create more than one invoice.")
     num_invoices = 1
     multiple_periods = False
+    period_frequency = PERIOD_FREQUENCIES[0]
+    parallel_workers = 1
     if generate_multiple:
         combine_ledes = st.checkbox("Combine LEDES into single file", help="If checked, all generated LEDES invoices will be combined into a single file with one header.")
-        multiple_periods = st.checkbox("Multiple Billing Periods", help="Backfills one invoice per prior month from the given end date, newest to oldest.")
+        multiple_periods = st.checkbox("Multiple Billing Periods", help="Backfills one invoice per prior period from the given dates, newest to oldest.")
         if multiple_periods:
-            num_periods = st.number_input("How Many Billing Periods:", min_value=2, max_value=6, value=2, step=1, help="Number of month-long periods to create (overrides Number of Invoices)." )
+            pc1, pc2, pc3 = st.columns(3)
+            with pc1:
+                period_frequency = st.selectbox("Billing Frequency", PERIOD_FREQUENCIES, key="period_frequency", help="Custom repeats the length of the selected billing period.")
+            with pc2:
+                num_periods = st.number_input("How Many Billing Periods:", min_value=2, max_value=MAX_PLANNED_PERIODS, value=2, step=1, help="Number of periods to create (overrides Number of Invoices).")
+            with pc3:
+                parallel_workers = st.number_input("Parallel Workers", min_value=1, max_value=32, value=min(4, os.cpu_count() or 1), step=1, key="parallel_workers", help=f"Periods are generated in worker processes when there are at least {PARALLEL_MIN_JOBS} to build.")
             num_invoices = num_periods
         else:
             num_invoices = st.number_input("Number of Invoices to Create:", min_value=1, value=1, step=1, help="Creates N invoices. When 'Multiple Billing Periods' is enabled, one invoice per period.")
@@ -1477,6 +751,154 @@ with tab_objects[3]:
     if generate_receipts:
         zip_receipts = st.checkbox("Zip Receipts", value=True, key="zip_receipts", help="Combine all generated receipt images into a single ZIP file.")
 
+    line_items_format = None
+    if st.checkbox("Export Line Items for Analytics", value=False, key="export_line_items", help="Adds a ZIP of dictionary-encoded Parquet or Arrow files, partitioned by profile, matter and billing period, ready for pandas, DuckDB or Spark."):
+        line_items_format = st.selectbox("Line Item Format", list(COLUMNAR_FORMATS), format_func=lambda f: {"parquet": "Parquet", "arrow": "Arrow IPC (Feather)"}[f], key="line_items_format")
+
+    pdf_output = PdfOutputOptions()
+    if include_pdf or generate_receipts:
+        with st.expander("PDF Size Options", expanded=False):
+            st.caption("Trade CPU and fidelity against bytes on the wire. The defaults match the original output.")
+            so1, so2 = st.columns(2)
+            with so1:
+                pdf_compression = st.selectbox("Page Compression", list(PDF_COMPRESSION_MODES), format_func=PDF_COMPRESSION_MODES.get, key="pdf_compression")
+                pdf_embed_fonts = st.checkbox("Embed Subset Fonts", value=False, key="pdf_embed_fonts", help="Embed TrueType subsets instead of referencing the standard PDF fonts. Larger, but renders identically everywhere.")
+            with so2:
+                pdf_image_dpi = st.selectbox("Image Resolution (receipts and logo)", [None] + PDF_IMAGE_DPI_CHOICES, format_func=lambda d: "Original" if d is None else f"{d} DPI", key="pdf_image_dpi")
+                pdf_image_quality = st.slider("JPEG Quality (0 = encoder default)", 0, 95, 0, step=5, key="pdf_image_quality")
+            pdf_output = PdfOutputOptions(
+                compression=pdf_compression, embed_fonts=pdf_embed_fonts,
+                image_dpi=pdf_image_dpi, image_quality=pdf_image_quality or None,
+            )
+
+    validation_mode = st.selectbox("Validation", list(VALIDATION_MODES), format_func=VALIDATION_MODES.get, key="validation_mode", help="Check every invoice against e-billing rules (daily hours, totals, UTBMS codes, billing period, descriptions) before its files are built.")
+
+    st.markdown("<h3 style='color: #1E1E1E;'>Regeneration</h3>", unsafe_allow_html=True)
+    if "run_seed" not in st.session_state:
+        st.session_state.run_seed = random.randint(1, 999_999)
+    run_seed = st.number_input("Random Seed", min_value=0, step=1, key="run_seed", help="Same seed + same settings reproduce the same line items. Change it to get fresh data.")
+    reuse_artifacts = st.checkbox("Reuse unchanged artifacts", value=True, key="reuse_artifacts", help="Only rebuild the rows, LEDES, PDF and receipt outputs whose inputs changed since the last run.")
+
+    with st.expander("Stress Mode (write straight to disk)", expanded=False):
+        st.caption("Streams very large runs to a server-side directory with constant memory. Uses the uploaded timekeepers and tasks, or a synthetic roster if none are loaded.")
+        stress_out_dir = st.text_input("Output Directory", value=os.path.join(os.getcwd(), "stress_output"), key="stress_out_dir")
+        sc1, sc2, sc3 = st.columns(3)
+        with sc1:
+            stress_invoices = st.number_input("Invoices", min_value=1, value=1000, step=100, key="stress_invoices")
+        with sc2:
+            stress_fees = st.number_input("Fee Lines / Invoice", min_value=0, value=500, step=50, key="stress_fees")
+        with sc3:
+            stress_expenses = st.number_input("Expense Lines / Invoice", min_value=1, value=50, step=10, key="stress_expenses")
+        stress_combine = st.checkbox("Single combined LEDES file", value=True, key="stress_combine")
+        stress_pdf = st.checkbox("Also write PDF invoices", value=False, key="stress_pdf")
+        stress_receipts = st.checkbox("Also write receipts", value=False, key="stress_receipts")
+        if st.button("Run Stress Generation", key="run_stress"):
+            from stress_mode import run_stress_generation
+            stress_bar = st.progress(0.0, text="Starting stress run...")
+
+            def _stress_progress(p):
+                stress_bar.progress(
+                    min(1.0, p["invoices"] / max(1, p["total_invoices"])),
+                    text=f"{p['invoices']}/{p['total_invoices']} invoices • {p['lines']:,} lines • {p['lines_per_s']:,.0f} lines/s"
+                )
+
+            stress_summary = run_stress_generation(
+                stress_out_dir, int(stress_invoices), int(stress_fees), int(stress_expenses),
+                timekeeper_data=timekeeper_data, task_activity_desc=task_activity_desc,
+                client_id=client_id, law_firm_id=law_firm_id, invoice_desc=CONFIG['DEFAULT_INVOICE_DESCRIPTION'],
+                billing_start_date=billing_start_date, billing_end_date=billing_end_date,
+                invoice_number_base=invoice_number_base, matter_number=matter_number_base,
+                max_daily_hours=max_daily_hours, include_block_billed=include_block_billed,
+                combine_ledes=stress_combine, include_pdf=stress_pdf, include_receipts=stress_receipts,
+                seed=int(run_seed), settings=GenerationSettings.from_mapping(st.session_state),
+                progress_callback=_stress_progress, pdf_output=pdf_output
+            )
+            st.success(
+                f"Wrote {stress_summary['invoices']:,} invoices / {stress_summary['lines']:,} lines "
+                f"({stress_summary['bytes_written'] / (1024 * 1024):,.1f} MB) to {stress_summary['out_dir']} "
+                f"in {stress_summary['elapsed_s']:.1f}s — {stress_summary['lines_per_s']:,.0f} lines/s, "
+                f"{stress_summary['invoices_per_s']:,.1f} invoices/s."
+            )
+
+    with st.expander("Bulk Run from Manifest", expanded=False):
+        st.caption("Plan many matters, clients, profiles and periods from one CSV/JSON manifest. Writes one ZIP bundle per matter plus run_summary.json/.csv. Entries without a 'timekeepers' path use the uploaded timekeeper CSV.")
+        uploaded_manifest = st.file_uploader("Upload Manifest (CSV or JSON)", type=["csv", "json"], key="manifest_upload")
+        manifest_out_dir = st.text_input("Output Directory", value=os.path.join(os.getcwd(), "bulk_output"), key="manifest_out_dir")
+        if uploaded_manifest is not None:
+            from manifest import load_manifest, plan_manifest, run_manifest
+            try:
+                manifest_entries = load_manifest(uploaded_manifest)
+            except ValueError as e:
+                st.error(f"Invalid manifest: {e}")
+                manifest_entries = []
+            if manifest_entries:
+                manifest_jobs = plan_manifest(manifest_entries)
+                st.info(f"Planned {len(manifest_jobs)} invoice(s) across {len({e['matter_number'] for e in manifest_entries})} matter(s) from {len(manifest_entries)} manifest entries.")
+                if st.button("Run Bulk Manifest", key="run_manifest"):
+                    manifest_bar = st.progress(0.0, text="Starting bulk run...")
+                    try:
+                        manifest_summary = run_manifest(
+                            manifest_entries, manifest_out_dir, timekeeper_data=timekeeper_data,
+                            task_activity_desc=task_activity_desc,
+                            settings=GenerationSettings.from_mapping(st.session_state),
+                            progress_callback=lambda done, total, row: manifest_bar.progress(done / total, text=f"{done}/{total} • {row['invoice_number']}"),
+                            pdf_output=pdf_output, line_items_format=line_items_format, catalog=_get_run_catalog(),
+                        )
+                    except (ValueError, OSError, sqlite3.Error) as e:
+                        st.error(f"Bulk run failed: {e}")
+                        logging.error(f"Manifest run failed: {e}")
+                    else:
+                        st.success(
+                            f"Generated {manifest_summary['invoices']} invoices ({manifest_summary['lines']:,} lines, "
+                            f"${manifest_summary['grand_total']:,.2f}, {manifest_summary['bytes'] / 1048576:,.1f} MB) for {manifest_summary['matters']} matter(s) "
+                            f"in {manifest_summary['elapsed_s']:.1f}s → {manifest_summary['out_dir']}"
+                        )
+                        summary_df = pd.DataFrame(manifest_summary["invoices_detail"])
+                        st.dataframe(summary_df, use_container_width=True)
+                        st.download_button("Download Run Summary CSV", summary_df.to_csv(index=False).encode('utf-8'), "run_summary.csv", "text/csv", key="download_run_summary")
+
+    run_catalog = _get_run_catalog()
+    if run_catalog is not None:
+        with st.expander("Run History", expanded=False):
+            st.caption(f"Every generation run is recorded in {run_catalog.path}: config hash, seed, timings, per-invoice totals, artifacts and line items.")
+            hc1, hc2, hc3 = st.columns(3)
+            with hc1:
+                history_matter = st.text_input("Matter Number", key="history_matter")
+            with hc2:
+                history_profile = st.selectbox("Profile", ["All"] + [p[0] for p in BILLING_PROFILES], key="history_profile")
+            with hc3:
+                history_period = st.date_input("Billing Period Overlaps", value=(), key="history_period")
+            history_start, history_end = (tuple(history_period) + (None, None))[:2]
+            try:
+                history_invoices = run_catalog.find_invoices(
+                    matter_number=history_matter.strip() or None,
+                    profile=None if history_profile == "All" else history_profile,
+                    period_start=history_start, period_end=history_end or history_start,
+                )
+                recent_runs = run_catalog.runs(limit=20)
+            except sqlite3.Error as e:
+                logging.error(f"Run catalog query failed: {e}")
+                history_invoices, recent_runs = [], []
+            st.markdown(f"**Invoices:** {len(history_invoices)} match")
+            if history_invoices:
+                st.dataframe(pd.DataFrame(history_invoices).drop(columns=["rows_key"]), hide_index=True, use_container_width=True)
+            st.markdown("**Recent runs**")
+            if recent_runs:
+                runs_df = pd.DataFrame(recent_runs)
+                runs_df["started_at"] = pd.to_datetime(runs_df["started_at"], unit="s").dt.strftime("%Y-%m-%d %H:%M:%S")
+                st.dataframe(runs_df, hide_index=True, use_container_width=True)
+                manifest_runs = [r["run_id"] for r in recent_runs if r["source"] == "manifest"]
+                if manifest_runs:
+                    rerun_id = st.selectbox("Manifest Run", manifest_runs, key="history_rerun_id")
+                    if st.button("Regenerate Manifest Run", key="history_rerun", help="Re-runs the recorded entries, roster and options into the bulk output directory."):
+                        from manifest import rerun_manifest
+                        try:
+                            rerun_summary = rerun_manifest(run_catalog, rerun_id, manifest_out_dir)
+                        except (ValueError, OSError, sqlite3.Error) as e:
+                            st.error(f"Regeneration failed: {e}")
+                        else:
+                            st.success(f"Regenerated {rerun_summary['invoices']} invoice(s) as run {rerun_summary['run_id']} → {rerun_summary['out_dir']}")
+
 # Email Configuration Tab (only created if send_email is True)
 if st.session_state.send_email:
     email_tab_index = len(tabs) - 1
@@ -1519,166 +941,414 @@ if generate_button:
         st.error("LEDES XML 2.1 is not yet implemented. Please switch to 1998B.")
         st.stop()
     
+    from faker import Faker
+
     faker = Faker()
     descriptions = [d.strip() for d in invoice_desc.split('\n') if d.strip()]
     num_invoices = int(num_invoices)
     
-    if multiple_periods and len(descriptions) != num_invoices:
-        st.warning(f"You have selected to generate {num_invoices} invoices, but provided {len(descriptions)} descriptions. Please provide one description per period.")
+    if multiple_periods and len(descriptions) not in (1, num_invoices):
+        st.warning(f"You have selected to generate {num_invoices} invoices, but provided {len(descriptions)} descriptions. Please provide one description per period, or a single description for all of them.")
     else:
         attachments_list = []
         receipt_files = []
-        combined_ledes_content = ""
-        zip_receipts_enabled = st.session_state.get('zip_receipts', False) if generate_receipts else False
-
-        with st.status("Generating invoices...") as status:
-            current_end_date = billing_end_date
-            current_start_date = billing_start_date
-            
+        combined_ledes = SpooledArtifact("LEDES_Combined.txt") if combine_ledes else None
+        try:
+            zip_receipts_enabled = st.session_state.get('zip_receipts', False) if generate_receipts else False
+
+            artifact_cache = _get_artifact_cache()
+            cache_stats = {"hits": 0, "misses": 0}
+            run_seed = int(run_seed)
+            logo_bytes = None
+            if include_pdf and include_logo:
+                use_custom_logo = st.session_state.get('use_custom_logo_checkbox', False)
+                logo_bytes = _get_logo_bytes(uploaded_logo, law_firm_id, use_custom_logo)
+            generation_settings = GenerationSettings.from_mapping(st.session_state)
+
+            # Mandatory items are resolved once per run; they replace generated lines one for one
+            try:
+                mandatory_plan = compile_mandatory_items(selected_items if spend_agent else [], timekeeper_registry, generation_settings)
+            except ValueError as e:
+                st.error(f"Mandatory items could not be prepared: {e}")
+                st.stop()
+            fees_used, expenses_used = mandatory_plan.generated_counts(fees, expenses)
+            # The whole period calendar is known up front, so periods can be built in any order
+            period_plan = plan_periods(billing_start_date, billing_end_date, num_invoices if multiple_periods else 1, period_frequency)
+            invoice_plan = []
+            # Hash the (possibly very large) roster and task catalog once, not once per invoice
+            # Ingest digests stand in for the uploads themselves; the rosters are never re-serialised here
+            catalog_digest = config_hash(timekeeper_digest, task_catalog_digest)
             for i in range(num_invoices):
-                if multiple_periods and i > 0:
-                    current_end_date = current_start_date - datetime.timedelta(days=1)
-                    current_start_date = current_end_date.replace(day=1)
-                
-                status.update(label=f"Generating Invoice {i+1}/{num_invoices} for period {current_start_date} to {current_end_date}")
-                
-                current_invoice_desc = descriptions[i] if multiple_periods and i < len(descriptions) else descriptions[0]
-                fees_used = max(0, fees - (2 if spend_agent and selected_items else 0))
-                expenses_used = max(0, expenses - (1 if spend_agent and 'Uber E110' in selected_items else 0))
-                
-                rows, total_amount = _generate_invoice_data(
-                    fees_used, expenses_used, timekeeper_data, client_id, law_firm_id,
-                    current_invoice_desc, current_start_date, current_end_date,
-                    task_activity_desc, CONFIG['MAJOR_TASK_CODES'], max_daily_hours, include_block_billed, faker
+                period = period_plan[i] if multiple_periods else period_plan[0]
+                invoice_desc_i = descriptions[i] if multiple_periods and i < len(descriptions) else descriptions[0]
+                # Rows depend only on generation inputs; everything downstream is keyed off this hash.
+                rows_cfg = config_hash(
+                    "rows", fees_used, expenses_used, catalog_digest, client_id, law_firm_id,
+                    invoice_desc_i, period.start, period.end,
+                    sorted(CONFIG['MAJOR_TASK_CODES']), max_daily_hours, include_block_billed,
+                    generation_settings.settings_hash(), spend_agent, selected_items
                 )
-
-                skipped_mandatory_items = []
-                if spend_agent:
-                    rows, skipped_mandatory_items = _ensure_mandatory_lines(
-                        rows, timekeeper_data, current_invoice_desc, client_id, law_firm_id, 
-                        current_start_date, current_end_date, selected_items
+                invoice_plan.append({
+                    "invoice_index": i, "start": period.start, "end": period.end, "invoice_desc": invoice_desc_i,
+                    "rows_cfg": rows_cfg, "rows_key": ArtifactCache.make_key(rows_cfg, run_seed, i, "rows"),
+                })
+            row_inputs = {
+                "seed": run_seed, "fee_count": fees_used, "expense_count": expenses_used,
+                "timekeepers": timekeeper_registry, "client_id": client_id, "law_firm_id": law_firm_id,
+                "task_activity_desc": task_activity_desc, "major_task_codes": CONFIG['MAJOR_TASK_CODES'],
+                "max_daily_hours": max_daily_hours, "include_block_billed": include_block_billed,
+                "settings": generation_settings, "mandatory_items": mandatory_plan,
+            }
+            run_config = {
+                "profile": selected_env, "invoice_number_base": invoice_number_base, "matter_number": matter_number_base,
+                "client_id": client_id, "law_firm_id": law_firm_id, "fees": fees_used, "expenses": expenses_used,
+                "periods": [[job["start"], job["end"], job["invoice_desc"]] for job in invoice_plan],
+                "max_daily_hours": max_daily_hours, "include_block_billed": include_block_billed,
+                "mandatory_items": selected_items if spend_agent else [], "settings": dataclasses.asdict(generation_settings),
+                "catalog_digest": catalog_digest, "include_pdf": include_pdf, "include_receipts": generate_receipts,
+                "include_summary": include_summary, "combine_ledes": combine_ledes,
+            }
+            try:
+                numberer = persistent_numberer(number_pattern, block_size=num_invoices) if number_pattern != RUN_NUMBER_PATTERN else None
+            except (ValueError, OSError, sqlite3.Error) as e:
+                st.error(f"Invoice numbering unavailable: {e}")
+                st.stop()
+            receipt_names = UniqueNames()
+            validation_rules = ValidationRules(max_daily_hours=float(max_daily_hours))
+            run_violations: List[Any] = []
+            run_id = _catalog_call("start_run", "app", run_config, seed=run_seed, config_hash=config_hash(run_config))
+            bind_log_context(source="app", run_id=run_id, invoice_number=None)
+            run_started, run_lines = time.perf_counter(), 0
+
+            with st.status("Generating invoices...") as status:
+                fresh_rows: Dict[int, bytes] = {}
+                run_invoices: List[Dict[str, Any]] = []
+
+                def _store_rows(result: Dict[str, Any]) -> None:
+                    payload = json.dumps(
+                        {"rows": result["rows"], "skipped": result["skipped"], "total": result["total"], "summary": result["summary"]},
+                        default=str
+                    ).encode("utf-8")
+                    artifact_cache.put(invoice_plan[result["invoice_index"]]["rows_key"], payload)
+                    fresh_rows[result["invoice_index"]] = payload
+                    cache_stats["misses"] += 1
+
+                pending_jobs = [job for job in invoice_plan if not (reuse_artifacts and artifact_cache.contains(job["rows_key"]))]
+                for result in dispatch_period_rows(
+                    row_inputs, pending_jobs, parallel_workers,
+                    progress_callback=lambda done, total: status.update(label=f"Generating line items: {done}/{total} invoice(s)")
+                ):
+                    _store_rows(result)
+
+                def _load_rows(job: Dict[str, Any]) -> Dict[str, Any]:
+                    rows_blob = fresh_rows.get(job["invoice_index"])
+                    if rows_blob is None:
+                        rows_blob = artifact_cache.get(job["rows_key"])
+                        if rows_blob is None:  # evicted since planning
+                            for result in dispatch_period_rows(row_inputs, [job]):
+                                _store_rows(result)
+                            rows_blob = fresh_rows[job["invoice_index"]]
+                        else:
+                            cache_stats["hits"] += 1
+                            fresh_rows[job["invoice_index"]] = rows_blob   # held until built, so counted once
+                    return json.loads(rows_blob)
+
+                # Number and validate the whole plan before anything is cached, catalogued or exported
+                invoice_numbers: Dict[int, str] = {}
+                for job in invoice_plan:
+                    i = job["invoice_index"]
+                    if numberer is not None:
+                        invoice_numbers[i] = numberer.number(
+                            i, base=invoice_number_base, matter=matter_number_base, profile=selected_env,
+                            start=job["start"], end=job["end"]
+                        )
+                    else:
+                        invoice_numbers[i] = f"{invoice_number_base}-{i+1}"
+                    if validation_mode == "off":
+                        continue
+                    status.update(label=f"Validating Invoice {i+1}/{num_invoices}")
+                    rows_payload = _load_rows(job)
+                    invoice_violations = validate_invoice(
+                        rows_payload["rows"], invoice_numbers[i], job["start"], job["end"],
+                        rows_payload.get("total", rows_payload["summary"]["total"]), rows_payload["skipped"], validation_rules
                     )
+                    run_violations.extend(invoice_violations)
+                    if validation_mode == "block" and has_errors(invoice_violations):
+                        record_run("app", 0, 0, time.perf_counter() - run_started, failed=True)
+                        _write_metrics_file()
+                        _show_violations(run_violations)
+                        if run_id:
+                            _catalog_call("finish_run", run_id, error=f"Validation failed for {invoice_numbers[i]}")
+                        st.error(f"Invoice {invoice_numbers[i]} failed validation; nothing was delivered. Fix the inputs or set Validation to 'Report only'.")
+                        status.update(label="Delivery blocked by validation errors", state="error")
+                        st.stop()
+
+                line_items_exporter = None
+                if line_items_format:
+                    from columnar_export import LineItemExporter
+                    line_items_exporter = LineItemExporter(tempfile.mkdtemp(prefix="line_items_"), line_items_format)
+
+                for job in invoice_plan:
+                    i = job["invoice_index"]
+                    current_start_date, current_end_date = job["start"], job["end"]
+                    rows_cfg = job["rows_cfg"]
+                    status.update(label=f"Generating Invoice {i+1}/{num_invoices} for period {current_start_date} to {current_end_date}")
+
+                    rows_payload = _load_rows(job)
+                    fresh_rows.pop(i, None)
+                    rows = rows_payload["rows"]
+                    skipped_mandatory_items = rows_payload["skipped"]
+                    # Aggregated once when the rows were built (after mandatory lines); never re-summed here
+                    invoice_summary = rows_payload.get("summary") or summarize_invoice(rows)
+                    # The generator's own total, so LEDES/PDF totals (and the invoice_total rule) see what it produced
+                    total_amount = rows_payload.get("total", invoice_summary["total"])
                 
-                df_invoice = pd.DataFrame(rows)
-                # Recalculate total amount after adding/skipping mandatory lines
-                total_amount = df_invoice["LINE_ITEM_TOTAL"].sum()
-                
-                if skipped_mandatory_items:
-                    skipped_list = ", ".join(f"'{item}'" for item in skipped_mandatory_items)
-                    st.warning(
-                        f"**Mandatory Items Skipped:** The following items were not added to the invoice because their assigned timekeepers were not found in your CSV file: **{skipped_list}**"
-                    )
+                    if skipped_mandatory_items and validation_mode == "off":
+                        skipped_list = ", ".join(f"'{item}'" for item in skipped_mandatory_items)
+                        st.warning(
+                            f"**Mandatory Items Skipped:** The following items were not added to the invoice because their assigned timekeepers were not found in your CSV file: **{skipped_list}**"
+                        )
 
-                current_invoice_number = f"{invoice_number_base}-{i+1}"
-                current_matter_number = matter_number_base
+                    current_matter_number = matter_number_base
+                    current_invoice_number = invoice_numbers[i]
+                    bind_log_context(invoice_number=current_invoice_number)
+                    if run_id:
+                        _catalog_call(
+                            "record_invoice", run_id, current_invoice_number, rows, invoice_summary, current_start_date, current_end_date,
+                            matter_number=current_matter_number, profile=selected_env, client_id=client_id, law_firm_id=law_firm_id,
+                            rows_key=job["rows_key"]
+                        )
+                    run_lines += len(rows)
+                    run_invoices.append({
+                        "invoice_number": current_invoice_number, "rows_key": job["rows_key"],
+                        "start": current_start_date.isoformat(), "end": current_end_date.isoformat(),
+                    })
                 
-                is_first = (i == 0) and combine_ledes
-                ledes_content_part = _create_ledes_1998b_content(df_invoice.to_dict(orient='records'), total_amount, current_start_date, current_end_date, current_invoice_number, current_matter_number, is_first_invoice=not combine_ledes or is_first)
+                    if line_items_exporter is not None:
+                        line_items_exporter.add_invoice(rows, selected_env, current_matter_number, current_invoice_number, current_start_date, current_end_date)
+
+                    is_first = (i == 0) and combine_ledes
+                    write_header = not combine_ledes or is_first
+                    ledes_cfg = config_hash("ledes", rows_cfg, current_invoice_number, current_matter_number, write_header)
+                    ledes_bytes = _cached_artifact(
+                        artifact_cache, ArtifactCache.make_key(ledes_cfg, run_seed, i, "ledes"),
+                        lambda: _create_ledes_1998b_content(rows, total_amount, current_start_date, current_end_date, current_invoice_number, current_matter_number, is_first_invoice=write_header).encode("utf-8"),
+                        reuse_artifacts, cache_stats
+                    )
                 
-                if combine_ledes:
-                    combined_ledes_content += ledes_content_part   # <- no extra "\n" here
-                else:
-                    ledes_filename = f"LEDES_1998B_{current_invoice_number}.txt"
-                    attachments_list.append((ledes_filename, ledes_content_part.encode("utf-8")))
+                    if combine_ledes:
+                        combined_ledes.write(ledes_bytes)   # <- no extra "\n" here; spills to disk past SPOOL_MEMORY_BYTES
+                    else:
+                        ledes_filename = f"LEDES_1998B_{current_invoice_number}.txt"
+                        attachments_list.append((ledes_filename, ledes_bytes))
 
                 
-                if include_pdf:
-                    logo_bytes = None
-                    if include_logo:
-                        use_custom_logo = st.session_state.get('use_custom_logo_checkbox', False)
-                        logo_bytes = _get_logo_bytes(uploaded_logo, law_firm_id, use_custom_logo)
-                    
-                    pdf_buffer = _create_pdf_invoice(df=df_invoice, total_amount=total_amount, invoice_number=current_invoice_number, invoice_date=current_end_date, billing_start_date=current_start_date, billing_end_date=current_end_date, client_id=client_id, law_firm_id=law_firm_id, logo_bytes=logo_bytes, include_logo=include_logo, client_name=client_name, law_firm_name=law_firm_name)
-                    pdf_filename = f"Invoice_{current_invoice_number}.pdf"
-                    attachments_list.append((pdf_filename, pdf_buffer.getvalue()))
-                
-                if generate_receipts:
-                    for _, row in df_invoice.iterrows():
-                        if row.get("EXPENSE_CODE") and row.get("EXPENSE_CODE") != "E101":
-                            receipt_filename, receipt_data_buf = _create_receipt_image(row.to_dict(), faker)
-                            if receipt_data_buf:
-                                receipt_files.append((receipt_filename, receipt_data_buf.getvalue()))
-
-            # Process receipts after loop
-            if receipt_files:
-                if zip_receipts_enabled:
-                    zip_buf = io.BytesIO()
-                    with zipfile.ZipFile(zip_buf, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                        for filename, data in receipt_files:
-                            zip_file.writestr(filename, data)
-                    zip_buf.seek(0)
-                    attachments_list.append(("receipts.zip", zip_buf.getvalue()))
-                else:
-                    attachments_list.extend(receipt_files)
-
-            # Final download/email logic
-            def get_mime_type(filename):
-                if filename.endswith(".txt"): return "text/plain"
-                if filename.endswith(".pdf"): return "application/pdf"
-                if filename.endswith(".png"): return "image/png"
-                if filename.endswith(".zip"): return "application/zip"
-                return "application/octet-stream"
-
-            if st.session_state.send_email:
-                subject, body = _customize_email_body(current_matter_number, f"{invoice_number_base}-Combined" if combine_ledes else f"{current_invoice_number}")
+                    if include_pdf:
+                        pdf_cfg = config_hash(
+                            "pdf", rows_cfg, current_invoice_number, current_start_date, current_end_date,
+                            client_id, law_firm_id, client_name, law_firm_name, include_logo, bytes_hash(logo_bytes),
+                            pdf_summary_sections, layout_hash(selected_env), pdf_output
+                        )
+                        pdf_bytes = _cached_artifact(
+                            artifact_cache, ArtifactCache.make_key(pdf_cfg, run_seed, i, "pdf"),
+                            lambda: _create_pdf_invoice(df=pd.DataFrame(rows), total_amount=total_amount, summary=invoice_summary, summary_sections=tuple(pdf_summary_sections), layout=selected_env, output=pdf_output, invoice_number=current_invoice_number, invoice_date=current_end_date, billing_start_date=current_start_date, billing_end_date=current_end_date, client_id=client_id, law_firm_id=law_firm_id, logo_bytes=logo_bytes, include_logo=include_logo, client_name=client_name, law_firm_name=law_firm_name).getvalue(),
+                            reuse_artifacts, cache_stats
+                        )
+                        pdf_filename = f"Invoice_{current_invoice_number}.pdf"
+                        attachments_list.append((pdf_filename, pdf_bytes))
+
+                    if include_summary:
+                        attachments_list.append((f"Invoice_{current_invoice_number}_summary.json", summary_to_json(
+                            invoice_summary, invoice_number=current_invoice_number, matter_number=current_matter_number,
+                            billing_start_date=current_start_date.isoformat(), billing_end_date=current_end_date.isoformat()
+                        ).encode("utf-8")))
+                        attachments_list.append((f"Invoice_{current_invoice_number}_summary.csv", summary_to_csv(invoice_summary).encode("utf-8")))
                 
+                    if generate_receipts:
+                        def _build_receipts() -> bytes:
+                            _seed_invoice_rng(run_seed, i, "receipts", faker)
+                            invoice_receipts = []
+                            for row in rows:
+                                if row.get("EXPENSE_CODE") and row.get("EXPENSE_CODE") != "E101":
+                                    receipt_filename, receipt_data_buf = _create_receipt_image(row, faker, pdf_output)
+                                    if receipt_data_buf:
+                                        invoice_receipts.append((receipt_filename, receipt_data_buf.getvalue()))
+                            return _pack_files(invoice_receipts)
+
+                        receipts_cfg = config_hash("receipts", rows_cfg, pdf_output)
+                        # Receipt names repeat for the same expense code and day; keep every one
+                        receipt_files.extend(
+                            (receipt_names.claim(f"{current_invoice_number}_{name}" if num_invoices > 1 else name), data)
+                            for name, data in _unpack_files(_cached_artifact(
+                                artifact_cache, ArtifactCache.make_key(receipts_cfg, run_seed, i, "receipts"),
+                                _build_receipts, reuse_artifacts, cache_stats
+                            ))
+                        )
+
+                # The browser reads rows back from the artifact cache by key; only keys live in session state
+                st.session_state.last_run_invoices = run_invoices
+
+                if reuse_artifacts and cache_stats["hits"]:
+                    st.caption(f"Reused {cache_stats['hits']} unchanged artifact(s); rebuilt {cache_stats['misses']}.")
+
+                bind_log_context(invoice_number=None)
+                record_run("app", len(run_invoices), run_lines, time.perf_counter() - run_started)
+                _write_metrics_file()
+                if run_violations:
+                    _show_violations(run_violations)
+
+                if line_items_exporter is not None:
+                    from columnar_export import zip_export
+                    try:
+                        line_items_exporter.close()
+                        attachments_list.append((f"line_items_{line_items_format}.zip", zip_export(line_items_exporter.root)))
+                    finally:
+                        shutil.rmtree(line_items_exporter.root, ignore_errors=True)
+
+                # Process receipts after loop
+                if receipt_files:
+                    if zip_receipts_enabled:
+                        zip_buf = io.BytesIO()
+                        with zipfile.ZipFile(zip_buf, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                            for filename, data in receipt_files:
+                                zip_file.writestr(filename, data)
+                        zip_buf.seek(0)
+                        attachments_list.append(("receipts.zip", zip_buf.getvalue()))
+                    else:
+                        attachments_list.extend(receipt_files)
+
+                report_files = list(attachments_list)
                 if combine_ledes:
-                    attachments_to_send = [("LEDES_Combined.txt", combined_ledes_content.encode('utf-8'))]
-                    attachments_to_send.extend(attachments_list) # attachments_list already has PDFs and receipts (zipped or not)
-                    if not _send_email_with_attachment(recipient_email, subject, body, attachments_to_send):
-                        st.subheader("Invoice(s) Failed to Email - Download below:")
-                        for filename, data in attachments_to_send:
-                            st.download_button(label=f"Download {filename}", data=data, file_name=filename, mime=get_mime_type(filename), key=f"download_failed_{filename}")
+                    report_files.insert(0, (combined_ledes.name, combined_ledes))
+                if receipt_files and zip_receipts_enabled:
+                    report_files.extend((f"receipts.zip/{name}", data) for name, data in receipt_files)
+                _show_artifact_sizes(report_files)
+                if run_id:
+                    _catalog_call("record_artifacts", run_id, [(name, None, len(data), None) for name, data in report_files])
+
+                # Final download/email logic
+                def get_mime_type(filename):
+                    if filename.endswith(".txt"): return "text/plain"
+                    if filename.endswith(".pdf"): return "application/pdf"
+                    if filename.endswith(".png"): return "image/png"
+                    if filename.endswith(".zip"): return "application/zip"
+                    if filename.endswith(".json"): return "application/json"
+                    if filename.endswith(".csv"): return "text/csv"
+                    return "application/octet-stream"
+
+                emailed = False
+                if st.session_state.send_email:
+                    subject, body = _customize_email_body(current_matter_number, f"{invoice_number_base}-Combined" if combine_ledes else f"{current_invoice_number}")
+                
+                    if combine_ledes:
+                        attachments_to_send = [(combined_ledes.name, combined_ledes)]
+                        attachments_to_send.extend(attachments_list) # attachments_list already has PDFs and receipts (zipped or not)
+                        emailed = _send_email_with_attachment(recipient_email, subject, body, attachments_to_send, run_id)
+                        if not emailed:
+                            st.subheader("Invoice(s) Failed to Email - Download below:")
+                            for filename, data in attachments_to_send:
+                                with open_artifact(data) as f:
+                                    st.download_button(label=f"Download {filename}", data=f, file_name=filename, mime=get_mime_type(filename), key=f"download_failed_{filename}")
+                    else:
+                        emailed = _send_email_with_attachment(recipient_email, subject, body, attachments_list, run_id)
+                        if not emailed:
+                            st.subheader("Invoice(s) Failed to Email - Download below:")
+                            for filename, data in attachments_list:
+                                st.download_button(label=f"Download {filename}", data=data, file_name=filename, mime=get_mime_type(filename), key=f"download_failed_{filename}")
                 else:
-                    if not _send_email_with_attachment(recipient_email, subject, body, attachments_list):
-                        st.subheader("Invoice(s) Failed to Email - Download below:")
-                        for filename, data in attachments_list:
-                            st.download_button(label=f"Download {filename}", data=data, file_name=filename, mime=get_mime_type(filename), key=f"download_failed_{filename}")
-            else:
-                if combine_ledes:
-                    st.subheader("Generated Combined LEDES Invoice")
-                    st.download_button(
-                        label="Download Combined LEDES File",
-                        data=combined_ledes_content.encode('utf-8'),
-                        file_name="LEDES_Combined.txt",
-                        mime="text/plain",
-                        key="download_combined_ledes"
-                    )
-                    other_attachments = attachments_list
-                    if other_attachments:
+                    if combine_ledes:
+                        st.subheader("Generated Combined LEDES Invoice")
+                        # The spool is handed over as a file object, not copied into one bytes object first
+                        with combined_ledes.reader() as f:
+                            st.download_button(
+                                label="Download Combined LEDES File",
+                                data=f,
+                                file_name=combined_ledes.name,
+                                mime="text/plain",
+                                key="download_combined_ledes"
+                            )
+                        other_attachments = attachments_list
+                        if other_attachments:
+                            zip_buf = io.BytesIO()
+                            with zipfile.ZipFile(zip_buf, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                                for filename, data in other_attachments:
+                                    zip_file.writestr(filename, data)
+                            zip_buf.seek(0)
+                            st.download_button(
+                                label="Download All PDFs & Receipts as ZIP",
+                                data=zip_buf.getvalue(),
+                                file_name="invoices_and_receipts.zip",
+                                mime="application/zip",
+                                key="download_pdf_zip"
+                            )
+                    elif num_invoices > 1 or (generate_receipts and zip_receipts_enabled):
                         zip_buf = io.BytesIO()
                         with zipfile.ZipFile(zip_buf, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-                            for filename, data in other_attachments:
+                            for filename, data in attachments_list:
                                 zip_file.writestr(filename, data)
                         zip_buf.seek(0)
                         st.download_button(
-                            label="Download All PDFs & Receipts as ZIP",
+                            label="Download All Files as ZIP",
                             data=zip_buf.getvalue(),
-                            file_name="invoices_and_receipts.zip",
+                            file_name="invoices.zip",
                             mime="application/zip",
-                            key="download_pdf_zip"
+                            key="download_zip"
                         )
-                elif num_invoices > 1 or (generate_receipts and zip_receipts_enabled):
-                    zip_buf = io.BytesIO()
-                    with zipfile.ZipFile(zip_buf, 'w', zipfile.ZIP_DEFLATED) as zip_file:
+                    else:
+                        st.subheader("Generated Invoice(s)")
                         for filename, data in attachments_list:
-                            zip_file.writestr(filename, data)
-                    zip_buf.seek(0)
-                    st.download_button(
-                        label="Download All Files as ZIP",
-                        data=zip_buf.getvalue(),
-                        file_name="invoices.zip",
-                        mime="application/zip",
-                        key="download_zip"
-                    )
-                else:
-                    st.subheader("Generated Invoice(s)")
-                    for filename, data in attachments_list:
-                        st.download_button(
-                            label=f"Download {filename}",
-                            data=data,
-                            file_name=filename,
-                            mime=get_mime_type(filename),
-                            key=f"download_{filename}"
-                        )
-            status.update(label="Invoice generation complete!", state="complete")
+                            st.download_button(
+                                label=f"Download {filename}",
+                                data=data,
+                                file_name=filename,
+                                mime=get_mime_type(filename),
+                                key=f"download_{filename}"
+                            )
+                if run_id:
+                    _catalog_call("finish_run", run_id, emailed=emailed)
+                status.update(label="Invoice generation complete!", state="complete")
+        finally:
+            if combined_ledes is not None:
+                combined_ledes.close()
+
+# --- Invoice Browser ---
+last_run_invoices = st.session_state.get("last_run_invoices")
+if last_run_invoices:
+    st.markdown("---")
+    st.markdown("<h3 style='color: #1E1E1E;'>Invoice Browser</h3>", unsafe_allow_html=True)
+    browser_labels = [f"{inv['invoice_number']} ({inv['start']} to {inv['end']})" for inv in last_run_invoices]
+    browser_choice = st.selectbox("Invoice", range(len(browser_labels)), format_func=browser_labels.__getitem__, key="browser_invoice")
+    browser_key = last_run_invoices[min(browser_choice, len(last_run_invoices) - 1)]["rows_key"]
+    try:
+        browser_payload = _preview_payload(browser_key)
+    except KeyError:
+        browser_payload = None
+    if browser_payload is None:
+        st.info("This invoice's rows are no longer in the artifact cache. Generate again to browse it.")
+    else:
+        browser_facets = facets(browser_payload["summary"])
+        bf1, bf2, bf3 = st.columns(3)
+        with bf1:
+            browse_tk = st.selectbox("Timekeeper", ["All"] + browser_facets["timekeepers"], key="browser_tk")
+        with bf2:
+            browse_task = st.selectbox("Task Code", ["All"] + browser_facets["task_codes"], key="browser_task")
+        with bf3:
+            browse_expense = st.selectbox("Expense Code", ["All"] + browser_facets["expense_codes"], key="browser_expense")
+        browser_view = _preview_view(
+            browser_key,
+            None if browse_tk == "All" else browse_tk,
+            None if browse_task == "All" else browse_task,
+            None if browse_expense == "All" else browse_expense,
+        )
+        bm = st.columns(5)
+        bm[0].metric("Lines", f"{browser_view.totals['lines']:,}")
+        bm[1].metric("Hours", f"{browser_view.totals['hours']:,.1f}")
+        bm[2].metric("Fees", f"${browser_view.totals['fees']:,.2f}")
+        bm[3].metric("Expenses", f"${browser_view.totals['expenses']:,.2f}")
+        bm[4].metric("Total", f"${browser_view.totals['total']:,.2f}")
+        browser_pages = page_count(len(browser_view.indices))
+        # The label includes the page count, so changing a filter resets to page 1
+        browser_page = st.number_input(f"Page (of {browser_pages:,})", min_value=1, max_value=browser_pages, value=1, step=1)
+        st.dataframe(page_frame(browser_payload["rows"], browser_view.indices, int(browser_page)), use_container_width=True)
+
+_record_script_run(_SCRIPT_RUN_STARTED)
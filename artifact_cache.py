@@ -0,0 +1,157 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, List, Optional, Tuple
+
+# --- Artifact cache configuration ---
+DEFAULT_CACHE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".artifact_cache")
+DEFAULT_CACHE_MAX_BYTES = 512 * 1024 * 1024  # 512 MB on disk before LRU eviction kicks in
+CACHE_LOW_WATER = 0.9  # eviction trims to this fraction of max_bytes, so a full cache doesn't evict on every put
+# ------------------------------------
+
+
+def config_hash(*parts: Any) -> str:
+    """Return a stable SHA-256 hex digest for any JSON-serialisable inputs."""
+    payload = json.dumps(parts, sort_keys=True, default=str, separators=(",", ":"))
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def bytes_hash(data: Optional[bytes]) -> str:
+    """Return a SHA-256 hex digest for raw bytes (e.g. logo uploads)."""
+    return hashlib.sha256(data or b"").hexdigest()
+
+
+class ArtifactCache:
+    """
+    Content-addressed, size-bounded on-disk store for generated artifacts.
+
+    Entries are keyed by (config hash, seed, invoice index, artifact type) and
+    stored as one file each under a two-level fan-out directory. The directory is
+    scanned once at startup; after that an in-memory LRU index (seeded from file
+    mtimes, which reads also bump) drives eviction without re-walking the tree.
+    """
+
+    def __init__(self, root: str = DEFAULT_CACHE_DIR, max_bytes: int = DEFAULT_CACHE_MAX_BYTES):
+        self.root = root
+        self.max_bytes = int(max_bytes)
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        self._index: "OrderedDict[str, int]" = OrderedDict(
+            (path, size) for path, size, _ in sorted(self._entries(), key=lambda e: e[2])
+        )
+        self._total_bytes = sum(self._index.values())
+
+    @staticmethod
+    def make_key(cfg_hash: str, seed: int, invoice_index: int, artifact_type: str) -> str:
+        """Build the content address for one artifact."""
+        return config_hash(cfg_hash, int(seed), int(invoice_index), artifact_type)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.root, key[:2], key)
+
+    def _entries(self) -> List[Tuple[str, int, float]]:
+        """Return (path, size, mtime) for every stored entry."""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if name.endswith(".tmp"):
+                    continue
+                path = os.path.join(dirpath, name)
+                try:
+                    st_info = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((path, st_info.st_size, st_info.st_mtime))
+        return entries
+
+    def contains(self, key: str) -> bool:
+        """True if key is cached (without reading it)."""
+        return os.path.exists(self._path(key))
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Return cached bytes for key, or None on a miss."""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            return None
+        try:
+            os.utime(path, None)  # mark as recently used for the next process's startup scan
+        except OSError:
+            pass
+        with self._lock:
+            if path in self._index:
+                self._index.move_to_end(path)
+            else:   # written by another process sharing the directory
+                self._index[path] = len(data)
+                self._total_bytes += len(data)
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        """Store bytes under key (atomically) and evict old entries if over budget."""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        try:
+            fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+        except OSError as e:
+            logging.error(f"Artifact cache write failed for {key}: {e}")
+            return
+        with self._lock:
+            # Rename and accounting together, so the index matches whichever write of a key lands last
+            try:
+                os.replace(tmp_path, path)
+            except OSError as e:
+                logging.error(f"Artifact cache write failed for {key}: {e}")
+                try:
+                    os.remove(tmp_path)
+                except OSError:
+                    pass
+                return
+            self._total_bytes += len(data) - self._index.pop(path, 0)
+            self._index[path] = len(data)
+            if self._total_bytes > self.max_bytes:
+                self._evict()
+
+    def get_or_create(self, key: str, factory: Callable[[], bytes]) -> Tuple[bytes, bool]:
+        """Return (data, was_cached), building and storing the artifact on a miss."""
+        data = self.get(key)
+        if data is not None:
+            return data, True
+        data = factory()
+        self.put(key, data)
+        return data, False
+
+    def _evict(self) -> None:
+        """Remove least recently used entries until the store is under the low-water mark (caller holds the lock)."""
+        target = int(self.max_bytes * CACHE_LOW_WATER)
+        while self._index and self._total_bytes > target:
+            path, size = self._index.popitem(last=False)
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                logging.error(f"Artifact cache eviction failed for {path}: {e}")  # no longer tracked
+            self._total_bytes -= size
+
+    def clear(self) -> None:
+        """Delete every cached artifact."""
+        with self._lock:
+            for path, _, _ in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._index.clear()
+            self._total_bytes = 0
+
+    @property
+    def size_bytes(self) -> int:
+        return self._total_bytes
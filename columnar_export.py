@@ -0,0 +1,162 @@
+"""Columnar (Parquet / Arrow IPC) export of generated line items, partitioned by profile, matter and period."""
+import datetime
+import io
+import os
+import time
+import urllib.parse
+import zipfile
+from typing import Any, Dict, List
+
+# --- Columnar export configuration ---
+COLUMNAR_FORMATS = {"parquet": ".parquet", "arrow": ".arrow"}
+COLUMNAR_FLUSH_ROWS = 250_000      # rows buffered across all partitions before part files are written
+COLUMNAR_COMPRESSION = "zstd"
+# Low-cardinality columns stored dictionary-encoded (int32 indices into a small string table)
+DICTIONARY_COLUMNS = (
+    "INVOICE_NUMBER", "CLIENT_ID", "LAW_FIRM_ID", "TIMEKEEPER_ID", "TIMEKEEPER_NAME",
+    "TIMEKEEPER_CLASSIFICATION", "TASK_CODE", "ACTIVITY_CODE", "EXPENSE_CODE",
+)
+# -------------------------------------
+
+
+def line_item_schema() -> Any:
+    """Arrow schema of exported line items; the partition keys live in the directory names."""
+    import pyarrow as pa
+    codes = pa.dictionary(pa.int32(), pa.string())
+    return pa.schema([
+        ("INVOICE_NUMBER", codes),
+        ("LINE_ITEM_NUMBER", pa.int32()),
+        ("LINE_ITEM_DATE", pa.date32()),
+        ("BILLING_START_DATE", pa.date32()),
+        ("BILLING_END_DATE", pa.date32()),
+        ("CLIENT_ID", codes),
+        ("LAW_FIRM_ID", codes),
+        ("TIMEKEEPER_ID", codes),
+        ("TIMEKEEPER_NAME", codes),
+        ("TIMEKEEPER_CLASSIFICATION", codes),
+        ("TASK_CODE", codes),
+        ("ACTIVITY_CODE", codes),
+        ("EXPENSE_CODE", codes),
+        ("DESCRIPTION", pa.string()),
+        ("HOURS", pa.float64()),
+        ("RATE", pa.float64()),
+        ("LINE_ITEM_TOTAL", pa.float64()),
+    ])
+
+
+def partition_path(profile: str, matter_number: str, billing_start: datetime.date, billing_end: datetime.date) -> str:
+    """Hive-style relative directory, e.g. profile=Onit%20ELM/matter=M1/period=2025-05-01_2025-05-31."""
+    quote = lambda value: urllib.parse.quote(str(value), safe="")
+    return os.path.join(f"profile={quote(profile)}", f"matter={quote(matter_number)}", f"period={billing_start:%Y-%m-%d}_{billing_end:%Y-%m-%d}")
+
+
+def rows_to_table(rows: List[Dict[str, Any]], invoice_number: str, billing_start: datetime.date, billing_end: datetime.date) -> Any:
+    """One invoice's rows as an Arrow table: built column by column, blank codes become nulls."""
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    schema = line_item_schema()
+    n = len(rows)
+    columns: Dict[str, Any] = {
+        "INVOICE_NUMBER": pa.array([invoice_number] * n).dictionary_encode(),
+        "LINE_ITEM_NUMBER": pa.array(range(1, n + 1), pa.int32()),
+        "LINE_ITEM_DATE": pc.cast(pa.array([r.get("LINE_ITEM_DATE") for r in rows], pa.string()), pa.date32()),
+        "BILLING_START_DATE": pa.array([billing_start] * n, pa.date32()),
+        "BILLING_END_DATE": pa.array([billing_end] * n, pa.date32()),
+        "DESCRIPTION": pa.array([r.get("DESCRIPTION") for r in rows], pa.string()),
+    }
+    for name in DICTIONARY_COLUMNS[1:]:
+        columns[name] = pa.array([r.get(name) or None for r in rows], pa.string()).dictionary_encode()
+    for name in ("HOURS", "RATE", "LINE_ITEM_TOTAL"):
+        columns[name] = pa.array([r.get(name) for r in rows], pa.float64())
+    return pa.Table.from_arrays([columns[f.name].cast(f.type) for f in schema], schema=schema)
+
+
+class LineItemExporter:
+    """
+    Buffers invoices per (profile, matter, period) partition and writes them as part files
+    under root. Memory is bounded by flush_rows, and each flush writes one file per touched
+    partition. Use it as a context manager, or call close().
+    """
+
+    def __init__(self, root: str, fmt: str = "parquet", flush_rows: int = COLUMNAR_FLUSH_ROWS):
+        if fmt not in COLUMNAR_FORMATS:
+            raise ValueError(f"Unknown columnar format '{fmt}' (expected one of {', '.join(COLUMNAR_FORMATS)})")
+        self.root = root
+        self.fmt = fmt
+        self.flush_rows = max(1, int(flush_rows))
+        self._buffers: Dict[str, List[Any]] = {}
+        self._buffered = 0
+        self._seq = 0
+        self._token = f"{time.time_ns():x}"  # keeps part names unique when runs share a root
+        self.files: List[str] = []
+        self.rows = 0
+        self.bytes = 0
+
+    def add_invoice(self, rows: List[Dict[str, Any]], profile: str, matter_number: str, invoice_number: str,
+                    billing_start: datetime.date, billing_end: datetime.date) -> None:
+        if not rows:
+            return
+        key = partition_path(profile, matter_number, billing_start, billing_end)
+        self._buffers.setdefault(key, []).append(rows_to_table(rows, invoice_number, billing_start, billing_end))
+        self._buffered += len(rows)
+        self.rows += len(rows)
+        if self._buffered >= self.flush_rows:
+            self.flush()
+
+    def _write(self, path: str, table: Any) -> None:
+        import pyarrow as pa
+        if self.fmt == "parquet":
+            import pyarrow.parquet as pq
+
+            pq.write_table(table, path, compression=COLUMNAR_COMPRESSION, use_dictionary=True)
+        else:
+            with pa.OSFile(path, "wb") as sink, pa.ipc.new_file(sink, table.schema,
+                                                               options=pa.ipc.IpcWriteOptions(compression=COLUMNAR_COMPRESSION)) as writer:
+                writer.write_table(table)
+
+    def flush(self) -> None:
+        import pyarrow as pa
+        for key, tables in self._buffers.items():
+            directory = os.path.join(self.root, key)
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"part-{self._token}-{self._seq:05d}{COLUMNAR_FORMATS[self.fmt]}")
+            # Dictionaries differ per invoice; unify them so the part file has one dictionary per column
+            self._write(path, pa.concat_tables(tables).unify_dictionaries().combine_chunks())
+            self._seq += 1
+            self.files.append(os.path.relpath(path, self.root))
+            self.bytes += os.path.getsize(path)
+        self._buffers.clear()
+        self._buffered = 0
+
+    def close(self) -> Dict[str, Any]:
+        """Write what is buffered and return {"format", "root", "files", "rows", "bytes"}."""
+        self.flush()
+        return {"format": self.fmt, "root": self.root, "files": list(self.files), "rows": self.rows, "bytes": self.bytes}
+
+    def __enter__(self) -> "LineItemExporter":
+        return self
+
+    def __exit__(self, *exc: Any) -> None:
+        self.close()
+
+
+def open_line_items(root: str, fmt: str = "parquet") -> Any:
+    """
+    A pyarrow Dataset over an export, with profile/matter/period as partition columns, e.g.
+    open_line_items(root).to_table(filter=pc.field("matter") == "M1").
+    """
+    import pyarrow.dataset as ds
+
+    return ds.dataset(root, format="ipc" if fmt == "arrow" else "parquet", partitioning="hive")
+
+
+def zip_export(root: str) -> bytes:
+    """The export directory as ZIP bytes; part files are already compressed, so entries are stored."""
+    buf = io.BytesIO()
+    with zipfile.ZipFile(buf, "w", zipfile.ZIP_STORED) as zf:
+        for directory, _, names in sorted(os.walk(root)):
+            for name in sorted(names):
+                path = os.path.join(directory, name)
+                zf.write(path, os.path.relpath(path, root))
+    return buf.getvalue()
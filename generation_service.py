@@ -0,0 +1,452 @@
+"""Local HTTP generation API: submit manifest jobs, poll their status and fetch artifacts (stdlib only)."""
+import argparse
+import concurrent.futures
+import dataclasses
+import json
+import logging
+import multiprocessing
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures.process import BrokenProcessPool
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlparse
+
+from columnar_export import COLUMNAR_FORMATS
+from ingest import TIMEKEEPER_COLUMNS
+from invoice_engine import PDF_COMPRESSION_MODES, GenerationSettings, PdfOutputOptions
+from ledes_validation import VALIDATION_MODES
+from manifest import load_manifest, plan_manifest, run_manifest
+from numbering import validate_pattern
+from run_catalog import RunCatalog, open_catalog
+from telemetry import LOG_FORMATS, METRICS, configure_logging, log_context, worker_initializer
+
+# --- Service configuration ---
+SERVICE_DEFAULT_HOST = "127.0.0.1"
+SERVICE_DEFAULT_PORT = 8765
+SERVICE_DEFAULT_WORKERS = max(1, min(4, os.cpu_count() or 1))
+SERVICE_MAX_QUEUED = 64                    # jobs waiting beyond the running ones; more are refused with 429
+SERVICE_MAX_JOB_INVOICES = 5000
+SERVICE_MAX_JOB_LINES = 2_000_000          # fees + expenses over every planned invoice; one oversized job would OOM a worker
+SERVICE_MAX_BODY_BYTES = 20 * 1024 * 1024
+SERVICE_KEEP_FINISHED = 200                # finished jobs (and their artifacts) kept before the oldest are purged
+SERVICE_MAX_WAIT_S = 60.0                  # cap for ?wait= long polls
+SERVICE_DEFAULT_ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".generation_jobs")
+# -----------------------------
+
+_JOB_PATH = re.compile(r"^/jobs/([0-9a-f]{32})$")
+_ARTIFACT_PATH = re.compile(r"^/jobs/([0-9a-f]{32})/artifacts/([A-Za-z0-9._-]+)$")
+_CONTENT_TYPES = {".zip": "application/zip", ".json": "application/json", ".csv": "text/csv", ".txt": "text/plain", ".pdf": "application/pdf"}
+
+
+class JobRejected(ValueError):
+    """A submission the service won't queue; `status` is the HTTP status to answer with."""
+
+    def __init__(self, message: str, status: int = HTTPStatus.BAD_REQUEST):
+        super().__init__(message)
+        self.status = status
+
+
+@dataclasses.dataclass
+class Job:
+    job_id: str
+    out_dir: str
+    invoices: int
+    submitted_at: float
+    status: str = "queued"                 # queued -> running -> done | failed | cancelled
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    summary: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
+    future: Optional[concurrent.futures.Future] = dataclasses.field(default=None, repr=False)
+
+    def artifacts(self) -> List[str]:
+        if self.status != "done" or not os.path.isdir(self.out_dir):
+            return []
+        return sorted(name for name in os.listdir(self.out_dir) if os.path.isfile(os.path.join(self.out_dir, name)))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.job_id,
+            "status": self.status,
+            "invoices": self.invoices,
+            "submitted_at": self.submitted_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "error": self.error,
+            "summary": self.summary,
+            "artifacts": self.artifacts(),
+        }
+
+
+def _run_job(entries: List[Dict[str, Any]], out_dir: str, timekeeper_data: Optional[List[Dict]],
+             settings: GenerationSettings, pdf_output: PdfOutputOptions, line_items_format: Optional[str] = None,
+             catalog: Optional[RunCatalog] = None, number_pattern: Optional[str] = None, validation: str = "warn") -> Dict[str, Any]:
+    """Worker entry point (module-level so it pickles): the same bulk path the app's manifest runner uses."""
+    with log_context(job_id=os.path.basename(out_dir)):
+        summary = run_manifest(entries, out_dir, timekeeper_data=timekeeper_data, settings=settings, pdf_output=pdf_output,
+                               line_items_format=line_items_format, catalog=catalog, number_pattern=number_pattern, validation=validation)
+    line_items = summary.pop("line_items", None)
+    if line_items:
+        # Artifacts are flat files, so the partitioned export is served as one archive
+        archive = shutil.make_archive(os.path.join(out_dir, f"line_items_{line_items_format}"), "zip", line_items["root"])
+        shutil.rmtree(line_items["root"], ignore_errors=True)
+        summary["line_items"] = {"format": line_items_format, "rows": line_items["rows"], "artifact": os.path.basename(archive)}
+    summary.pop("invoices_detail", None)  # already in run_summary.json / .csv
+    summary.pop("out_dir", None)
+    return summary
+
+
+def _parse_timekeepers(records: Any) -> List[Dict]:
+    if not isinstance(records, list) or not all(isinstance(r, dict) for r in records):
+        raise JobRejected("'timekeepers' must be a list of objects")
+    parsed = []
+    for n, record in enumerate(records, start=1):
+        missing = [c for c in TIMEKEEPER_COLUMNS if c not in record]
+        if missing:
+            raise JobRejected(f"timekeeper {n}: missing {', '.join(missing)}")
+        try:
+            parsed.append({**record, "RATE": float(record["RATE"])})
+        except (TypeError, ValueError):
+            raise JobRejected(f"timekeeper {n}: RATE must be a number")
+    return parsed
+
+
+def parse_job_payload(payload: Any, default_timekeepers: Optional[List[Dict]] = None
+                      ) -> Tuple[List[Dict[str, Any]], int, Optional[List[Dict]], GenerationSettings, PdfOutputOptions, Optional[str], Optional[str], str]:
+    """
+    Validate a job submission.
+
+    The payload is {"entries": [...], "defaults": {...}} in bulk-manifest form, plus
+    optional "timekeepers" (list of records), "settings" (GenerationSettings fields)
+    "pdf_output" (PdfOutputOptions fields), "line_items" ("parquet" or "arrow") and
+    "number_pattern" (persistent invoice numbering, e.g. "{base}-{seq}") and "validation"
+    ("warn", "block" or "off").
+    """
+    if not isinstance(payload, dict):
+        raise JobRejected("Request body must be a JSON object")
+    unknown = set(payload) - {"entries", "defaults", "timekeepers", "settings", "pdf_output", "line_items", "number_pattern", "validation"}
+    if unknown:
+        raise JobRejected(f"Unknown field(s): {', '.join(sorted(unknown))}")
+    try:
+        entries = load_manifest(json.dumps({"defaults": payload.get("defaults") or {}, "entries": payload.get("entries") or []}), "job.json")
+    except ValueError as e:
+        raise JobRejected(str(e))
+    jobs = plan_manifest(entries)
+    invoices = len(jobs)
+    if invoices > SERVICE_MAX_JOB_INVOICES:
+        raise JobRejected(f"Job plans {invoices} invoices; the limit is {SERVICE_MAX_JOB_INVOICES}", HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+    lines = sum(job["entry"]["fees"] + job["entry"]["expenses"] for job in jobs)
+    if lines > SERVICE_MAX_JOB_LINES:
+        raise JobRejected(f"Job plans {lines:,} line items; the limit is {SERVICE_MAX_JOB_LINES:,}", HTTPStatus.REQUEST_ENTITY_TOO_LARGE)
+
+    timekeepers = _parse_timekeepers(payload["timekeepers"]) if payload.get("timekeepers") else default_timekeepers
+    if not timekeepers and any(not e["timekeepers"] for e in entries):
+        raise JobRejected("Entries without a 'timekeepers' path need inline 'timekeepers' (the server has no default roster)")
+
+    settings = GenerationSettings.from_mapping(payload.get("settings") or {})
+    try:
+        pdf_output = PdfOutputOptions(**(payload.get("pdf_output") or {}))
+    except TypeError as e:
+        raise JobRejected(f"Invalid pdf_output: {e}")
+    if pdf_output.compression not in PDF_COMPRESSION_MODES:
+        raise JobRejected(f"pdf_output.compression must be one of {', '.join(PDF_COMPRESSION_MODES)}")
+    line_items_format = payload.get("line_items") or None
+    if line_items_format is not None and line_items_format not in COLUMNAR_FORMATS:
+        raise JobRejected(f"line_items must be one of {', '.join(COLUMNAR_FORMATS)}")
+    number_pattern = payload.get("number_pattern") or None
+    if number_pattern is not None:
+        try:
+            validate_pattern(str(number_pattern))
+        except ValueError as e:
+            raise JobRejected(str(e))
+    validation = payload.get("validation") or "warn"
+    if validation not in VALIDATION_MODES:
+        raise JobRejected(f"validation must be one of {', '.join(VALIDATION_MODES)}")
+    return entries, invoices, timekeepers, settings, pdf_output, line_items_format, number_pattern, validation
+
+
+class GenerationService:
+    """
+    Bounded job queue in front of a worker pool.
+
+    At most max_workers jobs run at once and max_queued more wait. Further submissions
+    are refused (HTTP 429), so callers back off instead of piling work onto the
+    server. Each job writes its bundles under root/<job_id>.
+    """
+
+    def __init__(self, root: str = SERVICE_DEFAULT_ROOT, max_workers: int = SERVICE_DEFAULT_WORKERS,
+                 max_queued: int = SERVICE_MAX_QUEUED, default_timekeepers: Optional[List[Dict]] = None,
+                 use_processes: bool = True, catalog: Optional[RunCatalog] = None):
+        self.root = root
+        self.catalog = catalog  # holds only a path, so it is shipped to worker processes as-is
+        self.max_workers = max(1, int(max_workers))
+        self.max_queued = max(0, int(max_queued))
+        self.default_timekeepers = default_timekeepers
+        self.use_processes = use_processes
+        self._jobs: Dict[str, Job] = {}
+        self._lock = threading.Lock()
+        os.makedirs(self.root, exist_ok=True)
+        if not use_processes:
+            # In-process jobs share this process (and its catalog connection) with the HTTP threads: one at a time
+            self.max_workers = 1
+        self._executor = self._make_executor()
+
+    def _make_executor(self) -> concurrent.futures.Executor:
+        if not self.use_processes:
+            return concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="generation-job")
+        # Workers log and report metrics through the parent's queue when telemetry is configured
+        initializer, initargs = worker_initializer()
+        return concurrent.futures.ProcessPoolExecutor(
+            max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn"),
+            initializer=initializer, initargs=initargs)
+
+    def _replace_broken_executor(self, broken: concurrent.futures.Executor) -> None:
+        """
+        A worker that dies (OOM, a crash in native code) breaks the whole process pool, failing
+        every job in it; start a fresh pool so later jobs run. Caller holds the lock.
+        """
+        if self._executor is not broken:
+            return  # already replaced
+        logging.error("Generation worker pool broke; starting a new one")
+        self._executor = self._make_executor()
+        broken.shutdown(wait=False, cancel_futures=True)
+
+    def _active(self) -> int:
+        return sum(1 for job in self._jobs.values() if job.status in ("queued", "running"))
+
+    def _refresh(self) -> None:
+        """Mark queued jobs whose future has been picked up as running. Caller holds the lock."""
+        for job in self._jobs.values():
+            if job.status == "queued" and job.future is not None and job.future.running():
+                job.status, job.started_at = "running", time.time()
+
+    def submit(self, payload: Any) -> Job:
+        """Validate and queue a job; raises JobRejected (400/413/429)."""
+        entries, invoices, timekeepers, settings, pdf_output, line_items_format, number_pattern, validation = parse_job_payload(payload, self.default_timekeepers)
+        with self._lock:
+            if self._active() >= self.max_workers + self.max_queued:
+                raise JobRejected("Generation queue is full; retry later", HTTPStatus.TOO_MANY_REQUESTS)
+            job_id = uuid.uuid4().hex
+            job = Job(job_id=job_id, out_dir=os.path.join(self.root, job_id), invoices=invoices, submitted_at=time.time())
+            self._jobs[job_id] = job
+            job_args = (_run_job, entries, job.out_dir, timekeepers, settings, pdf_output, line_items_format, self.catalog, number_pattern, validation)
+            try:
+                job.future = self._executor.submit(*job_args)
+            except BrokenProcessPool:
+                self._replace_broken_executor(self._executor)
+                job.future = self._executor.submit(*job_args)
+            executor = self._executor
+        job.future.add_done_callback(lambda future, job=job, executor=executor: self._finish(job, future, executor))
+        return job
+
+    def _finish(self, job: Job, future: concurrent.futures.Future, executor: Optional[concurrent.futures.Executor] = None) -> None:
+        with self._lock:
+            # Checked before the early return: a long-poll waiter may already have finished the job
+            if executor is not None and not future.cancelled() and isinstance(future.exception(), BrokenProcessPool):
+                self._replace_broken_executor(executor)
+            if job.finished_at is not None:
+                return
+            job.finished_at = time.time()
+            if future.cancelled():
+                job.status = "cancelled"
+            elif future.exception() is not None:
+                job.status, job.error = "failed", str(future.exception()) or type(future.exception()).__name__
+                logging.error(f"Generation job {job.job_id} failed: {job.error}")
+            else:
+                job.status, job.summary = "done", future.result()
+            self._purge()
+
+    def _purge(self) -> None:
+        """Drop the oldest finished jobs (and their files) beyond SERVICE_KEEP_FINISHED. Caller holds the lock."""
+        finished = sorted((j for j in self._jobs.values() if j.finished_at is not None), key=lambda j: j.finished_at)
+        for job in finished[:max(0, len(finished) - SERVICE_KEEP_FINISHED)]:
+            shutil.rmtree(job.out_dir, ignore_errors=True)
+            del self._jobs[job.job_id]
+
+    def get(self, job_id: str, wait: float = 0.0) -> Optional[Job]:
+        """Look up a job, optionally blocking up to `wait` seconds for it to finish."""
+        job = self._jobs.get(job_id)
+        if job is None:
+            return None
+        if wait > 0 and job.future is not None and not job.future.done():
+            concurrent.futures.wait([job.future], timeout=min(wait, SERVICE_MAX_WAIT_S))
+        if job.future is not None and job.future.done():
+            self._finish(job, job.future)  # waiters wake before done-callbacks run
+        with self._lock:
+            self._refresh()
+        return job
+
+    def jobs(self) -> List[Job]:
+        with self._lock:
+            self._refresh()
+            return sorted(self._jobs.values(), key=lambda j: j.submitted_at)
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a job that hasn't started. Returns False if it is unknown or already running."""
+        job = self._jobs.get(job_id)
+        return bool(job and job.future and job.future.cancel())
+
+    def artifact_path(self, job_id: str, name: str) -> Optional[str]:
+        job = self._jobs.get(job_id)
+        if job is None or name not in job.artifacts():
+            return None
+        return os.path.join(job.out_dir, name)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            self._refresh()
+            counts: Dict[str, int] = {}
+            for job in self._jobs.values():
+                counts[job.status] = counts.get(job.status, 0) + 1
+        return {"workers": self.max_workers, "capacity": self.max_workers + self.max_queued, "jobs": counts}
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._executor.shutdown(wait=wait, cancel_futures=True)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """Routes: POST /jobs, GET /jobs, GET /jobs/<id>[?wait=s], DELETE /jobs/<id>, GET /jobs/<id>/artifacts/<name>, GET /health, GET /metrics."""
+    server_version = "InvoiceGenerationService/1.0"
+
+    @property
+    def service(self) -> GenerationService:
+        return self.server.service  # type: ignore[attr-defined]
+
+    def log_message(self, format: str, *args: Any) -> None:
+        logging.info(f"{self.address_string()} {format % args}")
+
+    def _send_json(self, status: int, body: Any, headers: Optional[Dict[str, str]] = None) -> None:
+        data = json.dumps(body, default=str).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _error(self, status: int, message: str, headers: Optional[Dict[str, str]] = None) -> None:
+        self._send_json(status, {"error": message}, headers)
+
+    def do_POST(self) -> None:
+        if urlparse(self.path).path != "/jobs":
+            return self._error(HTTPStatus.NOT_FOUND, "Not found")
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+        except ValueError:
+            length = -1
+        if length < 0:
+            return self._error(HTTPStatus.BAD_REQUEST, "Content-Length must be a non-negative integer")
+        if length > SERVICE_MAX_BODY_BYTES:
+            return self._error(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Body exceeds {SERVICE_MAX_BODY_BYTES} bytes")
+        try:
+            payload = json.loads(self.rfile.read(length) or b"{}")
+        except ValueError as e:
+            return self._error(HTTPStatus.BAD_REQUEST, f"Invalid JSON: {e}")
+        try:
+            job = self.service.submit(payload)
+        except JobRejected as e:
+            headers = {"Retry-After": "5"} if e.status == HTTPStatus.TOO_MANY_REQUESTS else None
+            return self._error(e.status, str(e), headers)
+        self._send_json(HTTPStatus.ACCEPTED, job.to_dict(), {"Location": f"/jobs/{job.job_id}"})
+
+    def do_GET(self) -> None:
+        url = urlparse(self.path)
+        if url.path == "/health":
+            return self._send_json(HTTPStatus.OK, self.service.stats())
+        if url.path == "/metrics":
+            data = METRICS.render().encode("utf-8")
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+            return
+        if url.path == "/jobs":
+            return self._send_json(HTTPStatus.OK, [job.to_dict() for job in self.service.jobs()])
+        match = _JOB_PATH.match(url.path)
+        if match:
+            try:
+                wait = float(parse_qs(url.query).get("wait", ["0"])[0])
+            except ValueError:
+                return self._error(HTTPStatus.BAD_REQUEST, "wait must be a number of seconds")
+            job = self.service.get(match.group(1), wait=wait)
+            if job is None:
+                return self._error(HTTPStatus.NOT_FOUND, "Unknown job")
+            return self._send_json(HTTPStatus.OK, job.to_dict())
+        match = _ARTIFACT_PATH.match(url.path)
+        if match:
+            path = self.service.artifact_path(match.group(1), match.group(2))
+            if path is None:
+                return self._error(HTTPStatus.NOT_FOUND, "Unknown job or artifact (is the job done?)")
+            self.send_response(HTTPStatus.OK)
+            self.send_header("Content-Type", _CONTENT_TYPES.get(os.path.splitext(path)[1], "application/octet-stream"))
+            self.send_header("Content-Length", str(os.path.getsize(path)))
+            self.send_header("Content-Disposition", f'attachment; filename="{match.group(2)}"')
+            self.end_headers()
+            with open(path, "rb") as f:
+                shutil.copyfileobj(f, self.wfile)
+            return
+        self._error(HTTPStatus.NOT_FOUND, "Not found")
+
+    def do_DELETE(self) -> None:
+        match = _JOB_PATH.match(urlparse(self.path).path)
+        if not match:
+            return self._error(HTTPStatus.NOT_FOUND, "Not found")
+        if not self.service.cancel(match.group(1)):
+            return self._error(HTTPStatus.CONFLICT, "Job is unknown, running or finished")
+        self._send_json(HTTPStatus.OK, {"job_id": match.group(1), "status": "cancelled"})
+
+
+def make_server(service: GenerationService, host: str = SERVICE_DEFAULT_HOST, port: int = SERVICE_DEFAULT_PORT) -> ThreadingHTTPServer:
+    """HTTP server bound to host:port (port 0 picks a free one). Each request is handled on its own thread."""
+    server = ThreadingHTTPServer((host, port), _Handler)
+    server.daemon_threads = True
+    server.service = service  # type: ignore[attr-defined]
+    return server
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Serve invoice generation jobs over HTTP.")
+    parser.add_argument("--host", default=SERVICE_DEFAULT_HOST, help="Bind address (keep it local: job entries may name server-side files)")
+    parser.add_argument("--port", type=int, default=SERVICE_DEFAULT_PORT)
+    parser.add_argument("--workers", type=int, default=SERVICE_DEFAULT_WORKERS, help="Jobs generated concurrently (worker processes)")
+    parser.add_argument("--max-queued", type=int, default=SERVICE_MAX_QUEUED, help="Jobs allowed to wait before submissions get 429")
+    parser.add_argument("--root", default=SERVICE_DEFAULT_ROOT, help="Directory for job artifacts")
+    parser.add_argument("--timekeepers", help="Default timekeeper CSV for jobs that don't send their own")
+    parser.add_argument("--catalog", nargs="?", const="", help="Record jobs in the SQLite run catalog (optionally at this path)")
+    parser.add_argument("--in-process", action="store_true", help="Run jobs one at a time in this process instead of in worker processes")
+    parser.add_argument("--log-format", choices=sorted(LOG_FORMATS), default="text", help="Log as plain text or JSON lines (with run and invoice ids)")
+    args = parser.parse_args(argv)
+    configure_logging(logging.INFO, args.log_format)
+
+    default_timekeepers = None
+    if args.timekeepers:
+        from ingest import load_timekeeper_records
+        default_timekeepers = load_timekeeper_records(args.timekeepers)
+
+    catalog = None
+    if args.catalog is not None:
+        catalog = open_catalog(args.catalog or None)
+
+    service = GenerationService(args.root, args.workers, args.max_queued, default_timekeepers, use_processes=not args.in_process, catalog=catalog)
+    server = make_server(service, args.host, args.port)
+    logging.info(f"Generation service on http://{args.host}:{server.server_address[1]} with {service.max_workers} worker(s)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        service.shutdown(wait=False)
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
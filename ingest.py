@@ -0,0 +1,207 @@
+"""Chunked, schema-validated CSV ingest for timekeeper and custom task/activity uploads."""
+import dataclasses
+import hashlib
+import logging
+import re
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from artifact_cache import config_hash
+
+# --- Ingest configuration ---
+INGEST_CHUNK_ROWS = 100_000   # rows parsed per chunk; bounds peak memory on 100MB+ uploads
+MAX_REPORTED_ERRORS = 500     # per-row errors kept for display (all are counted)
+TIMEKEEPER_COLUMNS = ["TIMEKEEPER_NAME", "TIMEKEEPER_CLASSIFICATION", "TIMEKEEPER_ID", "RATE"]
+TIMEKEEPER_OPTIONAL_COLUMNS = ["EFFECTIVE_DATE"]
+TASK_COLUMNS = ["TASK_CODE", "ACTIVITY_CODE", "DESCRIPTION"]
+UTBMS_CODE_PATTERN = r"^[A-Z]\d{3}$"  # e.g. L110, A101
+MAX_RATE = 100_000.0
+# ----------------------------
+
+
+class IngestError(ValueError):
+    """The upload can't be ingested at all (unreadable, or required columns missing)."""
+
+
+@dataclasses.dataclass
+class IngestResult:
+    """Validated records plus a per-row error report (line numbers are 1-based file lines)."""
+    records: List[Any]
+    errors: List[Tuple[int, str]]
+    error_count: int = 0
+    duplicates: int = 0
+    rows_read: int = 0
+    digest: str = ""
+
+    def summary(self) -> str:
+        parts = [f"{len(self.records):,} loaded"]
+        if self.error_count:
+            parts.append(f"{self.error_count:,} rejected")
+        if self.duplicates:
+            parts.append(f"{self.duplicates:,} duplicate(s) dropped")
+        return f"{self.rows_read:,} rows read: " + ", ".join(parts)
+
+
+def _iter_chunks(source: Any, required: List[str], optional: List[str], chunk_rows: int,
+                 categorical: Tuple[str, ...] = ()) -> Iterator[Tuple[int, pd.DataFrame]]:
+    """
+    Yield (first_line_no, chunk) with wanted columns read as str (or category, for
+    low-cardinality code columns).
+
+    The header is read first so dtypes can be keyed by the raw (possibly padded) names;
+    the rows are then read in a single streaming pass and unused columns are never
+    materialised. Line numbers assume one record per line; the header is line 1.
+    """
+    wanted = set(required) | set(optional)
+    try:
+        if hasattr(source, "seek"):
+            source.seek(0)
+        header = pd.read_csv(source, nrows=0, skipinitialspace=True).columns
+        if hasattr(source, "seek"):
+            source.seek(0)
+        dtypes = {c: ("category" if str(c).strip() in categorical else str) for c in header if str(c).strip() in wanted}
+        reader = pd.read_csv(
+            source, dtype=dtypes, keep_default_na=False, chunksize=chunk_rows,
+            usecols=list(dtypes), skipinitialspace=True,
+        )
+        line_no = 2
+        for chunk in reader:
+            chunk.columns = [str(c).strip() for c in chunk.columns]
+            missing = [c for c in required if c not in chunk.columns]
+            if missing:
+                raise IngestError(f"CSV must contain the following columns: {', '.join(required)} (missing: {', '.join(missing)})")
+            yield line_no, chunk
+            line_no += len(chunk)
+    except pd.errors.EmptyDataError:
+        raise IngestError("CSV file is empty.")
+    except (pd.errors.ParserError, UnicodeDecodeError) as e:
+        raise IngestError(f"CSV could not be parsed: {e}")
+
+
+def _collect_errors(result: IngestResult, line_nos: pd.Series, mask: Any, message: str) -> None:
+    """Record `message` for every row where mask is True (vectorized; only the first few are kept)."""
+    count = int(mask.sum())
+    if not count:
+        return
+    result.error_count += count
+    room = MAX_REPORTED_ERRORS - len(result.errors)
+    if room > 0:
+        result.errors.extend((int(n), message) for n in line_nos[mask].head(room))
+
+
+def _drop_duplicates(result: IngestResult, chunk: pd.DataFrame, keys: List[str], seen: set, digest: Optional[Any] = None) -> pd.DataFrame:
+    """
+    Drop rows whose key repeats within the chunk or was seen in an earlier chunk.
+    If `digest` (a hashlib object) is given, the kept rows' key hashes are fed into it.
+    """
+    # Rows are hashed to 64-bit ints in C; `seen` then holds one int per row, not the row text
+    hashes = pd.util.hash_pandas_object(chunk[keys], index=False).to_numpy()
+    dup = np.zeros(len(hashes), dtype=bool)
+    for k, h in enumerate(hashes.tolist()):
+        if h in seen:
+            dup[k] = True
+        else:
+            seen.add(h)
+    result.duplicates += int(dup.sum())
+    if digest is not None:
+        digest.update(hashes[~dup].tobytes())
+    return chunk[~dup]
+
+
+def _normalize_codes(column: pd.Series) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Strip and upper-case a categorical code column, then check it against
+    UTBMS_CODE_PATTERN. The work is done once per distinct code, not once per row.
+    Returns (values, invalid mask).
+    """
+    pattern = re.compile(UTBMS_CODE_PATTERN)
+    categories = [str(c).strip().upper() for c in column.cat.categories] + [""]
+    values = np.array(categories, dtype=object)[column.cat.codes.to_numpy()]  # code -1 (blank) -> ""
+    valid = np.array([bool(pattern.match(c)) for c in categories])
+    return values, ~valid[column.cat.codes.to_numpy()]
+
+
+def ingest_timekeepers(source: Any, chunk_rows: int = INGEST_CHUNK_ROWS) -> IngestResult:
+    """
+    Read a timekeeper CSV in chunks. Rejected rows: blank name or ID, non-numeric,
+    negative or absurd RATE, unparseable EFFECTIVE_DATE. Repeated (ID, EFFECTIVE_DATE)
+    pairs keep their first row; one ID with several dates becomes a rate schedule.
+    """
+    result = IngestResult(records=[], errors=[])
+    seen: set = set()
+    for first_line, chunk in _iter_chunks(source, TIMEKEEPER_COLUMNS, TIMEKEEPER_OPTIONAL_COLUMNS, chunk_rows):
+        result.rows_read += len(chunk)
+        line_nos = pd.Series(range(first_line, first_line + len(chunk)), index=chunk.index)
+        chunk = chunk.apply(lambda col: col.str.strip())
+        rates = pd.to_numeric(chunk["RATE"].str.replace(r"[$,]", "", regex=True), errors="coerce")
+
+        bad_name = chunk["TIMEKEEPER_NAME"] == ""
+        bad_id = chunk["TIMEKEEPER_ID"] == ""
+        bad_rate = rates.isna() | (rates < 0) | (rates > MAX_RATE)
+        _collect_errors(result, line_nos, bad_name, "TIMEKEEPER_NAME is blank")
+        _collect_errors(result, line_nos, bad_id & ~bad_name, "TIMEKEEPER_ID is blank")
+        _collect_errors(result, line_nos, bad_rate & ~bad_name & ~bad_id, f"RATE must be a number between 0 and {MAX_RATE:,.0f}")
+        valid = ~(bad_name | bad_id | bad_rate)
+
+        if "EFFECTIVE_DATE" in chunk.columns:
+            dates = pd.to_datetime(chunk["EFFECTIVE_DATE"], format="%Y-%m-%d", errors="coerce")
+            bad_date = (chunk["EFFECTIVE_DATE"] != "") & dates.isna()
+            _collect_errors(result, line_nos, bad_date & valid, "EFFECTIVE_DATE must be YYYY-MM-DD")
+            valid &= ~bad_date
+
+        columns = TIMEKEEPER_COLUMNS + [c for c in TIMEKEEPER_OPTIONAL_COLUMNS if c in chunk.columns]
+        chunk = chunk[valid].assign(RATE=rates[valid].astype(float))
+        chunk = _drop_duplicates(result, chunk, ["TIMEKEEPER_ID"] + columns[len(TIMEKEEPER_COLUMNS):], seen)
+        result.records.extend(chunk[columns].to_dict(orient="records"))
+    result.errors.sort()
+    result.digest = config_hash(result.records)
+    return result
+
+
+def ingest_task_activity(source: Any, chunk_rows: int = INGEST_CHUNK_ROWS) -> IngestResult:
+    """
+    Read a custom task/activity CSV in chunks into (task, activity, description) tuples.
+    Codes are upper-cased and must match UTBMS_CODE_PATTERN. Descriptions must be
+    non-blank. Exact repeats are dropped.
+    """
+    result = IngestResult(records=[], errors=[])
+    seen: set = set()
+    digest = hashlib.sha256()
+    for first_line, chunk in _iter_chunks(source, TASK_COLUMNS, [], chunk_rows, categorical=("TASK_CODE", "ACTIVITY_CODE")):
+        result.rows_read += len(chunk)
+        line_nos = pd.Series(range(first_line, first_line + len(chunk)), index=chunk.index)
+        tasks, bad_task = _normalize_codes(chunk["TASK_CODE"])
+        activities, bad_activity = _normalize_codes(chunk["ACTIVITY_CODE"])
+        # Leading blanks are dropped by the parser; trailing ones are harmless in descriptions
+        descriptions = chunk["DESCRIPTION"].to_numpy()
+        bad_desc = descriptions == ""
+        _collect_errors(result, line_nos, bad_task, "TASK_CODE must look like a UTBMS code (e.g. L110)")
+        _collect_errors(result, line_nos, bad_activity & ~bad_task, "ACTIVITY_CODE must look like a UTBMS code (e.g. A101)")
+        _collect_errors(result, line_nos, bad_desc & ~bad_task & ~bad_activity, "DESCRIPTION is blank")
+        valid = ~(bad_task | bad_activity | bad_desc)
+
+        chunk = pd.DataFrame({"TASK_CODE": tasks, "ACTIVITY_CODE": activities, "DESCRIPTION": descriptions}, index=chunk.index)[valid]
+        chunk = _drop_duplicates(result, chunk, TASK_COLUMNS, seen, digest)
+        result.records.extend(zip(chunk["TASK_CODE"], chunk["ACTIVITY_CODE"], chunk["DESCRIPTION"]))
+    result.errors.sort()
+    result.digest = digest.hexdigest()  # every kept row is fully hashed by the dedupe pass
+    return result
+
+
+def load_timekeeper_records(path: str) -> List[Dict]:
+    """Headless helper: ingest a timekeeper CSV path, logging rejected rows."""
+    result = ingest_timekeepers(path)
+    for line_no, message in result.errors:
+        logging.error(f"{path} line {line_no}: {message}")
+    return result.records
+
+
+def format_errors(result: IngestResult, limit: Optional[int] = 20) -> str:
+    """Markdown list of the first `limit` row errors."""
+    shown = result.errors[:limit] if limit else result.errors
+    lines = [f"- line {line_no}: {message}" for line_no, message in shown]
+    if result.error_count > len(shown):
+        lines.append(f"- ... and {result.error_count - len(shown):,} more")
+    return "\n".join(lines)
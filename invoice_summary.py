@@ -0,0 +1,110 @@
+"""Single-pass invoice aggregates shared by the PDF, LEDES, preview and sidecar outputs."""
+import csv
+import io
+import json
+from typing import Any, Dict, Iterable
+
+SUMMARY_CSV_FIELDS = ["dimension", "key", "lines", "hours", "amount"]
+
+
+def _bucket(table: Dict[str, Dict[str, float]], key: str) -> Dict[str, float]:
+    entry = table.get(key)
+    if entry is None:
+        entry = table[key] = {"lines": 0, "hours": 0.0, "amount": 0.0}
+    return entry
+
+
+def summarize_invoice(rows: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Aggregate an invoice's rows in one pass.
+
+    Returns a JSON-serialisable record with fee/expense totals and breakdowns by
+    timekeeper, task code, expense code and day, plus hours per timekeeper-day.
+    Expense "hours" are units, as in LEDES. Amounts are rounded once, at the end.
+    """
+    fees_total = expenses_total = hours_total = 0.0
+    fee_lines = expense_lines = 0
+    by_timekeeper: Dict[str, Dict[str, Any]] = {}
+    by_task: Dict[str, Dict[str, float]] = {}
+    by_expense: Dict[str, Dict[str, float]] = {}
+    by_day: Dict[str, Dict[str, float]] = {}
+    tk_day_hours: Dict[str, Dict[str, float]] = {}
+
+    for row in rows:
+        amount = float(row.get("LINE_ITEM_TOTAL") or 0.0)
+        units = float(row.get("HOURS") or 0.0)
+        day = str(row.get("LINE_ITEM_DATE", ""))
+        day_entry = by_day.get(day)
+        if day_entry is None:
+            day_entry = by_day[day] = {"fees": 0.0, "expenses": 0.0, "hours": 0.0}
+        code = row.get("EXPENSE_CODE")
+        if code and code == code:  # NaN (from DataFrame-sourced rows) is a fee line
+            expense_lines += 1
+            expenses_total += amount
+            day_entry["expenses"] += amount
+            entry = _bucket(by_expense, str(code))
+        else:
+            fee_lines += 1
+            fees_total += amount
+            hours_total += units
+            day_entry["fees"] += amount
+            day_entry["hours"] += units
+            name = str(row.get("TIMEKEEPER_NAME", ""))
+            tk = by_timekeeper.get(name)
+            if tk is None:
+                tk = by_timekeeper[name] = {
+                    "id": str(row.get("TIMEKEEPER_ID", "")),
+                    "classification": str(row.get("TIMEKEEPER_CLASSIFICATION", "")),
+                    "lines": 0, "hours": 0.0, "amount": 0.0,
+                }
+            tk["lines"] += 1
+            tk["hours"] += units
+            tk["amount"] += amount
+            days = tk_day_hours.setdefault(tk["id"] or name, {})
+            days[day] = days.get(day, 0.0) + units
+            entry = _bucket(by_task, str(row.get("TASK_CODE", "")))
+        entry["lines"] += 1
+        entry["hours"] += units
+        entry["amount"] += amount
+
+    def _rounded(table: Dict[str, Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        return {k: {f: round(v, 2) if isinstance(v, float) else v for f, v in e.items()} for k, e in sorted(table.items())}
+
+    return {
+        "lines": fee_lines + expense_lines,
+        "fee_lines": fee_lines,
+        "expense_lines": expense_lines,
+        "hours": round(hours_total, 2),
+        "fees_total": round(fees_total, 2),
+        "expenses_total": round(expenses_total, 2),
+        "total": round(fees_total + expenses_total, 2),
+        "by_timekeeper": _rounded(by_timekeeper),
+        "by_task_code": _rounded(by_task),
+        "by_expense_code": _rounded(by_expense),
+        "by_day": _rounded(by_day),
+        "hours_by_timekeeper_day": {tk: {d: round(h, 2) for d, h in sorted(days.items())} for tk, days in sorted(tk_day_hours.items())},
+    }
+
+
+def summary_to_json(summary: Dict[str, Any], **extra: Any) -> str:
+    """Sidecar JSON; `extra` (e.g. invoice_number, period) is merged in at the top level."""
+    return json.dumps({**extra, **summary}, indent=2)
+
+
+def summary_to_csv(summary: Dict[str, Any]) -> str:
+    """Sidecar CSV: one row per (dimension, key), with lines, hours/units and amount."""
+    out = io.StringIO()
+    writer = csv.writer(out, lineterminator="\n")
+    writer.writerow(SUMMARY_CSV_FIELDS)
+    writer.writerow(["invoice", "fees", summary["fee_lines"], summary["hours"], summary["fees_total"]])
+    writer.writerow(["invoice", "expenses", summary["expense_lines"], "", summary["expenses_total"]])
+    writer.writerow(["invoice", "total", summary["lines"], summary["hours"], summary["total"]])
+    for dimension in ("by_timekeeper", "by_task_code", "by_expense_code"):
+        for key, entry in summary[dimension].items():
+            writer.writerow([dimension[3:], key, entry["lines"], entry["hours"], entry["amount"]])
+    for day, entry in summary["by_day"].items():
+        writer.writerow(["day", day, "", entry["hours"], round(entry["fees"] + entry["expenses"], 2)])
+    for tk, days in summary["hours_by_timekeeper_day"].items():
+        for day, hours in days.items():
+            writer.writerow(["timekeeper_day", f"{tk}|{day}", "", hours, ""])
+    return out.getvalue()
@@ -0,0 +1,212 @@
+"""Run-level validation of generated invoices against e-billing (LEDES/UTBMS) rules, vectorised with numpy."""
+import csv
+import dataclasses
+import datetime
+import io
+import os
+import re
+from typing import TYPE_CHECKING, Any, Dict, Iterable, List, NamedTuple, Optional, Sequence, Tuple
+
+from invoice_engine import CONFIG
+
+if TYPE_CHECKING:
+    import numpy as np
+
+# --- Validation rules ---
+# name -> (severity, description). "error" rules block delivery when blocking is on.
+VALIDATION_RULES: Dict[str, Tuple[str, str]] = {
+    "daily_hours": ("error", "Timekeeper bills more than the daily maximum on one day"),
+    "line_totals": ("error", "Line total is not units x rate"),
+    "invoice_total": ("error", "Line totals do not add up to the invoice total"),
+    "utbms_codes": ("error", "Missing or invalid UTBMS task, activity or expense code"),
+    "billing_period": ("error", "Line date is missing or outside the billing period"),
+    "missing_timekeeper": ("error", "Fee line has no timekeeper ID"),
+    "zero_amount": ("warning", "Line has zero or negative units or amount"),
+    "description_pipe": ("warning", "Description contains '|' (rewritten as ' - ' in LEDES)"),
+    "mandatory_skipped": ("warning", "Mandatory item skipped because its timekeeper is not in the roster"),
+}
+VALIDATION_MODES = {"warn": "Report only", "block": "Block delivery on errors", "off": "Off"}
+MAX_REPORTED_LINES = 10  # line numbers listed per violation in reports; counts are always complete
+# ------------------------
+
+
+@dataclasses.dataclass(frozen=True)
+class ValidationRules:
+    """Which rules run and their limits; frozen and hashable like GenerationSettings."""
+    enabled: Tuple[str, ...] = tuple(VALIDATION_RULES)
+    max_daily_hours: float = 16.0
+    line_tolerance: float = 0.05        # cents of rounding drift allowed per line (block-billed lines sum rounded lines)
+    total_tolerance: float = 0.01
+    task_code_pattern: str = r"L\d{3}"
+    activity_code_pattern: str = r"A\d{3}"
+    expense_codes: Tuple[str, ...] = tuple(sorted(set(CONFIG['EXPENSE_CODES'].values())))
+
+
+DEFAULT_VALIDATION_RULES = ValidationRules()
+
+
+class Violation(NamedTuple):
+    """One rule broken by one invoice; `lines` holds every offending 1-based LEDES line number."""
+    rule: str
+    severity: str
+    invoice_number: str
+    lines: Tuple[int, ...]
+    message: str
+
+
+def _column(rows: Sequence[Dict[str, Any]], name: str) -> "np.ndarray":
+    import numpy as np
+
+    # NaN (DataFrame-sourced rows) and None become ""
+    return np.array(["" if v is None or v != v else str(v) for v in (row.get(name) for row in rows)], dtype=str)
+
+
+def _numbers(rows: Sequence[Dict[str, Any]], name: str) -> "np.ndarray":
+    import numpy as np
+
+    values = np.fromiter((row.get(name) or 0.0 for row in rows), dtype=np.float64, count=len(rows))
+    return np.nan_to_num(values)
+
+
+def _unique_mask(values: "np.ndarray", predicate) -> "np.ndarray":
+    """Evaluate predicate once per distinct value and broadcast it back to every row."""
+    import numpy as np
+
+    uniques, inverse = np.unique(values, return_inverse=True)
+    return np.array([bool(predicate(u)) for u in uniques], dtype=bool)[inverse] if len(values) else np.zeros(0, dtype=bool)
+
+
+def _lines(mask: "np.ndarray") -> Tuple[int, ...]:
+    import numpy as np
+
+    return tuple(int(i) + 1 for i in np.flatnonzero(mask))
+
+
+def _is_date(value: str) -> bool:
+    try:
+        datetime.date.fromisoformat(value)
+    except ValueError:
+        return False
+    return True
+
+
+def validate_invoice(rows: Sequence[Dict[str, Any]], invoice_number: str, billing_start: datetime.date, billing_end: datetime.date,
+                     invoice_total: Optional[float] = None, skipped_mandatory: Iterable[str] = (),
+                     rules: ValidationRules = DEFAULT_VALIDATION_RULES) -> List[Violation]:
+    """
+    Check one invoice's rows against the enabled rules. Each rule is evaluated over whole
+    columns at once, so cost is a few passes over the rows regardless of the rule count.
+    """
+    import numpy as np
+
+    enabled = set(rules.enabled)
+    found: List[Violation] = []
+
+    def _add(rule: str, lines: Tuple[int, ...], message: str) -> None:
+        found.append(Violation(rule, VALIDATION_RULES[rule][0], invoice_number, lines, message))
+
+    def _add_mask(rule: str, bad: "np.ndarray", message: str) -> None:
+        if bad.any():
+            _add(rule, _lines(bad), message.format(count=int(bad.sum())))
+
+    if "mandatory_skipped" in enabled:
+        skipped = list(skipped_mandatory)
+        if skipped:
+            _add("mandatory_skipped", (), f"Skipped: {', '.join(skipped)}")
+    if not rows:
+        return found
+
+    expense_code = _column(rows, "EXPENSE_CODE")
+    is_expense = expense_code != ""
+    is_fee = ~is_expense
+    units, rate, total = _numbers(rows, "HOURS"), _numbers(rows, "RATE"), _numbers(rows, "LINE_ITEM_TOTAL")
+    dates = _column(rows, "LINE_ITEM_DATE")
+    timekeeper = _column(rows, "TIMEKEEPER_ID")
+
+    if "line_totals" in enabled:
+        bad = np.abs(units * rate - total) > rules.line_tolerance + 1e-9
+        _add_mask("line_totals", bad, "{count} line(s) where units x rate differs from the line total")
+
+    if "invoice_total" in enabled and invoice_total is not None:
+        line_sum = float(total.sum())
+        if abs(line_sum - float(invoice_total)) > rules.total_tolerance + 1e-9:
+            _add("invoice_total", (), f"Lines sum to {line_sum:,.2f} but the invoice total is {float(invoice_total):,.2f}")
+
+    if "utbms_codes" in enabled:
+        task_ok = _unique_mask(_column(rows, "TASK_CODE"), re.compile(rules.task_code_pattern).fullmatch)
+        activity_ok = _unique_mask(_column(rows, "ACTIVITY_CODE"), re.compile(rules.activity_code_pattern).fullmatch)
+        expense_ok = np.isin(expense_code, np.array(rules.expense_codes, dtype=str))
+        bad = (is_fee & ~(task_ok & activity_ok)) | (is_expense & ~expense_ok)
+        _add_mask("utbms_codes", bad, "{count} line(s) with a missing or invalid UTBMS code")
+
+    if "billing_period" in enabled:
+        # ISO dates compare correctly as strings; unparseable dates are checked once per distinct value
+        bad = ~_unique_mask(dates, _is_date) | (dates < billing_start.isoformat()) | (dates > billing_end.isoformat())
+        _add_mask("billing_period", bad, f"{{count}} line(s) dated outside {billing_start} to {billing_end}")
+
+    if "missing_timekeeper" in enabled:
+        bad = is_fee & (timekeeper == "")
+        _add_mask("missing_timekeeper", bad, "{count} fee line(s) without a timekeeper ID")
+
+    if "daily_hours" in enabled and is_fee.any():
+        keys = np.char.add(np.char.add(timekeeper, "|"), dates)
+        groups, inverse = np.unique(keys, return_inverse=True)
+        hours_per_day = np.bincount(inverse, weights=np.where(is_fee, units, 0.0), minlength=len(groups))
+        over = hours_per_day > rules.max_daily_hours + 1e-9
+        if over.any():
+            worst = int(np.argmax(hours_per_day))
+            _add("daily_hours", _lines(is_fee & over[inverse]),
+                 f"{int(over.sum())} timekeeper-day(s) over {rules.max_daily_hours:g}h (worst {groups[worst]}: {hours_per_day[worst]:.1f}h)")
+
+    if "zero_amount" in enabled:
+        bad = (units <= 0) | (total <= 0)
+        _add_mask("zero_amount", bad, "{count} line(s) with zero or negative units/amount")
+
+    if "description_pipe" in enabled:
+        bad = np.char.find(_column(rows, "DESCRIPTION"), "|") >= 0
+        _add_mask("description_pipe", bad, "{count} description(s) containing '|'")
+
+    return found
+
+
+def has_errors(violations: Iterable[Violation]) -> bool:
+    return any(v.severity == "error" for v in violations)
+
+
+def violations_report(violations: Sequence[Violation]) -> List[Dict[str, Any]]:
+    """Compact report rows: one per (rule, invoice), with the line count and the first few line numbers."""
+    report = []
+    for v in sorted(violations, key=lambda v: (v.severity != "error", v.rule, v.invoice_number)):
+        shown = ", ".join(map(str, v.lines[:MAX_REPORTED_LINES])) + (" ..." if len(v.lines) > MAX_REPORTED_LINES else "")
+        report.append({
+            "severity": v.severity, "rule": v.rule, "invoice_number": v.invoice_number,
+            "lines": len(v.lines), "line_numbers": shown, "message": v.message,
+        })
+    return report
+
+
+def violations_to_csv(violations: Sequence[Violation]) -> str:
+    out = io.StringIO()
+    writer = csv.DictWriter(out, ["severity", "rule", "invoice_number", "lines", "line_numbers", "message"], lineterminator="\n")
+    writer.writeheader()
+    writer.writerows(violations_report(violations))
+    return out.getvalue()
+
+
+def discard_partial_output(root: str, names: Iterable[str]) -> None:
+    """Remove the files a blocked run already wrote under root, so nothing half-delivered is left behind."""
+    directories = set()
+    for name in names:
+        try:
+            os.remove(os.path.join(root, name))
+        except FileNotFoundError:
+            pass
+        parent = os.path.dirname(name)
+        while parent:
+            directories.add(parent)
+            parent = os.path.dirname(parent)
+    for directory in sorted(directories, key=len, reverse=True):
+        try:
+            os.rmdir(os.path.join(root, directory))
+        except OSError:
+            pass  # still holds files from an earlier run
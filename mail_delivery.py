@@ -0,0 +1,206 @@
+"""Email delivery: MIME messages streamed to the SMTP socket, with a size policy that splits or links large sends."""
+import base64
+import dataclasses
+import datetime
+import hashlib
+import mimetypes
+import os
+import re
+import urllib.parse
+import uuid
+from email.mime.text import MIMEText
+from email.policy import SMTP as SMTP_POLICY
+from email.utils import formatdate, make_msgid
+from typing import TYPE_CHECKING, Any, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from spool import ArtifactData, artifact_chunks
+
+if TYPE_CHECKING:
+    import smtplib
+
+# --- Delivery size policy ---
+MAX_MESSAGE_BYTES = 20 * 1024 * 1024   # encoded message size; Gmail rejects messages over 25 MB
+MAX_MESSAGES = 5                       # split into at most this many messages before switching to links
+PART_OVERHEAD_BYTES = 512              # boundary and part headers, per attachment
+ENCODE_CHUNK_BYTES = 57 * 18396        # ~1 MB; a multiple of 57 bytes encodes to whole 76-character lines
+# ----------------------------
+
+
+@dataclasses.dataclass(frozen=True)
+class DeliveryPolicy:
+    """
+    When a send no longer fits one message. Attachments are split across up to max_messages
+    messages of at most max_message_bytes each (encoded). Anything that still does not fit is
+    copied to link_dir and listed in a link manifest (URLs under link_base_url) instead;
+    without a link_dir such a send is refused.
+    """
+    max_message_bytes: int = MAX_MESSAGE_BYTES
+    max_messages: int = MAX_MESSAGES
+    link_dir: Optional[str] = None
+    link_base_url: Optional[str] = None
+
+    @classmethod
+    def from_mapping(cls, mapping: Mapping[str, Any]) -> "DeliveryPolicy":
+        """Build from the [email] secrets section (max_message_mb, max_messages, link_dir, link_base_url)."""
+        max_mb = mapping.get("max_message_mb")
+        return cls(
+            max_message_bytes=int(float(max_mb) * 1024 * 1024) if max_mb else MAX_MESSAGE_BYTES,
+            max_messages=max(1, int(mapping.get("max_messages", MAX_MESSAGES))),
+            link_dir=mapping.get("link_dir") or None,
+            link_base_url=mapping.get("link_base_url") or None,
+        )
+
+
+@dataclasses.dataclass(frozen=True)
+class DeliveryPlan:
+    """Attachments per message (in order) and the attachments delivered as links instead."""
+    messages: Tuple[Tuple[Tuple[str, ArtifactData], ...], ...]
+    linked: Tuple[Tuple[str, ArtifactData], ...] = ()
+
+
+def encoded_size(size: int) -> int:
+    """Bytes of base64 with 76-character CRLF-terminated lines for `size` input bytes."""
+    encoded = 4 * ((size + 2) // 3)
+    return encoded + 2 * ((encoded + 75) // 76)
+
+
+def _attachment_cost(data: ArtifactData) -> int:
+    return encoded_size(len(data)) + PART_OVERHEAD_BYTES
+
+
+def plan_delivery(attachments: List[Tuple[str, ArtifactData]], policy: DeliveryPolicy, body_bytes: int = 0) -> DeliveryPlan:
+    """
+    Pack attachments, in order, into as few messages as the policy allows.
+    Raises ValueError when the send exceeds the policy and no link directory is configured.
+    """
+    budget = policy.max_message_bytes - encoded_size(body_bytes) - 2 * PART_OVERHEAD_BYTES
+    oversized = [(name, data) for name, data in attachments if _attachment_cost(data) > budget]
+    if oversized and not policy.link_dir:
+        name, data = oversized[0]
+        raise ValueError(f"{name} ({len(data) / 1024 / 1024:,.1f} MB) does not fit in one email; configure a link_dir to send it as a link")
+    messages: List[List[Tuple[str, ArtifactData]]] = [[]]
+    used = 0
+    for name, data in attachments:
+        cost = _attachment_cost(data)
+        if cost > budget:
+            continue
+        if used + cost > budget and messages[-1]:
+            messages.append([])
+            used = 0
+        messages[-1].append((name, data))
+        used += cost
+    if len(messages) > policy.max_messages:
+        if not policy.link_dir:
+            raise ValueError(f"Attachments need {len(messages)} emails (limit {policy.max_messages}); configure a link_dir to send them as links")
+        return DeliveryPlan(messages=((),), linked=tuple(attachments))
+    return DeliveryPlan(messages=tuple(tuple(m) for m in messages), linked=tuple(oversized))
+
+
+def link_folder(run_id: Optional[str] = None) -> str:
+    """A folder name under link_dir that no other send uses: a timestamp for humans, then the run_id (or a uuid)."""
+    return f"{datetime.datetime.now():%Y%m%d_%H%M%S}_{run_id or uuid.uuid4().hex}"
+
+
+def publish_links(linked: List[Tuple[str, ArtifactData]], policy: DeliveryPolicy, folder: str) -> str:
+    """Copy linked attachments under link_dir/folder, streaming each one; returns the manifest text."""
+    target = os.path.join(policy.link_dir, folder)
+    os.makedirs(target, exist_ok=True)
+    lines = ["The following files were too large to attach and are available here:", ""]
+    for name, data in linked:
+        digest = hashlib.sha256()
+        with open(os.path.join(target, name), "wb") as f:
+            for chunk in artifact_chunks(data):
+                digest.update(chunk)
+                f.write(chunk)
+        if policy.link_base_url:   # the raw name is only for the file on disk
+            location = f"{policy.link_base_url.rstrip('/')}/{urllib.parse.quote(folder)}/{urllib.parse.quote(name)}"
+        else:
+            location = os.path.join(target, name)
+        lines.append(f"{name}  {len(data):,} bytes  sha256 {digest.hexdigest()}")
+        lines.append(f"    {location}")
+    return "\n".join(lines) + "\n"
+
+
+def _quoted(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"')
+
+
+def _dot_stuff(data: bytes) -> bytes:
+    """SMTP transparency for in-memory text (base64 lines never start with a dot)."""
+    return re.sub(rb"(?m)^\.", b"..", data)
+
+
+def _base64_lines(data: ArtifactData) -> Iterator[bytes]:
+    carry = b""
+    for chunk in artifact_chunks(data, ENCODE_CHUNK_BYTES):
+        chunk = carry + chunk
+        whole = len(chunk) - len(chunk) % 57
+        carry = chunk[whole:]
+        if whole:
+            yield base64.encodebytes(chunk[:whole]).replace(b"\n", b"\r\n")
+    if carry:
+        yield base64.encodebytes(carry).replace(b"\n", b"\r\n")
+
+
+def message_chunks(sender: str, recipient: str, subject: str, body: str,
+                   attachments: List[Tuple[str, ArtifactData]], boundary: Optional[str] = None) -> Iterator[bytes]:
+    """
+    A multipart/mixed message as a stream of CRLF-terminated, dot-stuffed byte chunks.
+    Attachments are base64-encoded ~1 MB at a time, so a send never holds more than one
+    chunk of any attachment beyond the attachment itself.
+    """
+    boundary = boundary or f"=_{uuid.uuid4().hex}"
+    headers: Dict[str, str] = {
+        "From": sender, "To": recipient, "Subject": subject, "Date": formatdate(localtime=True),
+        "Message-ID": make_msgid(), "MIME-Version": "1.0",
+        "Content-Type": f'multipart/mixed; boundary="{boundary}"',
+    }
+    folded = (SMTP_POLICY.fold_binary(*SMTP_POLICY.header_store_parse(name, value)) for name, value in headers.items())
+    yield _dot_stuff(b"".join(folded) + b"\r\n")
+    text = MIMEText(body, "plain", "utf-8")
+    yield _dot_stuff(f"--{boundary}\r\n".encode("ascii") + text.as_bytes(policy=SMTP_POLICY) + b"\r\n")
+    for filename, data in attachments:
+        mime = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+        yield (
+            f"--{boundary}\r\n"
+            f'Content-Type: {mime}; name="{_quoted(filename)}"\r\n'
+            "Content-Transfer-Encoding: base64\r\n"
+            f'Content-Disposition: attachment; filename="{_quoted(filename)}"\r\n\r\n'
+        ).encode("utf-8")
+        yield from _base64_lines(data)
+    yield f"--{boundary}--\r\n".encode("ascii")
+
+
+def send_streaming(server: "smtplib.SMTP", sender: str, recipient: str, subject: str, body: str,
+                   attachments: List[Tuple[str, ArtifactData]]) -> None:
+    """Send one message over an open, logged-in connection without building it in memory."""
+    import smtplib
+
+    options = []
+    if server.has_extn("size"):
+        estimate = sum(_attachment_cost(data) for _, data in attachments) + encoded_size(len(body.encode("utf-8"))) + 2048
+        options.append(f"SIZE={estimate}")
+    code, reply = server.mail(sender, options)
+    if code != 250:
+        raise smtplib.SMTPSenderRefused(code, reply, sender)
+    code, reply = server.rcpt(recipient)
+    if code not in (250, 251):
+        raise smtplib.SMTPRecipientsRefused({recipient: (code, reply)})
+    server.putcmd("data")
+    code, reply = server.getreply()
+    if code != 354:
+        raise smtplib.SMTPDataError(code, reply)
+    for chunk in message_chunks(sender, recipient, subject, body, attachments):
+        server.send(chunk)
+    server.send(b".\r\n")
+    code, reply = server.getreply()
+    if code != 250:
+        raise smtplib.SMTPDataError(code, reply)
+
+
+def send_plan(server: "smtplib.SMTP", sender: str, recipient: str, subject: str, body: str, plan: DeliveryPlan) -> None:
+    """Send every message of a plan; when it takes several, subjects get ' (part n of total)'."""
+    total = len(plan.messages)
+    for n, parts in enumerate(plan.messages, start=1):
+        part_subject = f"{subject} (part {n} of {total})" if total > 1 else subject
+        send_streaming(server, sender, recipient, part_subject, body, list(parts))
@@ -0,0 +1,215 @@
+"""Mandatory ("Spend Agent") line items: a rules table compiled once per run and injected into each invoice."""
+import dataclasses
+import string
+from typing import TYPE_CHECKING, Any, Dict, List, Optional, Sequence, Tuple, Union
+
+from rng import invoice_random
+from timekeepers import TimekeeperRegistry, as_registry
+
+if TYPE_CHECKING:
+    import datetime
+
+    from invoice_engine import GenerationSettings
+
+# --- Mandatory item rules ---
+# name -> rule. Keys:
+#   is_expense     expense line (expense_code) or fee line (tk_name, task, activity)
+#   desc           description; {field} placeholders take GenerationSettings values (plus airfare_trip_type)
+#   quantity       lines added per invoice (default 1)
+#   dates          "any" (weighted billable day), "start" or "end" (first / last billable day)
+#   hours          fee hours range, rounded to 0.1 (default (0.5, 8.0))
+#   amount         GenerationSettings field holding a fixed expense amount (1 unit at that rate)
+#   units / rate   expense ranges when there is no fixed amount (defaults (1, 10) / (5.0, 100.0))
+#   details        extra row key -> {detail: GenerationSettings field}, e.g. airfare data for receipts
+MANDATORY_ITEM_RULES: Dict[str, Dict[str, Any]] = {
+    'KBCG': {
+        'desc': ("Commenced data entry into the KBCG e-licensing portal for Piers Walter Vermont "
+                 "form 1005 application; Drafted deficiency notice to send to client re: same; "
+                 "Scheduled follow-up call with client to review application status and address outstanding deficiencies."),
+        'tk_name': "Tom Delaganis",
+        'task': "L140",
+        'activity': "A107",
+        'is_expense': False
+    },
+    'John Doe': {
+        'desc': ("Reviewed and summarized deposition transcript of John Doe; prepared exhibit index; "
+                 "updated case chronology spreadsheet for attorney review"),
+        'tk_name': "Ryan Kinsey",
+        'task': "L120",
+        'activity': "A102",
+        'is_expense': False
+    },
+    'Uber E110': {
+        'desc': "Uber ride to client's office",
+        'expense_code': "E110",
+        'is_expense': True,
+        'amount': "uber_amount",
+    },
+    'Partner: Paralegal Tasks': {
+        'desc': "Prepared trial binder including witness lists and exhibit summaries.",
+        'tk_name': "Ryan Kinsey",
+        'task': "L140",
+        'activity': "A103",
+        'is_expense': False
+    },
+    'Airfare E110': {
+        'desc': ("Airfare ({airfare_fare_class}): {airfare_airline} {airfare_flight_number}, "
+                 "{airfare_departure_city} to {airfare_arrival_city}{airfare_trip_type}"),
+        'expense_code': "E110",
+        'is_expense': True,
+        'amount': "airfare_amount",
+        'details': {"airfare_details": {
+            "airline": "airfare_airline", "flight_number": "airfare_flight_number",
+            "departure_city": "airfare_departure_city", "arrival_city": "airfare_arrival_city",
+            "is_roundtrip": "airfare_roundtrip", "amount": "airfare_amount", "fare_class": "airfare_fare_class",
+        }},
+    },
+}
+MANDATORY_DATE_RULES = ("any", "start", "end")
+# ----------------------------
+
+
+@dataclasses.dataclass(frozen=True)
+class CompiledMandatoryItem:
+    """One selected rule with its description, amounts and timekeeper resolved for the run."""
+    name: str
+    is_expense: bool
+    quantity: int
+    dates: str
+    description: str
+    expense_code: str = ""
+    task: str = ""
+    activity: str = ""
+    tk_pos: int = -1
+    tk_name: str = ""
+    tk_id: str = ""
+    tk_classification: str = ""
+    hours: Tuple[float, float] = (0.5, 8.0)
+    amount: Optional[float] = None
+    units: Tuple[int, int] = (1, 10)
+    rate: Tuple[float, float] = (5.0, 100.0)
+    details: Tuple[Tuple[str, Tuple[Tuple[str, Any], ...]], ...] = ()
+
+
+@dataclasses.dataclass(frozen=True)
+class MandatoryItemPlan:
+    """
+    The mandatory items of a run, compiled once. Immutable and picklable, so it can be
+    shared with worker processes; inject() adds every item to an invoice in one pass.
+    """
+    items: Tuple[CompiledMandatoryItem, ...] = ()
+    skipped: Tuple[str, ...] = ()    # selected fee items whose timekeeper is not in the roster
+
+    @property
+    def fee_lines(self) -> int:
+        return sum(item.quantity for item in self.items if not item.is_expense)
+
+    @property
+    def expense_lines(self) -> int:
+        return sum(item.quantity for item in self.items if item.is_expense)
+
+    def generated_counts(self, fees: int, expenses: int) -> Tuple[int, int]:
+        """Random fee/expense lines to generate so each invoice still has `fees` and `expenses` lines in total."""
+        return max(0, fees - self.fee_lines), max(0, expenses - self.expense_lines)
+
+    def inject(self, rows: List[Dict], registry: Union[List[Dict], TimekeeperRegistry], invoice_desc: str,
+               client_id: str, law_firm_id: str, billing_start_date: "datetime.date", billing_end_date: "datetime.date",
+               settings: "GenerationSettings") -> Tuple[List[Dict], List[str]]:
+        """Append this plan's lines to rows; returns (rows, skipped item names)."""
+        if not self.items:
+            return rows, list(self.skipped)
+        calendar = settings.calendar_index(billing_start_date, billing_end_date)
+        registry = as_registry(registry) if any(not item.is_expense for item in self.items) else None
+        for item in self.items:
+            for _ in range(item.quantity):
+                if item.dates == "start":
+                    day = 0
+                elif item.dates == "end":
+                    day = len(calendar) - 1
+                else:
+                    day = calendar.sample_index()
+                row = {
+                    "INVOICE_DESCRIPTION": invoice_desc, "CLIENT_ID": client_id, "LAW_FIRM_ID": law_firm_id,
+                    "LINE_ITEM_DATE": calendar.date_strs[day], "TIMEKEEPER_NAME": item.tk_name,
+                    "TIMEKEEPER_CLASSIFICATION": item.tk_classification, "TIMEKEEPER_ID": item.tk_id,
+                    "TASK_CODE": item.task, "ACTIVITY_CODE": item.activity, "EXPENSE_CODE": item.expense_code,
+                    "DESCRIPTION": item.description,
+                }
+                if not item.is_expense:
+                    hours = round(invoice_random.uniform(*item.hours), 1)
+                    rate = registry.rate_for(item.tk_pos, calendar.dates[day])
+                    row.update({"HOURS": hours, "RATE": rate, "LINE_ITEM_TOTAL": round(hours * rate, 2)})
+                elif item.amount is not None:
+                    row.update({"HOURS": 1, "RATE": item.amount, "LINE_ITEM_TOTAL": item.amount})
+                else:
+                    units, rate = invoice_random.randint(*item.units), round(invoice_random.uniform(*item.rate), 2)
+                    row.update({"HOURS": units, "RATE": rate, "LINE_ITEM_TOTAL": round(units * rate, 2)})
+                for key, values in item.details:
+                    row[key] = dict(values)
+                rows.append(row)
+        return rows, list(self.skipped)
+
+
+EMPTY_MANDATORY_PLAN = MandatoryItemPlan()
+
+
+def _template_fields(settings: "GenerationSettings") -> Dict[str, Any]:
+    fields = dataclasses.asdict(settings)
+    fields["airfare_trip_type"] = " (Roundtrip)" if settings.airfare_roundtrip else ""
+    return fields
+
+
+def _setting(fields: Dict[str, Any], name: str, item_name: str) -> Any:
+    if name not in fields:
+        raise ValueError(f"Mandatory item '{item_name}' refers to unknown setting '{name}'")
+    return fields[name]
+
+
+def compile_mandatory_items(selected_items: Sequence[str], timekeepers: Union[None, List[Dict], TimekeeperRegistry],
+                            settings: "GenerationSettings",
+                            rules: Optional[Dict[str, Dict[str, Any]]] = None) -> MandatoryItemPlan:
+    """
+    Resolve the selected rules against the roster and settings: descriptions are rendered,
+    fixed amounts read and fee timekeepers looked up once per run, not once per line.
+    Raises ValueError for unknown items or malformed rules.
+    """
+    rules = MANDATORY_ITEM_RULES if rules is None else rules
+    fields = _template_fields(settings)
+    registry = as_registry(timekeepers or [])
+    items: List[CompiledMandatoryItem] = []
+    skipped: List[str] = []
+    for name in selected_items:
+        rule = rules.get(name)
+        if rule is None:
+            raise ValueError(f"Unknown mandatory item '{name}'")
+        dates = rule.get('dates', "any")
+        if dates not in MANDATORY_DATE_RULES:
+            raise ValueError(f"Mandatory item '{name}' has date rule '{dates}'; use one of {', '.join(MANDATORY_DATE_RULES)}")
+        try:
+            description = string.Formatter().vformat(rule.get('desc', name), (), fields)
+        except (KeyError, IndexError, ValueError) as e:
+            raise ValueError(f"Mandatory item '{name}' has an invalid description template: {e}")
+        common = {"name": name, "quantity": max(0, int(rule.get('quantity', 1))), "dates": dates, "description": description}
+        if rule.get('is_expense'):
+            amount = rule.get('amount')
+            details = tuple(
+                (key, tuple((detail, _setting(fields, field, name)) for detail, field in mapping.items()))
+                for key, mapping in rule.get('details', {}).items()
+            )
+            items.append(CompiledMandatoryItem(
+                is_expense=True, expense_code=rule['expense_code'],
+                amount=float(_setting(fields, amount, name)) if amount else None,
+                units=tuple(rule.get('units', (1, 10))), rate=tuple(rule.get('rate', (5.0, 100.0))),
+                details=details, **common,
+            ))
+            continue
+        pos = registry.position_by_name(rule['tk_name'])
+        if pos is None:
+            skipped.append(name)
+            continue
+        items.append(CompiledMandatoryItem(
+            is_expense=False, task=rule['task'], activity=rule['activity'], tk_pos=pos, tk_name=rule['tk_name'],
+            tk_id=registry.ids[pos], tk_classification=registry.classification(pos),
+            hours=tuple(rule.get('hours', (0.5, 8.0))), **common,
+        ))
+    return MandatoryItemPlan(tuple(items), tuple(skipped))
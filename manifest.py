@@ -0,0 +1,420 @@
+"""Bulk runs: plan many matters/clients/profiles from a CSV or JSON manifest into one job."""
+import csv
+import dataclasses
+import datetime
+import io
+import json
+import logging
+import os
+import sqlite3
+import time
+import zipfile
+from typing import TYPE_CHECKING, Any, Callable, Dict, List, Optional, Tuple
+
+from faker import Faker
+
+from artifact_cache import config_hash
+
+from invoice_engine import (
+    BILLING_PROFILES, CONFIG, DEFAULT_GENERATION_SETTINGS, DEFAULT_PDF_OUTPUT, GenerationSettings, PdfOutputOptions, get_profile,
+    _create_ledes_1998b_content, _create_pdf_invoice,
+    _create_receipt_image, _generate_invoice_data, _seed_invoice_rng,
+)
+from invoice_summary import summarize_invoice, summary_to_csv, summary_to_json
+from ledes_validation import ValidationRules, discard_partial_output, has_errors, validate_invoice, violations_to_csv
+from numbering import UniqueNames, persistent_numberer
+from run_catalog import catalog_call
+from telemetry import bind_log_context, record_run
+
+if TYPE_CHECKING:
+    from run_catalog import RunCatalog
+
+# --- Manifest schema ---
+# column -> (type, default). A default of None means "derive it" (see _normalize_entry).
+MANIFEST_FIELDS: Dict[str, Tuple[str, Any]] = {
+    "matter_number": ("str", None),
+    "profile": ("str", BILLING_PROFILES[0][0]),
+    "client_name": ("str", None),
+    "client_id": ("str", None),
+    "law_firm_name": ("str", None),
+    "law_firm_id": ("str", None),
+    "invoice_number_base": ("str", None),
+    "billing_start_date": ("date", None),
+    "billing_end_date": ("date", None),
+    "invoice_description": ("str", CONFIG['DEFAULT_INVOICE_DESCRIPTION']),
+    "invoices": ("int", 1),
+    "fees": ("int", 20),
+    "expenses": ("int", 5),
+    "max_daily_hours": ("int", 16),
+    "include_block_billed": ("bool", True),
+    "include_pdf": ("bool", False),
+    "include_receipts": ("bool", False),
+    "include_summary": ("bool", False),
+    "timekeepers": ("str", ""),
+    "seed": ("int", 0),
+}
+# -----------------------
+
+
+def _parse_value(kind: str, value: Any) -> Any:
+    if kind == "int":
+        return int(float(value))
+    if kind == "bool":
+        if isinstance(value, bool):
+            return value
+        return str(value).strip().lower() in ("1", "true", "yes", "y", "x")
+    if kind == "date":
+        if isinstance(value, datetime.date):
+            return value
+        return datetime.datetime.strptime(str(value).strip(), "%Y-%m-%d").date()
+    return str(value).strip()
+
+
+def _normalize_entry(raw: Dict[str, Any], line_no: int, defaults: Dict[str, Any]) -> Dict[str, Any]:
+    """Validate one manifest entry and fill in profile-derived and default values."""
+    merged = {**defaults, **{k: v for k, v in raw.items() if v is not None and str(v).strip() != ""}}
+    unknown = set(merged) - set(MANIFEST_FIELDS)
+    if unknown:
+        raise ValueError(f"Manifest entry {line_no}: unknown column(s) {', '.join(sorted(unknown))}")
+    entry = {}
+    for name, (kind, default) in MANIFEST_FIELDS.items():
+        if name in merged:
+            try:
+                entry[name] = _parse_value(kind, merged[name])
+            except (TypeError, ValueError):
+                raise ValueError(f"Manifest entry {line_no}: invalid {kind} for '{name}': {merged[name]!r}")
+        else:
+            entry[name] = default
+    if not entry["matter_number"]:
+        raise ValueError(f"Manifest entry {line_no}: 'matter_number' is required")
+    if entry["profile"] not in [p[0] for p in BILLING_PROFILES]:
+        raise ValueError(f"Manifest entry {line_no}: unknown profile '{entry['profile']}'")
+
+    prof_client_name, prof_client_id, prof_law_firm_name, prof_law_firm_id = get_profile(entry["profile"])
+    entry["client_name"] = entry["client_name"] or prof_client_name
+    entry["client_id"] = entry["client_id"] or prof_client_id
+    entry["law_firm_name"] = entry["law_firm_name"] or prof_law_firm_name
+    entry["law_firm_id"] = entry["law_firm_id"] or prof_law_firm_id
+
+    if entry["billing_start_date"] is None or entry["billing_end_date"] is None:
+        last_day_prev = datetime.date.today().replace(day=1) - datetime.timedelta(days=1)
+        entry["billing_start_date"] = entry["billing_start_date"] or last_day_prev.replace(day=1)
+        entry["billing_end_date"] = entry["billing_end_date"] or last_day_prev
+    # Default numbering includes the period so several periods of one matter never collide
+    entry["invoice_number_base"] = entry["invoice_number_base"] or f"{entry['matter_number']}-{entry['billing_end_date']:%Y%m}"
+    if entry["billing_start_date"] >= entry["billing_end_date"]:
+        raise ValueError(f"Manifest entry {line_no}: billing start date must be before end date")
+    if entry["invoices"] < 1 or entry["fees"] < 0 or entry["expenses"] < 0:
+        raise ValueError(f"Manifest entry {line_no}: invoices must be >= 1 and fees/expenses >= 0")
+    entry["line_no"] = line_no
+    return entry
+
+
+def load_manifest(source: Any, filename: str = "") -> List[Dict[str, Any]]:
+    """
+    Load a manifest from a path, an uploaded file or raw text.
+
+    CSV manifests have one entry per row, using MANIFEST_FIELDS as column names.
+    JSON manifests are either a list of entries or {"defaults": {...}, "entries": [...]}.
+    Raises ValueError naming the offending entry.
+    """
+    if isinstance(source, str) and os.path.exists(source):
+        filename = filename or source
+        with open(source, "r", encoding="utf-8") as f:
+            text = f.read()
+    elif hasattr(source, "read"):
+        filename = filename or getattr(source, "name", "")
+        data = source.read()
+        text = data.decode("utf-8") if isinstance(data, bytes) else data
+    else:
+        text = str(source)
+
+    defaults: Dict[str, Any] = {}
+    if filename.lower().endswith(".json") or text.lstrip().startswith(("[", "{")):
+        parsed = json.loads(text)
+        if isinstance(parsed, dict):
+            defaults = parsed.get("defaults", {}) or {}
+            raw_entries = parsed.get("entries", [])
+        else:
+            raw_entries = parsed
+        numbered = [(n, raw) for n, raw in enumerate(raw_entries, start=1)]
+    else:
+        reader = csv.DictReader(io.StringIO(text))
+        # Line numbers are file lines: the header is line 1
+        numbered = [(n, {k.strip(): v for k, v in raw.items() if k}) for n, raw in enumerate(reader, start=2)]
+
+    entries = [_normalize_entry(raw, n, defaults) for n, raw in numbered]
+    if not entries:
+        raise ValueError("Manifest contains no entries")
+    return entries
+
+
+def plan_manifest(entries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Expand manifest entries into a flat, scheduled list of invoice jobs.
+
+    Jobs are grouped by timekeeper roster, profile and matter so each shared
+    resource is loaded once and each matter bundle is written contiguously.
+    """
+    jobs = []
+    ordered = sorted(entries, key=lambda e: (e["timekeepers"], e["profile"], e["matter_number"], e["billing_end_date"], e["line_no"]))
+    for entry in ordered:
+        for i in range(entry["invoices"]):
+            jobs.append({
+                "entry": entry,
+                "invoice_index": i,
+                "invoice_number": f"{entry['invoice_number_base']}-{i + 1}",
+            })
+    return jobs
+
+
+def _bundle_name(matter_number: str) -> str:
+    safe = "".join(c if c.isalnum() or c in "-_." else "_" for c in matter_number)
+    return f"bundle_{safe}.zip"
+
+
+def _write_validation_report(out_dir: str, violations: List[Any]) -> None:
+    with open(os.path.join(out_dir, "validation_report.csv"), "w", encoding="utf-8", newline="") as f:
+        f.write(violations_to_csv(violations))
+
+
+def run_manifest(
+    entries: List[Dict[str, Any]],
+    out_dir: str,
+    timekeeper_data: Optional[List[Dict]] = None,
+    task_activity_desc: Optional[List[Tuple[str, str, str]]] = None,
+    settings: GenerationSettings = DEFAULT_GENERATION_SETTINGS,
+    progress_callback: Optional[Callable[[int, int, Dict[str, Any]], None]] = None,
+    pdf_output: PdfOutputOptions = DEFAULT_PDF_OUTPUT,
+    line_items_format: Optional[str] = None,
+    catalog: Optional["RunCatalog"] = None,
+    number_pattern: Optional[str] = None,
+    validation: str = "warn",
+) -> Dict[str, Any]:
+    """
+    Generate every planned invoice and write one ZIP bundle per matter plus a run summary.
+
+    Entries with a 'timekeepers' path use that roster (loaded once and shared).
+    Otherwise they use timekeeper_data. With line_items_format ("parquet" or "arrow"),
+    every line item is also exported under out_dir/line_items (see columnar_export).
+    With a catalog, the run, its invoices, line items and bundle members are recorded
+    there and can be regenerated later with rerun_manifest().
+    With number_pattern (see numbering.NUMBER_PATTERNS), invoice numbers come from the
+    persistent counter instead of '{invoice_number_base}-{n}', so they never repeat across runs.
+    Every invoice is validated (see ledes_validation) before its files are written; violations
+    go to validation_report.csv, and with validation="block" the first failing invoice stops the run,
+    removes the bundles already written and marks the catalogued run as failed.
+    """
+    import pandas as pd
+
+    from ingest import load_timekeeper_records
+
+    os.makedirs(out_dir, exist_ok=True)
+    jobs = plan_manifest(entries)
+    custom_tasks = bool(task_activity_desc)
+    task_activity_desc = task_activity_desc or CONFIG['DEFAULT_TASK_ACTIVITY_DESC']
+    faker_instance = Faker()
+    roster_cache: Dict[str, List[Dict]] = {}
+    bundles: Dict[str, zipfile.ZipFile] = {}
+    bundle_names: Dict[str, UniqueNames] = {}
+    # Leases a block per run, so parallel service workers never contend per number
+    numberer = persistent_numberer(number_pattern, catalog.path if catalog is not None else None, block_size=len(jobs)) if number_pattern else None
+    summary_rows: List[Dict[str, Any]] = []
+    violations: List[Any] = []
+    blocked = False
+    exporter = None
+    if line_items_format:
+        from columnar_export import LineItemExporter
+
+        exporter = LineItemExporter(os.path.join(out_dir, "line_items"), line_items_format)
+    line_items = None
+    run_id = None
+    if catalog is not None:
+        try:
+            # Rosters and task catalogs are stored once in the catalog's inputs table; the run keeps their digests
+            run_config = {
+                "entries": [{k: v for k, v in e.items() if k != "line_no"} for e in entries],
+                "timekeepers_digest": catalog.store_input("timekeepers", timekeeper_data) if timekeeper_data else None,
+                "task_activity_digest": catalog.store_input("task_activity", task_activity_desc) if custom_tasks else None,
+                "settings": dataclasses.asdict(settings), "pdf_output": dataclasses.asdict(pdf_output),
+                "line_items_format": line_items_format, "number_pattern": number_pattern,
+            }
+            run_id = catalog.start_run("manifest", run_config, config_hash=config_hash(run_config), out_dir=out_dir)
+        except sqlite3.Error as e:
+            logging.error(f"Run catalog unavailable for this run: {e}")
+            catalog = None
+    started = time.perf_counter()
+    restore_log_context = bind_log_context(source="manifest", run_id=run_id)
+
+    def _roster(path: str) -> List[Dict]:
+        if not path:
+            if not timekeeper_data:
+                raise ValueError("No timekeepers provided for manifest entries without a 'timekeepers' path")
+            return timekeeper_data
+        if path not in roster_cache:
+            roster_cache[path] = load_timekeeper_records(path)
+        return roster_cache[path]
+
+    try:
+        for n, job in enumerate(jobs, start=1):
+            entry, i, invoice_number = job["entry"], job["invoice_index"], job["invoice_number"]
+            matter = entry["matter_number"]
+            if matter not in bundles:
+                bundles[matter] = zipfile.ZipFile(os.path.join(out_dir, _bundle_name(matter)), "w", zipfile.ZIP_DEFLATED)
+                bundle_names[matter] = UniqueNames()
+            bundle, names = bundles[matter], bundle_names[matter]
+            start_date, end_date = entry["billing_start_date"], entry["billing_end_date"]
+            if numberer is not None:
+                invoice_number = numberer.number(
+                    i, base=entry["invoice_number_base"], matter=matter, profile=entry["profile"], start=start_date, end=end_date
+                )
+            bind_log_context(invoice_number=invoice_number, matter_number=matter)
+
+            _seed_invoice_rng(entry["seed"], i, f"rows:{matter}:{end_date}", faker_instance)
+            rows, total_amount = _generate_invoice_data(
+                entry["fees"], entry["expenses"], _roster(entry["timekeepers"]), entry["client_id"],
+                entry["law_firm_id"], entry["invoice_description"], start_date, end_date,
+                task_activity_desc, CONFIG['MAJOR_TASK_CODES'], entry["max_daily_hours"],
+                entry["include_block_billed"], faker_instance, settings
+            )
+            summary = summarize_invoice(rows)
+            if validation != "off":
+                invoice_violations = validate_invoice(
+                    rows, invoice_number, start_date, end_date, total_amount,
+                    rules=ValidationRules(max_daily_hours=float(entry["max_daily_hours"]))
+                )
+                violations.extend(invoice_violations)
+                if validation == "block" and has_errors(invoice_violations):
+                    first = next(v for v in invoice_violations if v.severity == "error")
+                    _write_validation_report(out_dir, violations)
+                    blocked = True
+                    raise ValueError(f"Manifest entry {entry['line_no']}: invoice {invoice_number} failed validation ({first.rule}: {first.message})")
+            if exporter is not None:
+                exporter.add_invoice(rows, entry["profile"], matter, invoice_number, start_date, end_date)
+            files = [names.claim(f"LEDES_1998B_{invoice_number}.txt")]
+            bundle.writestr(files[0], _create_ledes_1998b_content(
+                rows, total_amount, start_date, end_date, invoice_number, matter
+            ))
+            if entry["include_pdf"]:
+                pdf_buffer = _create_pdf_invoice(
+                    df=pd.DataFrame(rows), total_amount=total_amount, invoice_number=invoice_number,
+                    invoice_date=end_date, billing_start_date=start_date, billing_end_date=end_date,
+                    client_id=entry["client_id"], law_firm_id=entry["law_firm_id"],
+                    client_name=entry["client_name"], law_firm_name=entry["law_firm_name"], summary=summary,
+                    layout=entry["profile"], output=pdf_output
+                )
+                files.append(names.claim(f"Invoice_{invoice_number}.pdf"))
+                bundle.writestr(files[-1], pdf_buffer.getvalue())
+            if entry["include_summary"]:
+                files.append(names.claim(f"summaries/{invoice_number}_summary.json"))
+                bundle.writestr(files[-1], summary_to_json(
+                    summary, invoice_number=invoice_number, matter_number=matter,
+                    billing_start_date=start_date.isoformat(), billing_end_date=end_date.isoformat()
+                ))
+                files.append(names.claim(f"summaries/{invoice_number}_summary.csv"))
+                bundle.writestr(files[-1], summary_to_csv(summary))
+            if entry["include_receipts"]:
+                _seed_invoice_rng(entry["seed"], i, f"receipts:{matter}:{end_date}", faker_instance)
+                for row in rows:
+                    if row.get("EXPENSE_CODE") and row.get("EXPENSE_CODE") != "E101":
+                        receipt_filename, receipt_buf = _create_receipt_image(row, faker_instance, pdf_output)
+                        files.append(names.claim(f"receipts/{invoice_number}_{receipt_filename}"))
+                        bundle.writestr(files[-1], receipt_buf.getvalue())
+
+            summary_rows.append({
+                "matter_number": matter,
+                "profile": entry["profile"],
+                "client_id": entry["client_id"],
+                "invoice_number": invoice_number,
+                "billing_start_date": start_date.isoformat(),
+                "billing_end_date": end_date.isoformat(),
+                "lines": len(rows),
+                "total": summary["total"],
+                "bundle": _bundle_name(matter),
+                "files": len(files),
+                "bytes": sum(bundle.getinfo(name).file_size for name in files),
+            })
+            if catalog is not None:
+                catalog_call(
+                    catalog, "record_invoice", run_id, invoice_number, rows, summary, start_date, end_date, matter_number=matter, profile=entry["profile"],
+                    client_id=entry["client_id"], law_firm_id=entry["law_firm_id"]
+                )
+                catalog_call(catalog, "record_artifacts", run_id, [
+                    (name, f"{_bundle_name(matter)}/{name}", bundle.getinfo(name).file_size, invoice_number) for name in files
+                ])
+            if progress_callback:
+                progress_callback(n, len(jobs), summary_rows[-1])
+    except Exception as e:
+        record_run("manifest", len(summary_rows), sum(r["lines"] for r in summary_rows), time.perf_counter() - started, failed=True)
+        if catalog is not None:
+            catalog_call(catalog, "finish_run", run_id, error=str(e) or type(e).__name__)
+        raise
+    finally:
+        restore_log_context()
+        for bundle in bundles.values():
+            bundle.close()
+        if exporter is not None:
+            line_items = exporter.close()
+        if blocked:
+            # Only the validation report survives a blocked run; bundles already written are removed
+            partial = [_bundle_name(matter) for matter in bundles]
+            if line_items is not None:
+                partial += [os.path.join("line_items", name) for name in line_items["files"]]
+            discard_partial_output(out_dir, partial)
+
+    elapsed = time.perf_counter() - started
+    record_run("manifest", len(summary_rows), sum(r["lines"] for r in summary_rows), elapsed)
+    summary = {
+        "entries": len(entries),
+        "invoices": len(summary_rows),
+        "matters": len(bundles),
+        "lines": sum(r["lines"] for r in summary_rows),
+        "grand_total": round(sum(r["total"] for r in summary_rows), 2),
+        "bytes": sum(r["bytes"] for r in summary_rows),
+        "violations": {
+            "errors": sum(v.severity == "error" for v in violations),
+            "warnings": sum(v.severity == "warning" for v in violations),
+        },
+        "elapsed_s": round(elapsed, 3),
+        "out_dir": os.path.abspath(out_dir),
+        "invoices_detail": summary_rows,
+    }
+    if line_items is not None:
+        summary["line_items"] = {**line_items, "root": os.path.abspath(line_items["root"])}
+    if catalog is not None:
+        if line_items is not None:
+            catalog_call(catalog, "record_artifacts", run_id, [
+                (name, os.path.join("line_items", name), os.path.getsize(os.path.join(line_items["root"], name)), None) for name in line_items["files"]
+            ])
+        catalog_call(catalog, "finish_run", run_id)
+        summary["run_id"] = run_id
+    try:
+        with open(os.path.join(out_dir, "run_summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        pd.DataFrame(summary_rows).to_csv(os.path.join(out_dir, "run_summary.csv"), index=False)
+        if violations:
+            _write_validation_report(out_dir, violations)
+    except OSError as e:
+        logging.error(f"Could not write manifest run summary: {e}")
+    return summary
+
+
+def rerun_manifest(catalog: "RunCatalog", run_id: str, out_dir: str, **kwargs: Any) -> Dict[str, Any]:
+    """Regenerate a catalogued manifest run from its recorded entries, roster and options (recorded again as a new run)."""
+    run = catalog.get_run(run_id)
+    if run is None or run["source"] != "manifest" or not run["config"]:
+        raise ValueError(f"No catalogued manifest run '{run_id}'")
+    config = run["config"]
+    entries = load_manifest(json.dumps({"entries": config["entries"]}), "rerun.json")
+    try:
+        timekeepers = catalog.load_input(config["timekeepers_digest"]) if config.get("timekeepers_digest") else None
+        tasks = catalog.load_input(config["task_activity_digest"]) if config.get("task_activity_digest") else None
+    except KeyError as e:
+        raise ValueError(f"Manifest run '{run_id}' refers to input {e} that is no longer in the catalog")
+    return run_manifest(
+        entries, out_dir, timekeeper_data=timekeepers,
+        task_activity_desc=[tuple(t) for t in tasks] if tasks else None,
+        settings=GenerationSettings.from_mapping(config.get("settings") or {}),
+        pdf_output=PdfOutputOptions(**(config.get("pdf_output") or {})),
+        line_items_format=config.get("line_items_format"), catalog=catalog, number_pattern=config.get("number_pattern"), **kwargs
+    )
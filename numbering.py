@@ -0,0 +1,160 @@
+"""Collision-free invoice numbering: a persistent counter leased out in blocks, plus unique artifact names."""
+import contextlib
+import datetime
+import os
+import sqlite3
+import string
+import threading
+from typing import Any, Dict, Iterator, Optional, Set
+
+from run_catalog import CATALOG_BUSY_TIMEOUT_S, DEFAULT_CATALOG_PATH
+
+# --- Numbering configuration ---
+DEFAULT_NUMBERING_PATH = DEFAULT_CATALOG_PATH     # counters live in the run catalog's SQLite file
+DEFAULT_SEQUENCE = "invoice"
+NUMBER_BLOCK_SIZE = 100                           # numbers leased per round trip to the counter
+RUN_NUMBER_PATTERN = "{base}-{index}"             # per-run numbering (restarts at 1 every run)
+NUMBER_PATTERNS = {
+    "{base}-{seq}": "Base + counter (INV-1042)",
+    "{base}-{end:%Y%m}-{seq:05d}": "Base + period + padded counter (INV-202505-01042)",
+    "{matter}-{seq:06d}": "Matter + padded counter (2025-000101-001042)",
+}
+# -------------------------------
+
+_PATTERN_FIELDS = {"base", "seq", "index", "matter", "profile", "start", "end"}
+
+
+def validate_pattern(pattern: str, require_seq: bool = True) -> None:
+    """Raise ValueError unless pattern only uses known fields (and includes {seq} when required)."""
+    try:
+        fields = {name for _, name, _, _ in string.Formatter().parse(pattern) if name is not None}
+    except ValueError as e:
+        raise ValueError(f"Invalid number pattern '{pattern}': {e}")
+    unknown = fields - _PATTERN_FIELDS
+    if unknown:
+        raise ValueError(f"Number pattern '{pattern}' uses unknown field(s) {', '.join(sorted(unknown))}; use {', '.join(sorted(_PATTERN_FIELDS))}")
+    if require_seq and "seq" not in fields:
+        raise ValueError(f"Number pattern '{pattern}' must include {{seq}} to be unique across runs")
+
+
+def format_number(pattern: str, seq: int, index: int = 1, base: str = "", matter: str = "", profile: str = "",
+                  start: Optional[datetime.date] = None, end: Optional[datetime.date] = None) -> str:
+    """Render one invoice number; index is the 1-based position within the run."""
+    return pattern.format(base=base, seq=seq, index=index, matter=matter, profile=profile,
+                          start=start or datetime.date.min, end=end or datetime.date.min)
+
+
+class NumberCounter:
+    """
+    Named, monotonically increasing counters in SQLite. reserve() hands out a contiguous
+    block atomically (BEGIN IMMEDIATE), so processes sharing the file never overlap.
+    """
+
+    def __init__(self, path: str = DEFAULT_NUMBERING_PATH):
+        self.path = path
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("CREATE TABLE IF NOT EXISTS number_counters (name TEXT PRIMARY KEY, next_value INTEGER NOT NULL)")
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=CATALOG_BUSY_TIMEOUT_S, isolation_level=None)
+        try:
+            conn.execute("BEGIN IMMEDIATE")  # take the write lock before reading the counter
+            try:
+                yield conn
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        finally:
+            conn.close()
+
+    def reserve(self, name: str = DEFAULT_SEQUENCE, count: int = NUMBER_BLOCK_SIZE, start: int = 1) -> range:
+        """Reserve the next `count` numbers of sequence `name` (starting at `start` for a new sequence)."""
+        count = max(1, int(count))
+        with self._connect() as conn:
+            row = conn.execute("SELECT next_value FROM number_counters WHERE name = ?", (name,)).fetchone()
+            first = max(row[0], int(start)) if row else int(start)
+            conn.execute("INSERT OR REPLACE INTO number_counters (name, next_value) VALUES (?, ?)", (name, first + count))
+        return range(first, first + count)
+
+    def peek(self, name: str = DEFAULT_SEQUENCE) -> Optional[int]:
+        """The next number that would be reserved, or None for an unused sequence."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT next_value FROM number_counters WHERE name = ?", (name,)).fetchone()
+        return row[0] if row else None
+
+
+class NumberLease:
+    """
+    A worker's view of one sequence: numbers come from a locally held block, and the
+    counter is only touched when the block runs out. Numbers left in a block when the
+    lease is dropped are never reused, so sequences can have gaps but no duplicates.
+    """
+
+    def __init__(self, counter: NumberCounter, name: str = DEFAULT_SEQUENCE, block_size: int = NUMBER_BLOCK_SIZE):
+        self.counter = counter
+        self.name = name
+        self.block_size = max(1, int(block_size))
+        self._block: range = range(0)
+        self._pos = 0
+        self._lock = threading.Lock()
+
+    def next(self) -> int:
+        with self._lock:
+            if self._pos >= len(self._block):
+                self._block, self._pos = self.counter.reserve(self.name, self.block_size), 0
+            value = self._block[self._pos]
+            self._pos += 1
+            return value
+
+
+class InvoiceNumberer:
+    """
+    Assigns invoice numbers for a run. Without a lease it reproduces per-run numbering
+    ({base}-1, {base}-2, ...); with one, every number comes from the persistent counter.
+    """
+
+    def __init__(self, pattern: str = RUN_NUMBER_PATTERN, lease: Optional[NumberLease] = None):
+        validate_pattern(pattern, require_seq=lease is not None)
+        self.pattern = pattern
+        self.lease = lease
+        self._issued: Set[str] = set()
+
+    def number(self, index: int, **fields: Any) -> str:
+        """Number for the invoice at 0-based run position `index`; raises ValueError on a repeat."""
+        seq = self.lease.next() if self.lease is not None else index + 1
+        number = format_number(self.pattern, seq, index=index + 1, **fields)
+        if number in self._issued:
+            raise ValueError(f"Invoice number pattern '{self.pattern}' produced duplicate number {number}")
+        self._issued.add(number)
+        return number
+
+
+def persistent_numberer(pattern: str, path: Optional[str] = None, sequence: str = DEFAULT_SEQUENCE,
+                        block_size: int = NUMBER_BLOCK_SIZE) -> InvoiceNumberer:
+    """InvoiceNumberer backed by the persistent counter at path (the run catalog file by default)."""
+    return InvoiceNumberer(pattern, NumberLease(NumberCounter(path or DEFAULT_NUMBERING_PATH), sequence, block_size))
+
+
+class UniqueNames:
+    """Keeps file names unique within one archive or directory: repeats get _2, _3, ... before the extension."""
+
+    def __init__(self) -> None:
+        self._counts: Dict[str, int] = {}
+
+    def claim(self, name: str) -> str:
+        count = self._counts.get(name, 0) + 1
+        self._counts[name] = count
+        if count == 1:
+            return name
+        stem, ext = os.path.splitext(name)
+        candidate = f"{stem}_{count}{ext}"
+        # A generated candidate can itself clash with a later literal name; keep counting
+        while candidate in self._counts:
+            count += 1
+            candidate = f"{stem}_{count}{ext}"
+        self._counts[name] = count
+        self._counts[candidate] = 1
+        return candidate
@@ -0,0 +1,237 @@
+"""Declarative per-profile PDF invoice layouts, compiled once into ReportLab styles and cached by template hash."""
+import copy
+import functools
+import logging
+import threading
+from typing import Any, Dict, List, NamedTuple, Optional, Union
+
+from artifact_cache import config_hash
+
+# --- Layout templates ---
+# Lengths are in inches; colours are ReportLab names or "#RRGGBB". Profile templates
+# list only what differs from DEFAULT_PDF_LAYOUT.
+DEFAULT_PDF_LAYOUT: Dict[str, Any] = {
+    "page_size": "letter",                  # "letter" or "A4"
+    "margins_in": [1.0, 1.0, 1.0, 1.0],     # left, right, top, bottom
+    "font": "Helvetica",
+    "bold_font": "Helvetica-Bold",
+    "meta_font": "Helvetica-BoldOblique",   # invoice number / date / period block
+    "header_font_size": 12,
+    "body_font_size": 10,
+    "totals_font_size": 11,
+    "law_firm_address": ["One Park Avenue", "Manhattan, NY 10003"],
+    "client_address": ["1360 Post Oak Blvd", "Houston, TX 77056"],
+    "logo_size_in": 0.6,
+    "header_col_widths_in": [3.5, 4.0],
+    "line_col_widths_in": [0.8, 0.7, 0.7, 1.3, 1.8, 0.8, 0.8, 0.8],
+    "totals_col_widths_in": [1.6, 1.2],
+    "colors": {"header_bg": "grey", "header_text": "whitesmoke", "row_bg": "beige", "grid": "black"},
+    "grid_width": 1.0,
+}
+
+PDF_LAYOUTS: Dict[str, Dict[str, Any]] = {
+    "Onit ELM": {},
+    "SimpleLegal": {
+        "colors": {"header_bg": "#1F3A5F", "header_text": "white", "row_bg": "white", "grid": "#9AA5B1"},
+        "grid_width": 0.5,
+    },
+    "Unity": {
+        "font": "Times-Roman",
+        "bold_font": "Times-Bold",
+        "meta_font": "Times-BoldItalic",
+        "colors": {"header_bg": "#0B6E4F", "header_text": "white", "row_bg": "#EEF6F2", "grid": "#4A4A4A"},
+        "grid_width": 0.75,
+    },
+}
+# -------------------------
+
+# Subset-embeddable TrueType fonts shipped with ReportLab (Bitstream Vera), used when fonts are embedded
+EMBEDDED_FONTS = {"font": ("Vera", "Vera.ttf"), "bold_font": ("VeraBd", "VeraBd.ttf"), "meta_font": ("VeraBI", "VeraBI.ttf")}
+
+_COMPILED_LAYOUTS: Dict[str, "CompiledLayout"] = {}
+_COMPILE_LOCK = threading.Lock()
+
+
+class CompiledLayout(NamedTuple):
+    """ReportLab objects for one layout template; built once and shared by every PDF that uses it."""
+    template_hash: str
+    doc_kwargs: Dict[str, Any]              # SimpleDocTemplate page size and frame margins
+    styles: Dict[str, Any]                  # ParagraphStyles
+    header_table_style: Any
+    line_table_style: Any
+    totals_table_style: Any
+    summary_table_style: Any
+    header_col_widths: List[float]
+    line_col_widths: List[float]
+    totals_col_widths: List[float]
+    logo_size: float
+    law_firm_address: str                   # pre-joined with <br/>
+    client_address: str
+
+
+def _merge(base: Dict[str, Any], overrides: Dict[str, Any]) -> Dict[str, Any]:
+    merged = copy.deepcopy(base)
+    for key, value in overrides.items():
+        if isinstance(value, dict) and isinstance(merged.get(key), dict):
+            merged[key] = {**merged[key], **value}
+        else:
+            merged[key] = value
+    return merged
+
+
+def resolve_layout_template(layout: Union[None, str, Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Full template for a profile name, an override dict, or None (the default layout).
+    Unknown profile names fall back to the default layout.
+    """
+    if layout is None:
+        return DEFAULT_PDF_LAYOUT
+    if isinstance(layout, str):
+        if layout not in PDF_LAYOUTS:
+            logging.error(f"No PDF layout for profile '{layout}'; using the default layout.")
+            return DEFAULT_PDF_LAYOUT
+        layout = PDF_LAYOUTS[layout]
+    return _merge(DEFAULT_PDF_LAYOUT, layout)
+
+
+def layout_hash(layout: Union[None, str, Dict[str, Any]] = None) -> str:
+    """Stable hash of the resolved template (use it in artifact cache keys)."""
+    return config_hash(resolve_layout_template(layout))
+
+
+def _compile(template: Dict[str, Any], template_hash: str) -> CompiledLayout:
+    from reportlab.lib import colors
+    from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
+    from reportlab.lib.pagesizes import A4, letter
+    from reportlab.lib.styles import ParagraphStyle, getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.platypus import TableStyle
+
+    font, bold = template["font"], template["bold_font"]
+    body_size = template["body_font_size"]
+    palette = {name: colors.toColor(value) for name, value in template["colors"].items()}
+    left, right, top, bottom = (m * inch for m in template["margins_in"])
+
+    sample = getSampleStyleSheet()
+    header_info = ParagraphStyle('HeaderInfo', parent=sample['Normal'], fontName=bold, fontSize=template["header_font_size"],
+                                 leading=template["header_font_size"] + 2, alignment=TA_LEFT)
+    styles = {
+        'header_info': header_info,
+        'client_info': ParagraphStyle('ClientInfo', parent=header_info, alignment=TA_RIGHT),
+        'table_header': ParagraphStyle('TableHeader', parent=sample['Normal'], fontName=bold, fontSize=body_size, leading=body_size + 2, alignment=TA_CENTER, wordWrap='CJK'),
+        'table_data': ParagraphStyle('TableData', parent=sample['Normal'], fontName=font, fontSize=body_size, leading=body_size + 2, alignment=TA_LEFT, wordWrap='CJK'),
+        'right_align': ParagraphStyle('InvoiceMeta', parent=sample['Heading4'], fontName=template["meta_font"]),
+        'totals_label': ParagraphStyle('TotalsLabel', parent=sample['Normal'], fontName=bold, fontSize=template["totals_font_size"], alignment=TA_RIGHT),
+        'totals_amt': ParagraphStyle('TotalsAmt', parent=sample['Normal'], fontName=bold, fontSize=template["totals_font_size"], alignment=TA_RIGHT),
+    }
+
+    header_table_style = TableStyle([
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (0, 0), 0),
+        ('RIGHTPADDING', (0, 0), (0, 0), 0),
+        ('TOPPADDING', (0, 0), (-1, -1), 0),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 0),
+    ])
+    line_table_style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), palette["header_bg"]),
+        ('TEXTCOLOR', (0, 0), (-1, 0), palette["header_text"]),
+        ('FONTNAME', (0, 0), (-1, 0), bold),
+        ('FONTNAME', (0, 1), (-1, -1), font),
+        ('FONTSIZE', (0, 0), (-1, 0), body_size),
+        ('BOTTOMPADDING', (0, 0), (-1, 0), 12),
+        ('BACKGROUND', (0, 1), (-1, -1), palette["row_bg"]),
+        ('GRID', (0, 0), (-1, -1), template["grid_width"], palette["grid"]),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('ALIGN', (0, 0), (0, -1), 'CENTER'),
+        ('ALIGN', (1, 1), (2, -1), 'CENTER'),
+        ('ALIGN', (5, 0), (5, -1), 'CENTER'),
+        ('ALIGN', (6, 0), (6, -1), 'RIGHT'),
+        ('ALIGN', (7, 0), (7, -1), 'RIGHT'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 2),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 2),
+        ('TOPPADDING', (0, 0), (-1, -1), 2),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+    ])
+    totals_table_style = TableStyle([
+        ('ALIGN', (0, 0), (-1, -1), 'RIGHT'),
+        ('VALIGN', (0, 0), (-1, -1), 'TOP'),
+        ('LEFTPADDING', (0, 0), (-1, -1), 4),
+        ('RIGHTPADDING', (0, 0), (-1, -1), 0),
+        ('TOPPADDING', (0, 0), (-1, -1), 2),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+    ])
+    summary_table_style = TableStyle([
+        ('BACKGROUND', (0, 0), (-1, 0), palette["header_bg"]),
+        ('TEXTCOLOR', (0, 0), (-1, 0), palette["header_text"]),
+        ('FONTNAME', (0, 0), (-1, -1), font),
+        ('FONTNAME', (0, 0), (-1, 0), bold),
+        ('FONTNAME', (0, -1), (-1, -1), bold),
+        ('FONTSIZE', (0, 0), (-1, -1), body_size - 1),
+        ('GRID', (0, 0), (-1, -1), min(template["grid_width"], 0.5), palette["grid"]),
+        ('ALIGN', (2, 0), (-1, -1), 'RIGHT'),
+        ('TOPPADDING', (0, 0), (-1, -1), 2),
+        ('BOTTOMPADDING', (0, 0), (-1, -1), 2),
+    ])
+    return CompiledLayout(
+        template_hash=template_hash,
+        doc_kwargs={
+            "pagesize": A4 if str(template["page_size"]).upper() == "A4" else letter,
+            "initialFontName": font,
+            "leftMargin": left, "rightMargin": right, "topMargin": top, "bottomMargin": bottom,
+        },
+        styles=styles,
+        header_table_style=header_table_style,
+        line_table_style=line_table_style,
+        totals_table_style=totals_table_style,
+        summary_table_style=summary_table_style,
+        header_col_widths=[w * inch for w in template["header_col_widths_in"]],
+        line_col_widths=[w * inch for w in template["line_col_widths_in"]],
+        totals_col_widths=[w * inch for w in template["totals_col_widths_in"]],
+        logo_size=template["logo_size_in"] * inch,
+        law_firm_address="<br/>".join(template["law_firm_address"]),
+        client_address="<br/>".join(template["client_address"]),
+    )
+
+
+def _compile_template(template: Dict[str, Any]) -> CompiledLayout:
+    key = config_hash(template)
+    compiled = _COMPILED_LAYOUTS.get(key)
+    if compiled is None:
+        with _COMPILE_LOCK:
+            compiled = _COMPILED_LAYOUTS.get(key)
+            if compiled is None:
+                compiled = _COMPILED_LAYOUTS[key] = _compile(template, key)
+    return compiled
+
+
+@functools.lru_cache(maxsize=1)
+def _register_embedded_fonts() -> None:
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    for name, filename in EMBEDDED_FONTS.values():
+        pdfmetrics.registerFont(TTFont(name, filename))
+
+
+def _with_embedded_fonts(template: Dict[str, Any]) -> Dict[str, Any]:
+    """The template with its fonts swapped for TrueType faces, which ReportLab embeds as subsets."""
+    _register_embedded_fonts()
+    return _merge(template, {key: name for key, (name, _) in EMBEDDED_FONTS.items()})
+
+
+@functools.lru_cache(maxsize=None)
+def _compile_named(name: Optional[str], embed_fonts: bool = False) -> CompiledLayout:
+    template = resolve_layout_template(name)
+    return _compile_template(_with_embedded_fonts(template) if embed_fonts else template)
+
+
+def compile_layout(layout: Union[None, str, Dict[str, Any]] = None, embed_fonts: bool = False) -> CompiledLayout:
+    """
+    Compiled layout for a profile name, template dict or None, memoised by template
+    hash (and by name, so switching profiles between invoices is a dictionary lookup).
+    With embed_fonts, the standard fonts are replaced by embedded TrueType subsets.
+    """
+    if layout is None or isinstance(layout, str):
+        return _compile_named(layout, embed_fonts)
+    template = resolve_layout_template(layout)
+    return _compile_template(_with_embedded_fonts(template) if embed_fonts else template)
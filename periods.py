@@ -0,0 +1,308 @@
+"""Billing period planning, business-day/holiday calendars and parallel per-period generation."""
+import bisect
+import calendar
+import datetime
+import functools
+import itertools
+import logging
+import multiprocessing
+import pickle
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, FrozenSet, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from rng import invoice_random
+
+PERIOD_FREQUENCIES = ["Monthly", "Semi-monthly", "Quarterly", "Custom"]
+MAX_PLANNED_PERIODS = 240  # 20 years of monthly backfill
+PARALLEL_MIN_JOBS = 4      # below this, worker start-up costs more than it saves
+# Relative activity per weekday (Mon..Sun); a weight of 0 makes the day unbillable
+WEEKDAY_PATTERNS: Dict[str, Tuple[float, ...]] = {
+    "Uniform": (1.0, 1.0, 1.0, 1.0, 1.0, 1.0, 1.0),
+    "Office Week (lighter Fridays, no weekends)": (1.0, 1.0, 1.0, 1.0, 0.6, 0.0, 0.0),
+    "Busy Week (occasional weekends)": (1.0, 1.0, 1.0, 1.0, 0.8, 0.15, 0.05),
+}
+
+
+class BillingPeriod(NamedTuple):
+    index: int
+    start: datetime.date
+    end: datetime.date
+
+
+def _previous_period(start: datetime.date, end: datetime.date, frequency: str) -> Tuple[datetime.date, datetime.date]:
+    """Return the period immediately before (start, end) for the given frequency."""
+    prev_end = start - datetime.timedelta(days=1)
+    if frequency == "Semi-monthly":
+        return prev_end.replace(day=16 if prev_end.day > 15 else 1), prev_end
+    if frequency == "Quarterly":
+        return datetime.date(prev_end.year, 3 * ((prev_end.month - 1) // 3) + 1, 1), prev_end
+    if frequency == "Custom":
+        length = (end - start).days
+        return prev_end - datetime.timedelta(days=length), prev_end
+    return prev_end.replace(day=1), prev_end  # Monthly
+
+
+def plan_periods(start: datetime.date, end: datetime.date, count: int, frequency: str = "Monthly") -> List[BillingPeriod]:
+    """
+    Compute the full period calendar up front: the given period first, then `count - 1`
+    earlier periods, newest to oldest. "Custom" repeats the length of the given period.
+    """
+    if frequency not in PERIOD_FREQUENCIES:
+        raise ValueError(f"Unknown billing frequency '{frequency}'")
+    count = max(1, min(int(count), MAX_PLANNED_PERIODS))
+    periods = [BillingPeriod(0, start, end)]
+    for i in range(1, count):
+        prev_start, prev_end = _previous_period(periods[-1].start, periods[-1].end, frequency)
+        periods.append(BillingPeriod(i, prev_start, prev_end))
+    return periods
+
+
+# --- Holiday and business-day calendars ---
+
+def _nth_weekday(year: int, month: int, weekday: int, n: int) -> datetime.date:
+    """n-th (1-based; -1 = last) occurrence of weekday (Mon=0) in a month."""
+    if n > 0:
+        first = datetime.date(year, month, 1)
+        return first + datetime.timedelta(days=(weekday - first.weekday()) % 7 + 7 * (n - 1))
+    last = datetime.date(year, month, calendar.monthrange(year, month)[1])
+    return last - datetime.timedelta(days=(last.weekday() - weekday) % 7)
+
+
+def _observed(day: datetime.date) -> datetime.date:
+    """Federal observance: Saturday holidays move to Friday, Sunday holidays to Monday."""
+    if day.weekday() == 5:
+        return day - datetime.timedelta(days=1)
+    if day.weekday() == 6:
+        return day + datetime.timedelta(days=1)
+    return day
+
+
+@functools.lru_cache(maxsize=64)
+def us_federal_holidays(year: int) -> FrozenSet[datetime.date]:
+    """Observed US federal holidays for a year (computed, no external calendar package)."""
+    return frozenset({
+        _observed(datetime.date(year, 1, 1)),      # New Year's Day
+        _nth_weekday(year, 1, 0, 3),               # Martin Luther King Jr. Day
+        _nth_weekday(year, 2, 0, 3),               # Washington's Birthday
+        _nth_weekday(year, 5, 0, -1),              # Memorial Day
+        _observed(datetime.date(year, 6, 19)),     # Juneteenth
+        _observed(datetime.date(year, 7, 4)),      # Independence Day
+        _nth_weekday(year, 9, 0, 1),               # Labor Day
+        _nth_weekday(year, 10, 0, 2),              # Columbus Day
+        _observed(datetime.date(year, 11, 11)),    # Veterans Day
+        _nth_weekday(year, 11, 3, 4),              # Thanksgiving
+        _observed(datetime.date(year, 12, 25)),    # Christmas Day
+    })
+
+
+def parse_holidays(text: Any) -> Tuple[datetime.date, ...]:
+    """Parse YYYY-MM-DD dates separated by newlines or commas; invalid entries are logged and skipped."""
+    if not text:
+        return ()
+    if isinstance(text, (list, tuple, set, frozenset)):
+        items: Iterable[Any] = text
+    else:
+        items = str(text).replace(",", "\n").splitlines()
+    days = set()
+    for item in items:
+        if isinstance(item, datetime.date):
+            days.add(item)
+            continue
+        item = str(item).strip()
+        if not item:
+            continue
+        try:
+            days.add(datetime.date.fromisoformat(item))
+        except ValueError:
+            logging.error(f"Ignoring invalid holiday date: {item!r}")
+    return tuple(sorted(days))
+
+
+@functools.lru_cache(maxsize=512)
+def billable_dates(start: datetime.date, end: datetime.date, business_days_only: bool = False,
+                   exclude_us_holidays: bool = False, extra_holidays: Tuple[datetime.date, ...] = ()) -> Tuple[datetime.date, ...]:
+    """
+    Dates in [start, end] on which time may be billed.
+
+    If the calendar excludes every day in the period, all days are allowed, so
+    generation never stalls.
+    """
+    num_days = max(1, (end - start).days + 1)
+    all_days = tuple(start + datetime.timedelta(days=d) for d in range(num_days))
+    if not (business_days_only or exclude_us_holidays or extra_holidays):
+        return all_days
+    blocked = set(extra_holidays)
+    if exclude_us_holidays:
+        for year in range(start.year, end.year + 1):
+            blocked |= us_federal_holidays(year)
+    eligible = tuple(d for d in all_days if d not in blocked and not (business_days_only and d.weekday() >= 5))
+    if not eligible:
+        logging.error(f"No billable days between {start} and {end}; falling back to every calendar day.")
+        return all_days
+    return eligible
+
+
+class CalendarIndex:
+    """
+    The billable days of one period, with sampling weights and pre-formatted date strings.
+
+    It is built once per (period, calendar) and shared by every row. Samplers return
+    day indices, and rows look up `dates[i]` / `date_strs[i]` instead of building
+    and formatting a date for each row.
+    """
+    __slots__ = ("dates", "date_strs", "weights", "_cum_weights", "_uniform")
+
+    def __init__(self, dates: Tuple[datetime.date, ...], weights: Tuple[float, ...]) -> None:
+        self.dates = dates
+        self.date_strs = tuple(d.isoformat() for d in dates)
+        self.weights = weights
+        self._cum_weights = list(itertools.accumulate(weights))
+        self._uniform = len(set(weights)) <= 1
+
+    def __len__(self) -> int:
+        return len(self.dates)
+
+    def sample_index(self) -> int:
+        """One weighted day index drawn from invoice_random (uniform draws match randint)."""
+        if self._uniform:
+            return invoice_random.randrange(len(self.dates))
+        return bisect.bisect_right(self._cum_weights, invoice_random.random() * self._cum_weights[-1])
+
+    def sample_indices(self, rng: Any, size: int) -> List[int]:
+        """`size` weighted day indices drawn in one vectorized call on a numpy Generator."""
+        if self._uniform:
+            return rng.integers(0, len(self.dates), size=size).tolist()
+        import numpy as np
+
+        cum = np.asarray(self._cum_weights)
+        return np.searchsorted(cum, rng.random(size) * cum[-1], side="right").tolist()
+
+
+@functools.lru_cache(maxsize=512)
+def calendar_index(start: datetime.date, end: datetime.date, business_days_only: bool = False,
+                   exclude_us_holidays: bool = False, extra_holidays: Tuple[datetime.date, ...] = (),
+                   weekday_weights: Tuple[float, ...] = WEEKDAY_PATTERNS["Uniform"]) -> CalendarIndex:
+    """Precomputed, memoised calendar for a period: billable days with positive weekday weight."""
+    days = billable_dates(start, end, business_days_only, exclude_us_holidays, extra_holidays)
+    weighted = [(d, float(weekday_weights[d.weekday()])) for d in days if weekday_weights[d.weekday()] > 0]
+    if not weighted:
+        logging.error(f"Weekday pattern leaves no billable days between {start} and {end}; weighting days evenly.")
+        weighted = [(d, 1.0) for d in days]
+    return CalendarIndex(tuple(d for d, _ in weighted), tuple(w for _, w in weighted))
+
+
+# --- Parallel per-period row generation ---
+
+_WORKER_SHARED: Dict[str, Any] = {}   # set once per worker process; the inline path passes its own dict
+
+
+def _init_worker(shared: Dict[str, Any], log_queue: Any = None, log_level: int = logging.INFO) -> None:
+    """
+    Receive run-wide inputs (timekeepers, task catalog, settings and the caller's log context)
+    once per worker process, plus the parent's logging queue when it has one (see
+    telemetry.configure_logging).
+    """
+    if log_queue is not None:
+        from telemetry import init_worker_telemetry
+
+        init_worker_telemetry(log_queue, log_level)
+    _WORKER_SHARED.clear()
+    _WORKER_SHARED.update(shared)
+    _WORKER_SHARED["faker"] = None
+
+
+def _build_period_rows(job: Dict[str, Any], shared: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Generate one invoice's rows (plus mandatory items), the generator's total and the rows'
+    summary, logging under the run's context and the invoice index. Runs in a worker (reading
+    _WORKER_SHARED) or inline with the caller's own `shared`, never the process global.
+    """
+    from telemetry import log_context
+
+    shared = _WORKER_SHARED if shared is None else shared
+    with log_context(**shared.get("log_context", {}), invoice_index=job["invoice_index"]):
+        return _period_rows(job, shared)
+
+
+def _period_rows(job: Dict[str, Any], shared: Dict[str, Any]) -> Dict[str, Any]:
+    from invoice_engine import _ensure_mandatory_lines, _generate_invoice_data, _seed_invoice_rng
+    from invoice_summary import summarize_invoice
+
+    if shared.get("faker") is None:
+        from faker import Faker
+        shared["faker"] = Faker()
+    faker_instance = shared["faker"]
+
+    _seed_invoice_rng(shared["seed"], job["invoice_index"], "rows", faker_instance)
+    rows, total_amount = _generate_invoice_data(
+        shared["fee_count"], shared["expense_count"], shared["timekeepers"], shared["client_id"],
+        shared["law_firm_id"], job["invoice_desc"], job["start"], job["end"],
+        shared["task_activity_desc"], shared["major_task_codes"], shared["max_daily_hours"],
+        shared["include_block_billed"], faker_instance, shared["settings"]
+    )
+    skipped: List[str] = []
+    # A MandatoryItemPlan compiled once for the run (a list of item names is compiled here)
+    if shared.get("mandatory_items"):
+        before = sum(float(row["LINE_ITEM_TOTAL"]) for row in rows)
+        rows, skipped = _ensure_mandatory_lines(
+            rows, shared["timekeepers"], job["invoice_desc"], shared["client_id"], shared["law_firm_id"],
+            job["start"], job["end"], shared["mandatory_items"], shared["settings"]
+        )
+        # Carry the generator's total across the injected lines rather than re-summing the rows
+        total_amount += sum(float(row["LINE_ITEM_TOTAL"]) for row in rows) - before
+    return {
+        "invoice_index": job["invoice_index"], "rows": rows, "skipped": skipped,
+        "total": total_amount, "summary": summarize_invoice(rows),
+    }
+
+
+def dispatch_period_rows(
+    shared: Dict[str, Any],
+    jobs: List[Dict[str, Any]],
+    max_workers: int = 1,
+    progress_callback: Optional[Callable[[int, int], None]] = None,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Generate rows for each job, in a process pool when max_workers > 1 and there are
+    at least PARALLEL_MIN_JOBS jobs.
+
+    Each job needs 'invoice_index', 'start', 'end' and 'invoice_desc'. Inputs shared
+    by the whole run are sent to each worker once, through the pool initializer, together
+    with the caller's log context so worker records carry its run_id.
+    Results arrive in completion order. Per-invoice seeding makes them identical
+    to a serial run. A broken pool (or inputs that cannot be sent to it) falls back to
+    generating the remaining jobs inline; errors raised by a job itself propagate.
+    """
+    done = 0
+    workers = min(int(max_workers or 1), len(jobs))
+    if workers > 1 and len(jobs) >= PARALLEL_MIN_JOBS:
+        pending = {job["invoice_index"]: job for job in jobs}
+        from telemetry import current_log_context, telemetry_queue
+
+        worker_shared = dict(shared, log_context=current_log_context())
+        try:
+            with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"),
+                                     initializer=_init_worker, initargs=(worker_shared, telemetry_queue(), logging.getLogger().level)) as pool:
+                futures = [pool.submit(_build_period_rows, job) for job in jobs]
+                for future in as_completed(futures):
+                    result = future.result()
+                    pending.pop(result["invoice_index"], None)
+                    done += 1
+                    if progress_callback:
+                        progress_callback(done, len(jobs))
+                    yield result
+            return
+        except (BrokenProcessPool, pickle.PicklingError, OSError) as e:
+            logging.error(f"Parallel period generation failed ({e}); finishing serially.")
+            jobs = list(pending.values())
+
+    # Inline runs share the Streamlit server process with other sessions: use a private copy
+    inline_shared = dict(shared, faker=None)
+    total = done + len(jobs)
+    for job in jobs:
+        result = _build_period_rows(job, inline_shared)
+        done += 1
+        if progress_callback:
+            progress_callback(done, total)
+        yield result
@@ -0,0 +1,81 @@
+"""Lazy, paginated views over generated invoice rows (for the in-app invoice browser)."""
+from typing import TYPE_CHECKING, Any, Dict, List, NamedTuple, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+PREVIEW_PAGE_SIZE = 50
+PREVIEW_COLUMNS = [
+    "LINE_ITEM_DATE", "TIMEKEEPER_NAME", "TIMEKEEPER_CLASSIFICATION", "TASK_CODE", "ACTIVITY_CODE",
+    "EXPENSE_CODE", "DESCRIPTION", "HOURS", "RATE", "LINE_ITEM_TOTAL",
+]
+
+
+class RowView(NamedTuple):
+    """Positions of the rows matching a filter, plus totals accumulated in the same pass."""
+    indices: List[int]
+    totals: Dict[str, float]
+
+
+def facets(summary: Dict[str, Any]) -> Dict[str, List[str]]:
+    """Distinct filter values (timekeepers, task codes, expense codes) read from an invoice summary."""
+    return {
+        "timekeepers": [t for t in summary["by_timekeeper"] if t],
+        "task_codes": [t for t in summary["by_task_code"] if t],
+        "expense_codes": list(summary["by_expense_code"]),
+    }
+
+
+def summary_totals(summary: Dict[str, Any]) -> Dict[str, float]:
+    """The unfiltered totals, in filter_rows() shape, taken from an invoice summary without scanning rows."""
+    return {
+        "lines": summary["lines"], "fees": summary["fees_total"], "expenses": summary["expenses_total"],
+        "hours": summary["hours"], "total": summary["total"],
+    }
+
+
+def filter_rows(rows: List[Dict[str, Any]], timekeeper: Optional[str] = None, task_code: Optional[str] = None,
+                expense_code: Optional[str] = None) -> RowView:
+    """
+    Select matching rows and total them in one pass, without building a DataFrame.
+
+    A None filter matches everything. The timekeeper and task filters select fee
+    lines and the expense filter selects expense lines, so combining filters of
+    both kinds matches nothing.
+    """
+    indices: List[int] = []
+    fees = expenses = hours = 0.0
+    for pos, row in enumerate(rows):
+        code = row.get("EXPENSE_CODE")
+        if expense_code is not None and code != expense_code:
+            continue
+        if timekeeper is not None and (code or row.get("TIMEKEEPER_NAME") != timekeeper):
+            continue
+        if task_code is not None and (code or row.get("TASK_CODE") != task_code):
+            continue
+        indices.append(pos)
+        amount = float(row.get("LINE_ITEM_TOTAL", 0.0))
+        if code:
+            expenses += amount
+        else:
+            fees += amount
+            hours += float(row.get("HOURS", 0.0))
+    return RowView(indices, {
+        "lines": len(indices), "fees": round(fees, 2), "expenses": round(expenses, 2),
+        "hours": round(hours, 2), "total": round(fees + expenses, 2),
+    })
+
+
+def page_count(total_rows: int, page_size: int = PREVIEW_PAGE_SIZE) -> int:
+    return max(1, -(-total_rows // page_size))
+
+
+def page_frame(rows: List[Dict[str, Any]], indices: List[int], page: int, page_size: int = PREVIEW_PAGE_SIZE) -> "pd.DataFrame":
+    """DataFrame for one page (1-based) of the selected rows; only that page is materialised."""
+    import pandas as pd
+
+    start = (max(1, page) - 1) * page_size
+    selected = indices[start:start + page_size]
+    frame = pd.DataFrame([rows[i] for i in selected], columns=PREVIEW_COLUMNS)
+    frame.index = [start + n + 1 for n in range(len(selected))]
+    return frame
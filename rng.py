@@ -0,0 +1,23 @@
+"""Per-thread random streams for invoice generation."""
+import random
+import threading
+from typing import Any
+
+
+class ThreadLocalRandom(threading.local):
+    """
+    Stand-in for the `random` module's functions, backed by one random.Random per thread.
+
+    The Streamlit server runs each session's script in its own thread, so drawing from the
+    module-level generator let one session's per-invoice reseed interleave with another
+    session's draws. seed() gives the same sequences as random.seed().
+    """
+
+    def __init__(self) -> None:
+        self.generator = random.Random()
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.generator, name)
+
+
+invoice_random = ThreadLocalRandom()
@@ -0,0 +1,308 @@
+"""Local SQLite catalog of generation runs: configs, seeds, timings, per-invoice totals, artifacts and line items."""
+import contextlib
+import datetime
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import time
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# --- Run catalog configuration ---
+DEFAULT_CATALOG_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".run_catalog.sqlite")
+CATALOG_BUSY_TIMEOUT_S = 30.0       # writers from other workers/processes wait this long for the lock
+CATALOG_SCHEMA_VERSION = 1
+# ---------------------------------
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    run_id       TEXT PRIMARY KEY,
+    source       TEXT NOT NULL,              -- app, manifest, stress, service
+    status       TEXT NOT NULL,              -- running, done, failed
+    config_hash  TEXT,
+    seed         INTEGER,
+    config       TEXT,                       -- JSON; enough to regenerate the run (large inputs by digest)
+    started_at   REAL NOT NULL,
+    finished_at  REAL,
+    elapsed_s    REAL,
+    invoices     INTEGER NOT NULL DEFAULT 0,
+    lines        INTEGER NOT NULL DEFAULT 0,
+    total        REAL NOT NULL DEFAULT 0,
+    bytes        INTEGER NOT NULL DEFAULT 0,
+    emailed      INTEGER NOT NULL DEFAULT 0,
+    out_dir      TEXT,
+    error        TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_started ON runs (started_at);
+CREATE INDEX IF NOT EXISTS runs_config ON runs (config_hash, seed);
+
+CREATE TABLE IF NOT EXISTS inputs (
+    digest       TEXT PRIMARY KEY,           -- SHA-256 of the JSON below
+    kind         TEXT NOT NULL,              -- timekeepers, task_activity
+    data         TEXT NOT NULL,              -- JSON, stored once however many runs use it
+    created_at   REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS invoices (
+    invoice_id      INTEGER PRIMARY KEY,
+    run_id          TEXT NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    invoice_number  TEXT NOT NULL,
+    matter_number   TEXT,
+    profile         TEXT,
+    client_id       TEXT,
+    law_firm_id     TEXT,
+    billing_start   TEXT NOT NULL,           -- ISO dates compare correctly as text
+    billing_end     TEXT NOT NULL,
+    lines           INTEGER NOT NULL,
+    hours           REAL NOT NULL,
+    fees_total      REAL NOT NULL,
+    expenses_total  REAL NOT NULL,
+    total           REAL NOT NULL,
+    rows_key        TEXT                     -- artifact cache key of the rows, when cached
+);
+CREATE INDEX IF NOT EXISTS invoices_matter ON invoices (matter_number, billing_end);
+CREATE INDEX IF NOT EXISTS invoices_profile ON invoices (profile, billing_end);
+CREATE INDEX IF NOT EXISTS invoices_number ON invoices (invoice_number);
+CREATE INDEX IF NOT EXISTS invoices_run ON invoices (run_id);
+
+CREATE TABLE IF NOT EXISTS artifacts (
+    artifact_id     INTEGER PRIMARY KEY,
+    run_id          TEXT NOT NULL REFERENCES runs (run_id) ON DELETE CASCADE,
+    invoice_number  TEXT,
+    name            TEXT NOT NULL,
+    path            TEXT,                    -- file on disk or "bundle.zip/member"; NULL for in-memory downloads
+    bytes           INTEGER NOT NULL
+);
+CREATE INDEX IF NOT EXISTS artifacts_run ON artifacts (run_id);
+CREATE INDEX IF NOT EXISTS artifacts_invoice ON artifacts (invoice_number);
+
+CREATE TABLE IF NOT EXISTS line_items (
+    invoice_id      INTEGER NOT NULL REFERENCES invoices (invoice_id) ON DELETE CASCADE,
+    line_no         INTEGER NOT NULL,
+    line_date       TEXT,
+    timekeeper_id   TEXT,
+    task_code       TEXT,
+    activity_code   TEXT,
+    expense_code    TEXT,
+    description     TEXT,
+    hours           REAL,
+    rate            REAL,
+    total           REAL,
+    PRIMARY KEY (invoice_id, line_no)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS line_items_timekeeper ON line_items (timekeeper_id);
+CREATE INDEX IF NOT EXISTS line_items_task ON line_items (task_code);
+"""
+
+_LINE_ITEM_FIELDS = ("LINE_ITEM_DATE", "TIMEKEEPER_ID", "TASK_CODE", "ACTIVITY_CODE", "EXPENSE_CODE", "DESCRIPTION", "HOURS", "RATE", "LINE_ITEM_TOTAL")
+
+
+def _iso(value: Any) -> str:
+    return value.isoformat() if isinstance(value, (datetime.date, datetime.datetime)) else str(value)
+
+
+def _text(value: Any) -> Optional[str]:
+    # Blank codes and NaN (DataFrame-sourced rows) are stored as NULL
+    if value is None or value == "" or value != value:
+        return None
+    return str(value)
+
+
+class RunCatalog:
+    """
+    Run history backed by one SQLite file (WAL mode, so readers never block the writer).
+
+    Holds only the path: every call opens a short-lived connection, so one catalog can be
+    shared across Streamlit sessions and threads, or pickled into worker processes.
+    """
+
+    def __init__(self, path: str = DEFAULT_CATALOG_PATH):
+        self.path = path
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(_SCHEMA)
+            conn.execute(f"PRAGMA user_version={CATALOG_SCHEMA_VERSION}")
+
+    @contextlib.contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.path, timeout=CATALOG_BUSY_TIMEOUT_S)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.execute("PRAGMA synchronous=NORMAL")  # durable enough in WAL mode, without an fsync per invoice
+        try:
+            with conn:  # one transaction: commit on success, roll back on error
+                yield conn
+        finally:
+            conn.close()
+
+    # --- Recording ---
+
+    def start_run(self, source: str, config: Optional[Dict[str, Any]] = None, seed: Optional[int] = None,
+                  config_hash: Optional[str] = None, out_dir: Optional[str] = None) -> str:
+        """Open a run and return its id; config should hold whatever is needed to regenerate it."""
+        run_id = uuid.uuid4().hex
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO runs (run_id, source, status, config_hash, seed, config, started_at, out_dir) VALUES (?, ?, 'running', ?, ?, ?, ?, ?)",
+                (run_id, source, config_hash, seed, json.dumps(config, default=str) if config is not None else None,
+                 time.time(), os.path.abspath(out_dir) if out_dir else None),
+            )
+        return run_id
+
+    def store_input(self, kind: str, records: Any) -> str:
+        """
+        Store a roster or task catalog once and return its digest, which run configs keep
+        instead of the records themselves; repeated runs on the same upload add nothing.
+        """
+        data = json.dumps(records, sort_keys=True, default=str, separators=(",", ":"))
+        digest = hashlib.sha256(data.encode("utf-8")).hexdigest()
+        with self._connect() as conn:
+            if conn.execute("SELECT 1 FROM inputs WHERE digest = ?", (digest,)).fetchone() is None:
+                conn.execute("INSERT OR IGNORE INTO inputs (digest, kind, data, created_at) VALUES (?, ?, ?, ?)",
+                             (digest, kind, data, time.time()))
+        return digest
+
+    def record_invoice(self, run_id: str, invoice_number: str, rows: Sequence[Dict[str, Any]], summary: Dict[str, Any],
+                       billing_start: Any, billing_end: Any, matter_number: Optional[str] = None, profile: Optional[str] = None,
+                       client_id: Optional[str] = None, law_firm_id: Optional[str] = None, rows_key: Optional[str] = None,
+                       store_line_items: bool = True) -> int:
+        """Record one invoice's totals and (bulk-inserted) line items in a single transaction."""
+        with self._connect() as conn:
+            invoice_id = conn.execute(
+                "INSERT INTO invoices (run_id, invoice_number, matter_number, profile, client_id, law_firm_id, billing_start, billing_end,"
+                " lines, hours, fees_total, expenses_total, total, rows_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run_id, invoice_number, matter_number, profile, client_id, law_firm_id, _iso(billing_start), _iso(billing_end),
+                 summary["lines"], summary["hours"], summary["fees_total"], summary["expenses_total"], summary["total"], rows_key),
+            ).lastrowid
+            if store_line_items and rows:
+                conn.executemany(
+                    "INSERT INTO line_items (invoice_id, line_no, line_date, timekeeper_id, task_code, activity_code, expense_code,"
+                    " description, hours, rate, total) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    ((invoice_id, n, *(_text(row.get(f)) for f in _LINE_ITEM_FIELDS[:6]),
+                      *(float(row.get(f) or 0.0) for f in _LINE_ITEM_FIELDS[6:])) for n, row in enumerate(rows, start=1)),
+                )
+            conn.execute(
+                "UPDATE runs SET invoices = invoices + 1, lines = lines + ?, total = round(total + ?, 2) WHERE run_id = ?",
+                (summary["lines"], summary["total"], run_id),
+            )
+        return invoice_id
+
+    def record_artifacts(self, run_id: str, artifacts: Sequence[Tuple[str, Optional[str], int, Optional[str]]]) -> None:
+        """Record (name, path, bytes, invoice_number) tuples; path is None for in-memory outputs."""
+        if not artifacts:
+            return
+        with self._connect() as conn:
+            conn.executemany(
+                "INSERT INTO artifacts (run_id, name, path, bytes, invoice_number) VALUES (?, ?, ?, ?, ?)",
+                ((run_id, name, path, int(size), invoice_number) for name, path, size, invoice_number in artifacts),
+            )
+            conn.execute("UPDATE runs SET bytes = bytes + ? WHERE run_id = ?", (sum(int(a[2]) for a in artifacts), run_id))
+
+    def finish_run(self, run_id: str, error: Optional[str] = None, emailed: bool = False) -> None:
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE runs SET status = ?, error = ?, emailed = ?, finished_at = ?, elapsed_s = round(? - started_at, 3) WHERE run_id = ?",
+                ("failed" if error else "done", error, int(emailed), time.time(), time.time(), run_id),
+            )
+
+    def mark_emailed(self, run_id: str, emailed: bool = True) -> None:
+        with self._connect() as conn:
+            conn.execute("UPDATE runs SET emailed = ? WHERE run_id = ?", (int(emailed), run_id))
+
+    # --- Queries ---
+
+    def runs(self, limit: int = 50, source: Optional[str] = None) -> List[Dict[str, Any]]:
+        """Most recent runs first (without their config)."""
+        sql = "SELECT run_id, source, status, config_hash, seed, started_at, elapsed_s, invoices, lines, total, bytes, emailed, out_dir, error FROM runs"
+        params: List[Any] = []
+        if source:
+            sql += " WHERE source = ?"
+            params.append(source)
+        with self._connect() as conn:
+            return [dict(r) for r in conn.execute(sql + " ORDER BY started_at DESC LIMIT ?", (*params, int(limit)))]
+
+    def get_run(self, run_id: str) -> Optional[Dict[str, Any]]:
+        """One run with its decoded config, invoices and artifacts, or None."""
+        with self._connect() as conn:
+            run = conn.execute("SELECT * FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if run is None:
+                return None
+            result = dict(run)
+            result["config"] = json.loads(run["config"]) if run["config"] else None
+            result["invoices_detail"] = [dict(r) for r in conn.execute("SELECT * FROM invoices WHERE run_id = ? ORDER BY invoice_id", (run_id,))]
+            result["artifacts"] = [dict(r) for r in conn.execute("SELECT * FROM artifacts WHERE run_id = ? ORDER BY artifact_id", (run_id,))]
+        return result
+
+    def load_input(self, digest: str) -> Any:
+        """Records stored by store_input(); raises KeyError for an unknown digest."""
+        with self._connect() as conn:
+            row = conn.execute("SELECT data FROM inputs WHERE digest = ?", (digest,)).fetchone()
+        if row is None:
+            raise KeyError(digest)
+        return json.loads(row["data"])
+
+    def find_runs(self, config_hash: str, seed: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Earlier runs with the same configuration (and seed), newest first."""
+        sql, params = "SELECT run_id, source, status, seed, started_at, invoices, total FROM runs WHERE config_hash = ?", [config_hash]
+        if seed is not None:
+            sql += " AND seed = ?"
+            params.append(int(seed))
+        with self._connect() as conn:
+            return [dict(r) for r in conn.execute(sql + " ORDER BY started_at DESC", params)]
+
+    def find_invoices(self, matter_number: Optional[str] = None, profile: Optional[str] = None,
+                      period_start: Any = None, period_end: Any = None, invoice_number: Optional[str] = None,
+                      limit: int = 1000) -> List[Dict[str, Any]]:
+        """
+        Invoices matching every given filter, newest period first. A period filter matches
+        invoices whose billing period overlaps [period_start, period_end].
+        """
+        clauses, params = [], []
+        for column, value in (("i.matter_number", matter_number), ("i.profile", profile), ("i.invoice_number", invoice_number)):
+            if value:
+                clauses.append(f"{column} = ?")
+                params.append(value)
+        if period_end is not None:
+            clauses.append("i.billing_start <= ?")
+            params.append(_iso(period_end))
+        if period_start is not None:
+            clauses.append("i.billing_end >= ?")
+            params.append(_iso(period_start))
+        sql = ("SELECT i.*, r.source, r.seed, r.started_at FROM invoices i JOIN runs r ON r.run_id = i.run_id"
+               + (" WHERE " + " AND ".join(clauses) if clauses else "")
+               + " ORDER BY i.billing_end DESC, i.invoice_id DESC LIMIT ?")
+        with self._connect() as conn:
+            return [dict(r) for r in conn.execute(sql, (*params, int(limit)))]
+
+    def line_items(self, invoice_id: int) -> List[Dict[str, Any]]:
+        with self._connect() as conn:
+            return [dict(r) for r in conn.execute("SELECT * FROM line_items WHERE invoice_id = ? ORDER BY line_no", (invoice_id,))]
+
+    def delete_run(self, run_id: str) -> bool:
+        """Forget a run (its invoices, artifacts and line items go with it)."""
+        with self._connect() as conn:
+            return conn.execute("DELETE FROM runs WHERE run_id = ?", (run_id,)).rowcount > 0
+
+
+def catalog_call(catalog: Optional[RunCatalog], method: str, *args: Any, **kwargs: Any) -> Any:
+    """Call a catalog method; SQLite failures are logged and return None, so they never stop generation."""
+    if catalog is None:
+        return None
+    try:
+        return getattr(catalog, method)(*args, **kwargs)
+    except sqlite3.Error as e:
+        logging.error(f"Run catalog {method} failed: {e}")
+        return None
+
+
+def open_catalog(path: Optional[str] = None) -> Optional[RunCatalog]:
+    """The catalog at path (default location if None), or None when it can't be opened; generation never fails on it."""
+    try:
+        return RunCatalog(path or DEFAULT_CATALOG_PATH)
+    except (sqlite3.Error, OSError) as e:
+        logging.error(f"Run catalog unavailable: {e}")
+        return None
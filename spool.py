@@ -0,0 +1,97 @@
+"""Spooled artifacts: large outputs written once into a SpooledTemporaryFile and read back as streams."""
+import io
+import os
+import tempfile
+from typing import BinaryIO, Iterator, Optional, Union
+
+# --- Spool configuration ---
+SPOOL_MEMORY_BYTES = 8 * 1024 * 1024   # kept in memory up to this size, then rolled over to a temp file on disk
+SPOOL_CHUNK_BYTES = 1024 * 1024        # read size when streaming a spool to a consumer
+# ---------------------------
+
+
+class SpooledArtifact:
+    """
+    Append-only artifact (e.g. the combined LEDES file) backed by a SpooledTemporaryFile.
+
+    Each part is encoded once and written straight through, so memory stays bounded by
+    SPOOL_MEMORY_BYTES however many invoices are combined. len() is the size written so far;
+    chunks() streams the content from the start without building one big bytes object.
+    """
+
+    def __init__(self, name: str, max_memory: int = SPOOL_MEMORY_BYTES, directory: Optional[str] = None):
+        self.name = name
+        self._file = tempfile.SpooledTemporaryFile(max_size=max_memory, mode="w+b", dir=directory)
+        self._size = 0
+
+    def write(self, data: bytes) -> int:
+        self._file.seek(0, 2)
+        written = self._file.write(data)
+        self._size += written
+        return written
+
+    def __len__(self) -> int:
+        return self._size
+
+    @property
+    def on_disk(self) -> bool:
+        """True once the content outgrew the memory budget and was rolled over to a temp file."""
+        return bool(getattr(self._file, "_rolled", False))
+
+    def chunks(self, chunk_size: int = SPOOL_CHUNK_BYTES) -> Iterator[bytes]:
+        self._file.seek(0)
+        while True:
+            chunk = self._file.read(chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def reader(self) -> BinaryIO:
+        """
+        A separate read-only file over the content (BytesIO in memory, BufferedReader on disk)
+        for consumers that take file objects, e.g. st.download_button. Close it when done;
+        neither kind copies the content up front.
+        """
+        if not self.on_disk:
+            return io.BytesIO(self._file._file.getvalue())  # shares the buffer until either side writes
+        self._file.flush()
+        reader = os.fdopen(os.dup(self._file.fileno()), "rb")
+        reader.seek(0)
+        return reader
+
+    def getvalue(self) -> bytes:
+        """The whole content, for consumers that only accept bytes."""
+        self._file.seek(0)
+        return self._file.read()
+
+    def close(self) -> None:
+        self._file.close()
+
+    def __enter__(self) -> "SpooledArtifact":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+ArtifactData = Union[bytes, SpooledArtifact]
+
+
+def artifact_bytes(data: ArtifactData) -> bytes:
+    """Bytes of an attachment that may be spooled."""
+    return data.getvalue() if isinstance(data, SpooledArtifact) else data
+
+
+def open_artifact(data: ArtifactData) -> BinaryIO:
+    """A binary file object over an attachment that may be spooled (see SpooledArtifact.reader)."""
+    return data.reader() if isinstance(data, SpooledArtifact) else io.BytesIO(data)
+
+
+def artifact_chunks(data: ArtifactData, chunk_size: int = SPOOL_CHUNK_BYTES) -> Iterator[bytes]:
+    """Stream an attachment that may be spooled; in-memory bytes are sliced without copying the whole."""
+    if isinstance(data, SpooledArtifact):
+        yield from data.chunks(chunk_size)
+        return
+    view = memoryview(data)
+    for start in range(0, len(view), chunk_size):
+        yield bytes(view[start:start + chunk_size])
@@ -0,0 +1,395 @@
+"""Stress-generation mode: stream very large invoice runs straight to an output directory."""
+import argparse
+import dataclasses
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import sys
+import time
+from typing import TYPE_CHECKING, Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from faker import Faker
+
+from artifact_cache import config_hash
+from columnar_export import COLUMNAR_FORMATS
+from invoice_engine import (
+    CONFIG, DEFAULT_GENERATION_SETTINGS, DEFAULT_PDF_OUTPUT, PDF_COMPRESSION_MODES, GenerationSettings, PdfOutputOptions, _create_pdf_invoice, _create_receipt_image, _generate_invoice_data,
+    _iter_ledes_1998b_lines, _seed_invoice_rng,
+)
+from invoice_summary import summarize_invoice, summary_to_csv, summary_to_json
+from ledes_validation import VALIDATION_MODES, ValidationRules, discard_partial_output, has_errors, validate_invoice, violations_to_csv
+from numbering import UniqueNames, persistent_numberer
+from run_catalog import catalog_call
+from telemetry import LOG_FORMATS, METRICS, bind_log_context, configure_logging, record_run
+
+if TYPE_CHECKING:
+    from run_catalog import RunCatalog
+
+# --- Stress mode defaults ---
+STRESS_DEFAULT_TIMEKEEPERS = 25
+STRESS_PROGRESS_EVERY = 10  # invoices between progress callbacks
+STRESS_CLASSIFICATIONS = [("Partner", 450.0), ("Associate", 300.0), ("Paralegal", 150.0)]
+# ----------------------------
+
+
+def _synthetic_timekeepers(count: int, faker_instance: Faker) -> List[Dict]:
+    """Build a synthetic timekeeper roster for stress runs without an uploaded CSV."""
+    roster = []
+    for n in range(count):
+        classification, rate = STRESS_CLASSIFICATIONS[n % len(STRESS_CLASSIFICATIONS)]
+        roster.append({
+            "TIMEKEEPER_NAME": faker_instance.name(),
+            "TIMEKEEPER_CLASSIFICATION": classification,
+            "TIMEKEEPER_ID": f"TK{n + 1:05d}",
+            "RATE": rate,
+        })
+    return roster
+
+
+def iter_stress_invoices(
+    num_invoices: int,
+    fee_count: int,
+    expense_count: int,
+    timekeeper_data: List[Dict],
+    task_activity_desc: List[Tuple[str, str, str]],
+    client_id: str,
+    law_firm_id: str,
+    invoice_desc: str,
+    billing_start_date: datetime.date,
+    billing_end_date: datetime.date,
+    invoice_number_base: str,
+    max_daily_hours: int = 16,
+    include_block_billed: bool = True,
+    seed: int = 0,
+    faker_instance: Optional[Faker] = None,
+    settings: GenerationSettings = DEFAULT_GENERATION_SETTINGS,
+) -> Iterator[Dict[str, Any]]:
+    """
+    Lazily generate invoices one at a time.
+
+    Only the invoice currently being yielded is held in memory; callers should
+    write it out and drop the reference before pulling the next one.
+    """
+    faker_instance = faker_instance or Faker()
+    for i in range(num_invoices):
+        _seed_invoice_rng(seed, i, "rows", faker_instance)
+        rows, total_amount = _generate_invoice_data(
+            fee_count, expense_count, timekeeper_data, client_id, law_firm_id, invoice_desc,
+            billing_start_date, billing_end_date, task_activity_desc, CONFIG['MAJOR_TASK_CODES'],
+            max_daily_hours, include_block_billed, faker_instance, settings
+        )
+        yield {
+            "index": i,
+            "invoice_number": f"{invoice_number_base}-{i + 1}",
+            "rows": rows,
+            "total": total_amount,
+        }
+
+
+def run_stress_generation(
+    out_dir: str,
+    num_invoices: int,
+    fee_count: int,
+    expense_count: int,
+    timekeeper_data: Optional[List[Dict]] = None,
+    task_activity_desc: Optional[List[Tuple[str, str, str]]] = None,
+    client_id: str = CONFIG['DEFAULT_CLIENT_ID'],
+    law_firm_id: str = CONFIG['DEFAULT_LAW_FIRM_ID'],
+    invoice_desc: str = CONFIG['DEFAULT_INVOICE_DESCRIPTION'],
+    billing_start_date: Optional[datetime.date] = None,
+    billing_end_date: Optional[datetime.date] = None,
+    invoice_number_base: str = "STRESS",
+    matter_number: str = "STRESS-MATTER",
+    max_daily_hours: int = 16,
+    include_block_billed: bool = True,
+    combine_ledes: bool = True,
+    include_pdf: bool = False,
+    include_receipts: bool = False,
+    include_summaries: bool = False,
+    seed: int = 0,
+    settings: GenerationSettings = DEFAULT_GENERATION_SETTINGS,
+    progress_callback: Optional[Callable[[Dict[str, Any]], None]] = None,
+    progress_every: int = STRESS_PROGRESS_EVERY,
+    pdf_output: PdfOutputOptions = DEFAULT_PDF_OUTPUT,
+    line_items_format: Optional[str] = None,
+    catalog: Optional["RunCatalog"] = None,
+    number_pattern: Optional[str] = None,
+    validation: str = "off",
+) -> Dict[str, Any]:
+    """
+    Generate invoices and write rows -> LEDES -> optional PDF/receipts directly to out_dir.
+    With line_items_format ("parquet" or "arrow"), line items also go to out_dir/line_items.
+    With a catalog, the run, its invoices, line items and written files are recorded there.
+    With number_pattern, invoice numbers come from the persistent counter (see numbering).
+    With validation "warn" or "block", each invoice is validated before it is written
+    (see ledes_validation); "block" stops the run at the first invoice with errors and
+    removes the files already written, leaving only validation_report.csv.
+
+    Memory use is bounded by the largest single invoice, not by the run size.
+    Returns throughput figures, which are also written to stress_summary.json.
+    """
+    os.makedirs(out_dir, exist_ok=True)
+    faker_instance = Faker()
+    faker_instance.seed_instance(seed)
+    custom_timekeepers, custom_tasks = bool(timekeeper_data), bool(task_activity_desc)
+    if not timekeeper_data:
+        timekeeper_data = _synthetic_timekeepers(STRESS_DEFAULT_TIMEKEEPERS, faker_instance)
+    task_activity_desc = task_activity_desc or CONFIG['DEFAULT_TASK_ACTIVITY_DESC']
+    if billing_start_date is None or billing_end_date is None:
+        last_day_prev = datetime.date.today().replace(day=1) - datetime.timedelta(days=1)
+        billing_start_date, billing_end_date = last_day_prev.replace(day=1), last_day_prev
+
+    numberer = persistent_numberer(number_pattern, catalog.path if catalog is not None else None, block_size=num_invoices) if number_pattern else None
+    receipt_names = UniqueNames()
+    validation_rules = ValidationRules(max_daily_hours=float(max_daily_hours))
+    violations: List[Any] = []
+    outputs: List[str] = []
+    blocked = False
+    stats = {"invoices": 0, "lines": 0, "pdfs": 0, "receipts": 0, "bytes_written": 0, "pdf_bytes": 0, "receipt_bytes": 0, "violations": 0}
+    started = time.perf_counter()
+    combined_file = None
+    exporter = None
+    if line_items_format:
+        from columnar_export import LineItemExporter
+
+        exporter = LineItemExporter(os.path.join(out_dir, "line_items"), line_items_format)
+    line_items = None
+    run_id = None
+    if catalog is not None:
+        try:
+            # Synthetic rosters and the default task catalog follow from the seed; uploads are stored once by digest
+            run_config = {
+                "num_invoices": num_invoices, "fee_count": fee_count, "expense_count": expense_count,
+                "timekeepers_digest": catalog.store_input("timekeepers", timekeeper_data) if custom_timekeepers else None,
+                "task_activity_digest": catalog.store_input("task_activity", task_activity_desc) if custom_tasks else None,
+                "client_id": client_id, "law_firm_id": law_firm_id, "invoice_desc": invoice_desc,
+                "billing_start_date": billing_start_date, "billing_end_date": billing_end_date,
+                "invoice_number_base": invoice_number_base, "matter_number": matter_number, "max_daily_hours": max_daily_hours,
+                "include_block_billed": include_block_billed, "settings": dataclasses.asdict(settings),
+                "number_pattern": number_pattern,
+            }
+            run_id = catalog.start_run("stress", run_config, seed=seed, config_hash=config_hash(run_config), out_dir=out_dir)
+        except sqlite3.Error as e:
+            logging.error(f"Run catalog unavailable for this run: {e}")
+            catalog = None
+    if combine_ledes:
+        combined_file = open(os.path.join(out_dir, "LEDES_Combined.txt"), "wb")
+
+    def _report(final: bool = False) -> None:
+        if not progress_callback:
+            return
+        elapsed = time.perf_counter() - started
+        progress_callback({
+            **stats,
+            "total_invoices": num_invoices,
+            "elapsed_s": elapsed,
+            "lines_per_s": stats["lines"] / elapsed if elapsed else 0.0,
+            "final": final,
+        })
+
+    restore_log_context = bind_log_context(source="stress", run_id=run_id)
+    try:
+        invoices = iter_stress_invoices(
+            num_invoices, fee_count, expense_count, timekeeper_data, task_activity_desc,
+            client_id, law_firm_id, invoice_desc, billing_start_date, billing_end_date,
+            invoice_number_base, max_daily_hours, include_block_billed, seed, faker_instance, settings
+        )
+        for invoice in invoices:
+            rows, total, invoice_number = invoice["rows"], invoice["total"], invoice["invoice_number"]
+            written: List[Tuple[str, int]] = []
+            if numberer is not None:
+                invoice_number = numberer.number(
+                    invoice["index"], base=invoice_number_base, matter=matter_number, profile="stress",
+                    start=billing_start_date, end=billing_end_date
+                )
+            bind_log_context(invoice_number=invoice_number)
+            if validation != "off":
+                invoice_violations = validate_invoice(rows, invoice_number, billing_start_date, billing_end_date, total, rules=validation_rules)
+                violations.extend(invoice_violations)
+                stats["violations"] += len(invoice_violations)
+                if validation == "block" and has_errors(invoice_violations):
+                    blocked = True
+                    raise ValueError(f"Invoice {invoice_number} failed validation: {invoice_violations[0].rule}: {invoice_violations[0].message}")
+            is_first = invoice["index"] == 0 or not combine_ledes
+            ledes_lines = _iter_ledes_1998b_lines(
+                rows, total, billing_start_date, billing_end_date, invoice_number, matter_number,
+                is_first_invoice=is_first
+            )
+            if combined_file is not None:
+                target = combined_file
+            else:
+                target = open(os.path.join(out_dir, f"LEDES_1998B_{invoice_number}.txt"), "wb")
+            try:
+                for line in ledes_lines:
+                    encoded = (line + "\r\n").encode("utf-8")
+                    target.write(encoded)
+                    stats["bytes_written"] += len(encoded)
+            finally:
+                if target is not combined_file:
+                    target.close()
+                    written.append((os.path.basename(target.name), os.path.getsize(target.name)))
+            stats["lines"] += len(rows)
+            if exporter is not None:
+                exporter.add_invoice(rows, "stress", matter_number, invoice_number, billing_start_date, billing_end_date)
+            summary = summarize_invoice(rows) if (include_pdf or include_summaries or catalog is not None) else None
+
+            if include_summaries:
+                for suffix, text in (("json", summary_to_json(summary, invoice_number=invoice_number)), ("csv", summary_to_csv(summary))):
+                    encoded = text.encode("utf-8")
+                    with open(os.path.join(out_dir, f"{invoice_number}_summary.{suffix}"), "wb") as f:
+                        f.write(encoded)
+                    stats["bytes_written"] += len(encoded)
+                    written.append((f"{invoice_number}_summary.{suffix}", len(encoded)))
+
+            if include_pdf:
+                import pandas as pd
+
+                pdf_buffer = _create_pdf_invoice(
+                    df=pd.DataFrame(rows), total_amount=total, invoice_number=invoice_number,
+                    invoice_date=billing_end_date, billing_start_date=billing_start_date,
+                    billing_end_date=billing_end_date, client_id=client_id, law_firm_id=law_firm_id,
+                    summary=summary, output=pdf_output
+                )
+                pdf_bytes = pdf_buffer.getvalue()
+                with open(os.path.join(out_dir, f"Invoice_{invoice_number}.pdf"), "wb") as f:
+                    f.write(pdf_bytes)
+                stats["pdfs"] += 1
+                written.append((f"Invoice_{invoice_number}.pdf", len(pdf_bytes)))
+                stats["bytes_written"] += len(pdf_bytes)
+                stats["pdf_bytes"] += len(pdf_bytes)
+
+            if include_receipts:
+                _seed_invoice_rng(seed, invoice["index"], "receipts", faker_instance)
+                for row in rows:
+                    if row.get("EXPENSE_CODE") and row.get("EXPENSE_CODE") != "E101":
+                        receipt_filename, receipt_buf = _create_receipt_image(row, faker_instance, pdf_output)
+                        receipt_filename = receipt_names.claim(f"{invoice_number}_{receipt_filename}")
+                        receipt_bytes = receipt_buf.getvalue()
+                        with open(os.path.join(out_dir, receipt_filename), "wb") as f:
+                            f.write(receipt_bytes)
+                        stats["receipts"] += 1
+                        written.append((receipt_filename, len(receipt_bytes)))
+                        stats["bytes_written"] += len(receipt_bytes)
+                        stats["receipt_bytes"] += len(receipt_bytes)
+
+            if catalog is not None:
+                catalog_call(
+                    catalog, "record_invoice", run_id, invoice_number, rows, summary, billing_start_date, billing_end_date,
+                    matter_number=matter_number, profile="stress", client_id=client_id, law_firm_id=law_firm_id
+                )
+                catalog_call(catalog, "record_artifacts", run_id, [(name, os.path.join(out_dir, name), size, invoice_number) for name, size in written])
+
+            outputs.extend(name for name, _ in written)
+            stats["invoices"] += 1
+            del invoice, rows
+            if stats["invoices"] % max(1, progress_every) == 0:
+                _report()
+    except Exception as e:
+        record_run("stress", stats["invoices"], stats["lines"], time.perf_counter() - started, failed=True)
+        if catalog is not None:
+            catalog_call(catalog, "finish_run", run_id, error=str(e) or type(e).__name__)
+        raise
+    finally:
+        restore_log_context()
+        if combined_file is not None:
+            combined_file.close()
+        if violations:
+            with open(os.path.join(out_dir, "validation_report.csv"), "w", encoding="utf-8", newline="") as f:
+                f.write(violations_to_csv(violations))
+        if exporter is not None:
+            line_items = exporter.close()
+            stats["bytes_written"] += line_items["bytes"]
+        if blocked:
+            # Only the validation report survives a blocked run; files already written are removed
+            if combined_file is not None:
+                outputs.append("LEDES_Combined.txt")
+            if line_items is not None:
+                outputs += [os.path.join("line_items", name) for name in line_items["files"]]
+            discard_partial_output(out_dir, outputs)
+
+    elapsed = time.perf_counter() - started
+    record_run("stress", stats["invoices"], stats["lines"], elapsed)
+    summary = {
+        **stats,
+        "elapsed_s": round(elapsed, 3),
+        "invoices_per_s": round(stats["invoices"] / elapsed, 2) if elapsed else 0.0,
+        "lines_per_s": round(stats["lines"] / elapsed, 1) if elapsed else 0.0,
+        "mb_per_s": round(stats["bytes_written"] / (1024 * 1024) / elapsed, 2) if elapsed else 0.0,
+        "out_dir": os.path.abspath(out_dir),
+    }
+    if line_items is not None:
+        summary["line_items"] = {k: line_items[k] for k in ("format", "rows", "bytes")}
+    if catalog is not None:
+        if combined_file is not None:
+            catalog_call(catalog, "record_artifacts", run_id, [("LEDES_Combined.txt", combined_file.name, os.path.getsize(combined_file.name), None)])
+        catalog_call(catalog, "finish_run", run_id)
+        summary["run_id"] = run_id
+    try:
+        with open(os.path.join(out_dir, "stress_summary.json"), "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+    except OSError as e:
+        logging.error(f"Could not write stress summary: {e}")
+    _report(final=True)
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Stream a large LEDES stress run to disk.")
+    parser.add_argument("--out", required=True, help="Output directory")
+    parser.add_argument("--invoices", type=int, default=100)
+    parser.add_argument("--fees", type=int, default=500, help="Fee lines per invoice")
+    parser.add_argument("--expenses", type=int, default=50, help="Expense lines per invoice")
+    parser.add_argument("--timekeepers", help="Timekeeper CSV (defaults to a synthetic roster)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--separate", action="store_true", help="One LEDES file per invoice instead of a combined file")
+    parser.add_argument("--pdf", action="store_true", help="Also write PDF invoices")
+    parser.add_argument("--receipts", action="store_true", help="Also write expense receipts")
+    parser.add_argument("--summaries", action="store_true", help="Also write per-invoice summary JSON/CSV sidecars")
+    parser.add_argument("--pdf-compression", choices=list(PDF_COMPRESSION_MODES), default="standard", help="PDF page stream compression")
+    parser.add_argument("--embed-fonts", action="store_true", help="Embed subset TrueType fonts in PDF invoices")
+    parser.add_argument("--image-dpi", type=int, help="Receipt/logo resolution (default: receipts at 300 DPI, logos as supplied)")
+    parser.add_argument("--image-quality", type=int, help="JPEG quality 1-95 for receipts/logos")
+    parser.add_argument("--catalog", nargs="?", const="", help="Record the run in the SQLite run catalog (optionally at this path)")
+    parser.add_argument("--number-pattern", help="Persistent invoice numbering pattern, e.g. '{base}-{seq}' (default: STRESS-1, STRESS-2, ...)")
+    parser.add_argument("--validate", choices=list(VALIDATION_MODES), default="off", help="Validate each invoice before writing it (warn: report only, block: stop at the first error)")
+    parser.add_argument("--line-items", choices=list(COLUMNAR_FORMATS), help="Also export line items as partitioned Parquet/Arrow files")
+    parser.add_argument("--log-format", choices=sorted(LOG_FORMATS), default="text", help="Log as plain text or JSON lines (with run and invoice ids)")
+    parser.add_argument("--metrics-file", help="Write Prometheus text-format metrics here when the run ends")
+    args = parser.parse_args(argv)
+    configure_logging(logging.INFO, args.log_format)
+
+    from ingest import load_timekeeper_records
+
+    timekeeper_data = load_timekeeper_records(args.timekeepers) if args.timekeepers else None
+    catalog = None
+    if args.catalog is not None:
+        from run_catalog import open_catalog
+
+        catalog = open_catalog(args.catalog or None)
+
+    def _print_progress(p: Dict[str, Any]) -> None:
+        print(f"{p['invoices']}/{p['total_invoices']} invoices, {p['lines']} lines, "
+              f"{p['lines_per_s']:.0f} lines/s", file=sys.stderr)
+
+    try:
+        summary = run_stress_generation(
+            args.out, args.invoices, args.fees, args.expenses, timekeeper_data=timekeeper_data,
+            combine_ledes=not args.separate, include_pdf=args.pdf, include_receipts=args.receipts,
+            include_summaries=args.summaries, seed=args.seed, progress_callback=_print_progress,
+            pdf_output=PdfOutputOptions(
+                compression=args.pdf_compression, embed_fonts=args.embed_fonts,
+                image_dpi=args.image_dpi, image_quality=args.image_quality,
+            ),
+            line_items_format=args.line_items, catalog=catalog, number_pattern=args.number_pattern, validation=args.validate,
+        )
+    finally:
+        if args.metrics_file:
+            METRICS.write_textfile(args.metrics_file)
+    print(json.dumps(summary, indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,464 @@
+"""
+Structured logging and metrics for long-running deployments (stdlib only).
+
+configure_logging() sends every record through a queue to one listener thread, so
+worker processes (see worker_initializer) log through the same handlers as the parent.
+The JSON format adds the current log_context() fields (run_id, invoice_number, ...).
+Metrics are Prometheus text-format counters, gauges and histograms. Workers forward
+their observations over the logging queue, so the parent process exports totals for
+the whole pool.
+"""
+import abc
+import atexit
+import bisect
+import contextlib
+import contextvars
+import copy
+import datetime
+import functools
+import json
+import logging
+import logging.handlers
+import multiprocessing
+import os
+import tempfile
+import threading
+import time
+from http import HTTPStatus
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+# --- Telemetry configuration ---
+LOG_FORMATS = {"text": "Plain text", "json": "JSON lines"}
+TEXT_LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+METRICS_PREFIX = "invoicegen_"
+METRICS_DEFAULT_HOST = "127.0.0.1"
+METRICS_DEFAULT_PORT = 9464
+# Seconds; covers a tiny receipt (~10 ms) up to a large PDF or a slow SMTP relay
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+RUN_BUCKETS = (0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0, 3600.0)
+# -------------------------------
+
+_METRICS_LOGGER = "invoicegen.metrics"
+_LOG_CONTEXT: contextvars.ContextVar[Dict[str, Any]] = contextvars.ContextVar("invoicegen_log_context", default={})
+_STATE: Dict[str, Any] = {"queue": None, "listener": None, "forward": None, "servers": {}}
+_STATE_LOCK = threading.Lock()
+
+
+# --- Logging ---
+
+def bind_log_context(**fields: Any) -> Callable[[], None]:
+    """
+    Attach fields (e.g. run_id, invoice_number) to every record logged from here on; a None
+    value removes a field. Call the returned function to restore the previous context.
+    """
+    context = {**_LOG_CONTEXT.get(), **fields}
+    token = _LOG_CONTEXT.set({k: v for k, v in context.items() if v is not None})
+    return lambda: _LOG_CONTEXT.reset(token)
+
+
+@contextlib.contextmanager
+def log_context(**fields: Any) -> Iterator[None]:
+    """bind_log_context() for the duration of a block."""
+    restore = bind_log_context(**fields)
+    try:
+        yield
+    finally:
+        restore()
+
+
+def current_log_context() -> Dict[str, Any]:
+    """The fields bound in this context, to hand to work running in another process."""
+    return dict(_LOG_CONTEXT.get())
+
+
+class _ContextFilter(logging.Filter):
+    """Captures log_context() on the emitting thread, before the record crosses the queue."""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        context = _LOG_CONTEXT.get()
+        if context and not hasattr(record, "context"):
+            record.context = dict(context)
+        return True
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line: ts, level, logger, process, message, context fields and any exception."""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "process": record.processName,
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "context", None) or {})
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry["exception"] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class _NotMetrics(logging.Filter):
+    def filter(self, record: logging.LogRecord) -> bool:
+        return not hasattr(record, "metric")
+
+
+class _MetricsHandler(logging.Handler):
+    """Applies metric observations forwarded by worker processes to this process's registry."""
+
+    def emit(self, record: logging.LogRecord) -> None:
+        metric = getattr(record, "metric", None)
+        if metric is not None:
+            METRICS.apply(*metric)
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    """Keeps the traceback in exc_text (not folded into the message) so JSON output has a separate field."""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.msg, record.args = record.getMessage(), None
+        if record.exc_info:
+            record.exc_text = _TRACEBACK_FORMATTER.formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+_TRACEBACK_FORMATTER = logging.Formatter()
+
+
+def _queue_handler(queue: Any) -> logging.Handler:
+    handler = _QueueHandler(queue)
+    handler.addFilter(_ContextFilter())
+    return handler
+
+
+def configure_logging(level: int = logging.INFO, fmt: str = "text", stream: Any = None) -> Any:
+    """
+    Route the root logger through a queue to a listener thread that writes fmt ("text" or
+    "json") to stream (stderr by default). Safe to call repeatedly: later calls only
+    adjust the level. Returns the queue to hand to worker processes.
+    """
+    if fmt not in LOG_FORMATS:
+        raise ValueError(f"Unknown log format '{fmt}' (expected one of {', '.join(LOG_FORMATS)})")
+    root = logging.getLogger()
+    with _STATE_LOCK:
+        if _STATE["queue"] is not None:
+            root.setLevel(level)
+            return _STATE["queue"]
+        # A spawn-context queue can be passed to spawn-started pool workers
+        queue = multiprocessing.get_context("spawn").Queue(-1)
+        output = logging.StreamHandler(stream)
+        output.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_LOG_FORMAT))
+        output.addFilter(_NotMetrics())
+        listener = logging.handlers.QueueListener(queue, output, _MetricsHandler(), respect_handler_level=True)
+        listener.start()
+        atexit.register(shutdown_logging)
+        for handler in list(root.handlers):
+            root.removeHandler(handler)
+        root.addHandler(_queue_handler(queue))
+        root.setLevel(level)
+        _STATE["queue"], _STATE["listener"] = queue, listener
+    return queue
+
+
+def shutdown_logging() -> None:
+    """Flush and stop the listener (records still queued are written first)."""
+    with _STATE_LOCK:
+        listener, _STATE["listener"], _STATE["queue"] = _STATE["listener"], None, None
+    if listener is not None:
+        listener.stop()
+
+
+def telemetry_queue() -> Optional[Any]:
+    """The queue set up by configure_logging(), or None when logging is not queued."""
+    return _STATE["queue"]
+
+
+def init_worker_telemetry(queue: Any, level: int = logging.INFO) -> None:
+    """Pool initializer: send this worker's log records and metric observations to the parent's queue."""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler(queue))
+    root.setLevel(level)
+    forward = logging.getLogger(_METRICS_LOGGER)
+    forward.setLevel(logging.DEBUG)
+    forward.propagate = False
+    forward.handlers = [_QueueHandler(queue)]
+    _STATE["forward"] = forward
+
+
+def worker_initializer() -> Tuple[Optional[Callable[..., None]], Tuple[Any, ...]]:
+    """(initializer, initargs) for a ProcessPoolExecutor; (None, ()) when logging is not queued."""
+    queue = telemetry_queue()
+    if queue is None:
+        return None, ()
+    return init_worker_telemetry, (queue, logging.getLogger().level)
+
+
+# --- Metrics ---
+
+def _label_key(labelnames: Tuple[str, ...], labels: Dict[str, Any]) -> Tuple[str, ...]:
+    if set(labels) != set(labelnames):
+        raise ValueError(f"Expected labels {', '.join(labelnames) or '(none)'}, got {', '.join(sorted(labels)) or '(none)'}")
+    return tuple(str(labels[name]) for name in labelnames)
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _labels_text(labelnames: Tuple[str, ...], key: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, key)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _number(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if value != int(value) else str(int(value))
+
+
+class _Metric(abc.ABC):
+    kind = ""
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str, labelnames: Tuple[str, ...]):
+        self.registry = registry
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], Any] = {}
+
+    def _record(self, value: float, labels: Dict[str, Any], delta: bool = True) -> None:
+        key = _label_key(self.labelnames, labels)
+        forward = _STATE["forward"]
+        if forward is not None and self.registry is METRICS:
+            forward.info(self.name, extra={"metric": (self.name, key, float(value), delta)})
+        else:
+            self.registry.apply(self.name, key, float(value), delta)
+
+    @abc.abstractmethod
+    def _apply(self, key: Tuple[str, ...], value: float, delta: bool) -> None:
+        """Fold one observation into _values; delta is False only for a gauge set()."""
+
+    @abc.abstractmethod
+    def _samples(self) -> List[str]:
+        """Sample lines in the text exposition format."""
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"] + self._samples()
+
+
+class _Scalar(_Metric):
+    """One number per label set (counters and gauges)."""
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(_label_key(self.labelnames, labels), 0.0)
+
+    def _samples(self) -> List[str]:
+        return [f"{self.name}{_labels_text(self.labelnames, key)} {_number(v)}" for key, v in sorted(self._values.items())]
+
+
+class Counter(_Scalar):
+    kind = "counter"
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        if amount < 0:
+            raise ValueError("Counters only go up")
+        self._record(amount, labels)
+
+    def _apply(self, key: Tuple[str, ...], value: float, delta: bool) -> None:
+        self._values[key] = self._values.get(key, 0.0) + value
+
+
+class Gauge(_Scalar):
+    kind = "gauge"
+
+    def set(self, value: float, **labels: Any) -> None:
+        self._record(value, labels, delta=False)
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        self._record(amount, labels)
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self._record(-amount, labels)
+
+    def _apply(self, key: Tuple[str, ...], value: float, delta: bool) -> None:
+        self._values[key] = self._values.get(key, 0.0) + value if delta else value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry: "MetricsRegistry", name: str, help_text: str, labelnames: Tuple[str, ...],
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        super().__init__(registry, name, help_text, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value: float, **labels: Any) -> None:
+        self._record(value, labels)
+
+    @contextlib.contextmanager
+    def time(self, **labels: Any) -> Iterator[None]:
+        """Observe the block's wall time, also when it raises."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _apply(self, key: Tuple[str, ...], value: float, delta: bool) -> None:
+        state = self._values.get(key)
+        if state is None:
+            state = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+        idx = bisect.bisect_left(self.buckets, value)
+        if idx < len(self.buckets):
+            state[0][idx] += 1
+        state[1] += 1
+        state[2] += value
+
+    def count(self, **labels: Any) -> int:
+        state = self._values.get(_label_key(self.labelnames, labels))
+        return state[1] if state else 0
+
+    def _samples(self) -> List[str]:
+        lines = []
+        for key, (counts, total, value_sum) in sorted(self._values.items()):
+            cumulative = 0
+            for bound, n in zip(self.buckets, counts):
+                cumulative += n
+                le = 'le="' + _number(bound) + '"'
+                lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, le)} {cumulative}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_labels_text(self.labelnames, key, le)} {total}")
+            lines.append(f"{self.name}_sum{_labels_text(self.labelnames, key)} {_number(value_sum)}")
+            lines.append(f"{self.name}_count{_labels_text(self.labelnames, key)} {total}")
+        return lines
+
+
+class MetricsRegistry:
+    """Named metrics, rendered together in the Prometheus text exposition format."""
+
+    def __init__(self, prefix: str = METRICS_PREFIX):
+        self.prefix = prefix
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> Any:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                if type(existing) is not type(metric) or existing.labelnames != metric.labelnames:
+                    raise ValueError(f"Metric {metric.name} is already registered with a different type or labels")
+                return existing
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(self, self.prefix + name, help_text, labelnames))
+
+    def gauge(self, name: str, help_text: str, labelnames: Tuple[str, ...] = ()) -> Gauge:
+        return self._register(Gauge(self, self.prefix + name, help_text, labelnames))
+
+    def histogram(self, name: str, help_text: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> Histogram:
+        return self._register(Histogram(self, self.prefix + name, help_text, labelnames, buckets))
+
+    def apply(self, name: str, key: Tuple[str, ...], value: float, delta: bool = True) -> None:
+        """Record one observation by metric name (used for observations forwarded from workers)."""
+        metric = self._metrics.get(name)
+        if metric is None:
+            logging.error(f"Dropping observation for unknown metric {name}")
+            return
+        with self._lock:
+            metric._apply(tuple(key), value, delta)
+
+    def render(self) -> str:
+        with self._lock:
+            lines = [line for _, metric in sorted(self._metrics.items()) for line in metric.render()]
+        return "\n".join(lines) + "\n"
+
+    def write_textfile(self, path: str) -> None:
+        """Atomically write render() to path (for node_exporter's textfile collector or a cron scrape)."""
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=directory, prefix=".metrics_", suffix=".prom")
+        try:
+            with os.fdopen(fd, "w", encoding="utf-8") as f:
+                f.write(self.render())
+            os.replace(tmp, path)
+        except BaseException:
+            with contextlib.suppress(OSError):
+                os.remove(tmp)
+            raise
+
+
+METRICS = MetricsRegistry()
+
+INVOICES_GENERATED = METRICS.counter("invoices_generated_total", "Invoices generated", ("source",))
+LINE_ITEMS_GENERATED = METRICS.counter("line_items_generated_total", "Line items generated", ("source",))
+LINES_PER_SECOND = METRICS.gauge("generation_lines_per_second", "Line items per second over the most recent run", ("source",))
+RUN_SECONDS = METRICS.histogram("run_duration_seconds", "Wall time of generation runs", ("source",), RUN_BUCKETS)
+RUN_FAILURES = METRICS.counter("run_failures_total", "Generation runs that failed or were blocked", ("source",))
+PDF_RENDER_SECONDS = METRICS.histogram("pdf_render_seconds", "Invoice PDF render latency")
+RECEIPT_RENDER_SECONDS = METRICS.histogram("receipt_render_seconds", "Receipt PDF render latency")
+SMTP_SEND_SECONDS = METRICS.histogram("smtp_send_seconds", "SMTP send latency (connect, login and send)")
+SMTP_FAILURES = METRICS.counter("smtp_failures_total", "Emails that failed to send")
+
+
+def timed(histogram: Histogram) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """Decorator: observe each call's wall time in histogram."""
+    def decorate(func: Callable[..., Any]) -> Callable[..., Any]:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with histogram.time():
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def record_run(source: str, invoices: int, lines: int, seconds: float, failed: bool = False) -> None:
+    """Throughput metrics for one finished run ("app", "manifest", "stress", ...)."""
+    INVOICES_GENERATED.inc(invoices, source=source)
+    LINE_ITEMS_GENERATED.inc(lines, source=source)
+    RUN_SECONDS.observe(seconds, source=source)
+    if seconds > 0:
+        LINES_PER_SECOND.set(lines / seconds, source=source)
+    if failed:
+        RUN_FAILURES.inc(source=source)
+
+
+# --- Metrics endpoint ---
+
+class _MetricsHandlerHTTP(BaseHTTPRequestHandler):
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def do_GET(self) -> None:
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(HTTPStatus.NOT_FOUND)
+            return
+        data = METRICS.render().encode("utf-8")
+        self.send_response(HTTPStatus.OK)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def serve_metrics(port: int = METRICS_DEFAULT_PORT, host: str = METRICS_DEFAULT_HOST) -> ThreadingHTTPServer:
+    """Serve GET /metrics on a daemon thread; one server per (host, port), reused on repeat calls."""
+    with _STATE_LOCK:
+        server = _STATE["servers"].get((host, port))
+        if server is None:
+            server = ThreadingHTTPServer((host, port), _MetricsHandlerHTTP)
+            server.daemon_threads = True
+            threading.Thread(target=server.serve_forever, name="metrics-endpoint", daemon=True).start()
+            _STATE["servers"][(host, port)] = server
+    return server
@@ -0,0 +1,53 @@
+"""Shared fixtures; the modules under test are flat files at the repository root."""
+import io
+import logging
+import os
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from strategies import GOLDEN_DIR, update_golden  # noqa: E402
+from telemetry import configure_logging, shutdown_logging  # noqa: E402
+
+
+@pytest.fixture
+def golden():
+    """
+    golden(name, text) compares text with tests/golden/<name>. Run with UPDATE_GOLDEN=1
+    to (re)write the fixtures after an intended output change, then review the diff.
+    """
+    def _check(name: str, text: str) -> None:
+        path = os.path.join(GOLDEN_DIR, name)
+        if update_golden() or not os.path.exists(path):
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                f.write(text)
+            if not update_golden():
+                pytest.fail(f"Golden file {name} was missing and has been written; review and commit it")
+            return
+        with open(path, encoding="utf-8", newline="") as f:
+            expected = f.read()
+        assert text == expected, f"Output differs from golden file {name} (UPDATE_GOLDEN=1 to accept)"
+
+    return _check
+
+
+@pytest.fixture
+def queued_logs():
+    """
+    configure_logging() as JSON into a buffer for one test. Call shutdown_logging() to flush
+    the listener before reading the buffer; the previous root handlers are restored afterwards.
+    """
+    root = logging.getLogger()
+    handlers, level = list(root.handlers), root.level
+    stream = io.StringIO()
+    configure_logging(logging.INFO, "json", stream)
+    try:
+        yield stream
+    finally:
+        shutdown_logging()
+        root.handlers[:] = handlers
+        root.setLevel(level)
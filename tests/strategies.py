@@ -0,0 +1,148 @@
+"""
+Seeded, Hypothesis-style generators for the property tests.
+
+Every example is drawn from random.Random(seed), so a failing case is reproduced by
+its seed alone (shown in the test id). PROPERTY_EXAMPLES scales the example count.
+"""
+import datetime
+import os
+import random
+import string
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+from invoice_engine import (
+    CONFIG, GenerationSettings, _create_ledes_1998b_content, _generate_invoice_data, _seed_invoice_rng,
+)
+from ledes_validation import Violation, validate_invoice
+from periods import WEEKDAY_PATTERNS
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+PROPERTY_EXAMPLES = int(os.environ.get("PROPERTY_EXAMPLES", "25"))
+
+CLIENT_ID = "02-4388252"
+LAW_FIRM_ID = "02-1234567"
+LEDES_FIELD_COUNT = 24
+
+
+def update_golden() -> bool:
+    return os.environ.get("UPDATE_GOLDEN", "") not in ("", "0")
+
+
+def examples(count: int = PROPERTY_EXAMPLES):
+    """Parametrize a test over `count` seeds; the test takes a `seed` argument."""
+    return pytest.mark.parametrize("seed", range(count), ids=lambda s: f"seed{s}")
+
+
+def _word(rng: random.Random, min_len: int = 2, max_len: int = 10) -> str:
+    return "".join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(min_len, max_len))).capitalize()
+
+
+def timekeeper_roster(rng: random.Random, min_size: int = 1, max_size: int = 12) -> List[Dict[str, Any]]:
+    """Distinct names and IDs, rates on a cents grid, repeated classifications."""
+    roster = []
+    for n in range(rng.randint(min_size, max_size)):
+        roster.append({
+            "TIMEKEEPER_NAME": f"{_word(rng)} {_word(rng)} {n}",
+            "TIMEKEEPER_CLASSIFICATION": rng.choice(["Partner", "Associate", "Paralegal", "Of Counsel"]),
+            "TIMEKEEPER_ID": f"TK{rng.randint(0, 99999):05d}-{n}",
+            "RATE": round(rng.uniform(50.0, 1500.0), 2),
+        })
+    return roster
+
+
+def task_catalog(rng: random.Random, min_size: int = 1, max_size: int = 30) -> List[Tuple[str, str, str]]:
+    """UTBMS-shaped codes; some descriptions carry '|' or the name placeholder."""
+    catalog = []
+    for _ in range(rng.randint(min_size, max_size)):
+        description = " ".join(_word(rng) for _ in range(rng.randint(1, 8)))
+        roll = rng.random()
+        if roll < 0.1:
+            description += " | " + _word(rng)
+        elif roll < 0.2:
+            description += " with {NAME_PLACEHOLDER}"
+        catalog.append((f"L{rng.randint(100, 999)}", f"A{rng.randint(100, 199)}", description))
+    return catalog
+
+
+def billing_period(rng: random.Random, max_days: int = 62) -> Tuple[datetime.date, datetime.date]:
+    start = datetime.date(2020, 1, 1) + datetime.timedelta(days=rng.randint(0, 365 * 8))
+    return start, start + datetime.timedelta(days=rng.randint(0, max_days))
+
+
+def generation_settings(rng: random.Random) -> GenerationSettings:
+    return GenerationSettings(
+        business_days_only=rng.random() < 0.3,
+        exclude_us_holidays=rng.random() < 0.3,
+        weekday_pattern=rng.choice(sorted(WEEKDAY_PATTERNS)),
+    )
+
+
+def generated_invoice(seed: int) -> Dict[str, Any]:
+    """One random invoice plus the inputs it was generated from."""
+    from faker import Faker
+
+    rng = random.Random(seed)
+    roster = timekeeper_roster(rng)
+    catalog = task_catalog(rng)
+    major = {code for code, _, _ in catalog if rng.random() < 0.5}
+    start, end = billing_period(rng)
+    settings = generation_settings(rng)
+    max_daily_hours = rng.randint(1, 16)
+    fee_count, expense_count = rng.randint(0, 120), rng.randint(0, 40)
+    faker_instance = Faker()
+    _seed_invoice_rng(seed, 0, "rows", faker_instance)
+    rows, total = _generate_invoice_data(
+        fee_count, expense_count, roster, CLIENT_ID, LAW_FIRM_ID, "Property test invoice", start, end,
+        catalog, major, max_daily_hours, rng.random() < 0.7, faker_instance, settings,
+    )
+    return {
+        "rows": rows, "total": total, "start": start, "end": end, "roster": roster, "catalog": catalog,
+        "settings": settings, "max_daily_hours": max_daily_hours,
+        "invoice_number": f"INV-{seed}", "matter_number": f"M-{rng.randint(1, 9999):04d}",
+    }
+
+
+def fixed_invoice(seed: int, invoice_index: int = 0, fee_count: int = 12, expense_count: int = 4) -> Dict[str, Any]:
+    """Invoice from the default catalogs and a fixed roster; the basis of the golden files."""
+    from faker import Faker
+
+    roster = [
+        {"TIMEKEEPER_NAME": "Ann Lee", "TIMEKEEPER_CLASSIFICATION": "Partner", "TIMEKEEPER_ID": "TK001", "RATE": 450.0},
+        {"TIMEKEEPER_NAME": "Raj Patel", "TIMEKEEPER_CLASSIFICATION": "Associate", "TIMEKEEPER_ID": "TK002", "RATE": 300.0},
+        {"TIMEKEEPER_NAME": "Mia Chen", "TIMEKEEPER_CLASSIFICATION": "Paralegal", "TIMEKEEPER_ID": "TK003", "RATE": 150.0},
+    ]
+    start, end = datetime.date(2025, 5, 1), datetime.date(2025, 5, 31)
+    faker_instance = Faker()
+    _seed_invoice_rng(seed, invoice_index, "rows", faker_instance)
+    rows, total = _generate_invoice_data(
+        fee_count, expense_count, roster, CLIENT_ID, LAW_FIRM_ID, "Golden invoice", start, end,
+        CONFIG['DEFAULT_TASK_ACTIVITY_DESC'], CONFIG['MAJOR_TASK_CODES'], 16, True, faker_instance,
+    )
+    return {"rows": rows, "total": total, "start": start, "end": end, "roster": roster,
+            "invoice_number": f"GOLD-{invoice_index + 1}", "matter_number": "2025-000101"}
+
+
+def ledes_content(invoice: Dict[str, Any], is_first_invoice: bool = True) -> str:
+    return _create_ledes_1998b_content(invoice["rows"], invoice["total"], invoice["start"], invoice["end"],
+                                       invoice["invoice_number"], invoice["matter_number"], is_first_invoice)
+
+
+def ledes_records(content: str) -> List[List[str]]:
+    """Data lines of LEDES content split into fields (header lines and terminators removed)."""
+    lines = content.split("\r\n")
+    assert lines[-1] == "", "LEDES content must end with CRLF"
+    return [line[:-2].split("|") for line in lines[:-1] if not line.startswith("LEDES1998B") and not line.startswith("INVOICE_DATE|")]
+
+
+def fail_second_invoice(monkeypatch: pytest.MonkeyPatch, module: Any) -> None:
+    """Make `module`'s validate_invoice report a forced error on the second invoice it checks."""
+    seen: List[str] = []
+
+    def validate(rows, invoice_number, *args, **kwargs):
+        seen.append(invoice_number)
+        found = validate_invoice(rows, invoice_number, *args, **kwargs)
+        return found + [Violation("invoice_total", "error", invoice_number, (1,), "forced")] if len(seen) == 2 else found
+
+    monkeypatch.setattr(module, "validate_invoice", validate)
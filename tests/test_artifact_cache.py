@@ -0,0 +1,38 @@
+"""Artifact cache: LRU eviction to the low-water mark from the in-memory index, and exact size accounting."""
+import threading
+
+import pytest
+
+from artifact_cache import CACHE_LOW_WATER, ArtifactCache
+
+
+def _key(n):
+    return ArtifactCache.make_key("cfg", 0, n, "pdf")
+
+
+def test_eviction_trims_to_low_water_without_rescanning(tmp_path, monkeypatch):
+    cache = ArtifactCache(str(tmp_path), max_bytes=10_000)
+    monkeypatch.setattr(cache, "_entries", lambda: pytest.fail("eviction re-walked the cache directory"))
+    for n in range(10):
+        cache.put(_key(n), b"x" * 1000)
+    assert cache.get(_key(0)) is not None     # most recently used now
+    cache.put(_key(10), b"x" * 1000)
+    assert cache.size_bytes <= 10_000 * CACHE_LOW_WATER
+    assert cache.contains(_key(0)) and not cache.contains(_key(1)) and cache.contains(_key(10))
+    evicted = sum(not cache.contains(_key(n)) for n in range(11))
+    cache.put(_key(11), b"x" * 1000)          # below the high-water mark again: nothing more goes
+    assert sum(not cache.contains(_key(n)) for n in range(12)) == evicted
+
+
+def test_size_survives_restart_and_concurrent_rewrites(tmp_path):
+    cache = ArtifactCache(str(tmp_path), max_bytes=1 << 30)
+    threads = [threading.Thread(target=cache.put, args=(_key(0), b"y" * size)) for size in (100, 200, 300, 400) * 5]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert cache.size_bytes == len(cache.get(_key(0)))
+    cache.put(_key(1), b"z" * 50)
+    assert ArtifactCache(str(tmp_path)).size_bytes == cache.size_bytes
+    cache.clear()
+    assert cache.size_bytes == 0 and cache.get(_key(1)) is None
@@ -0,0 +1,57 @@
+"""Columnar export: partitioned part files read back with typed, dictionary-encoded columns."""
+import datetime
+import os
+
+import pyarrow as pa
+import pyarrow.compute as pc
+import pytest
+
+from columnar_export import DICTIONARY_COLUMNS, LineItemExporter, open_line_items, partition_path
+
+START, END = datetime.date(2025, 1, 1), datetime.date(2025, 1, 31)
+
+
+def _rows(n, expense_every=3):
+    return [{
+        "LINE_ITEM_DATE": f"2025-01-{k % 28 + 1:02d}", "CLIENT_ID": "C1", "LAW_FIRM_ID": "F1",
+        "TIMEKEEPER_ID": "" if k % expense_every == 0 else f"TK{k % 2}", "TIMEKEEPER_NAME": "" if k % expense_every == 0 else f"Lawyer {k % 2}",
+        "TIMEKEEPER_CLASSIFICATION": "" if k % expense_every == 0 else "Associate",
+        "TASK_CODE": "" if k % expense_every == 0 else "L110", "ACTIVITY_CODE": "" if k % expense_every == 0 else "A101",
+        "EXPENSE_CODE": "E101" if k % expense_every == 0 else "", "DESCRIPTION": f"Line {k}",
+        "HOURS": float(k % 5), "RATE": 200.0, "LINE_ITEM_TOTAL": 200.0 * (k % 5),
+    } for k in range(n)]
+
+
+@pytest.mark.parametrize("fmt", ["parquet", "arrow"])
+def test_export_round_trips_through_the_dataset(tmp_path, fmt):
+    matters = ["M-1", "Acme / Beta #7 50%"]
+    with LineItemExporter(str(tmp_path), fmt, flush_rows=25) as exporter:
+        for n, matter in enumerate(matters * 3):
+            exporter.add_invoice(_rows(10), "Onit ELM", matter, f"INV-{n}", START, END)
+    result = exporter.close()
+    assert result["rows"] == 60
+    # Ten-row invoices with flush_rows=25 flush after every third invoice, each flush touching both partitions
+    assert len(result["files"]) == 4
+    assert {os.path.dirname(f) for f in result["files"]} == {partition_path("Onit ELM", m, START, END) for m in matters}
+    assert "matter=Acme%20%2F%20Beta%20%237%2050%25" in partition_path("Onit ELM", matters[1], START, END)
+
+    table = open_line_items(str(tmp_path), fmt).to_table()
+    assert table.num_rows == 60
+    assert set(table.column("matter").to_pylist()) == set(matters)
+    assert set(table.column("profile").to_pylist()) == {"Onit ELM"}
+    assert set(table.column("period").to_pylist()) == {"2025-01-01_2025-01-31"}
+    for name in DICTIONARY_COLUMNS:
+        assert pa.types.is_dictionary(table.schema.field(name).type), name
+    for name in ("LINE_ITEM_DATE", "BILLING_START_DATE", "BILLING_END_DATE"):
+        assert table.schema.field(name).type == pa.date32()
+    assert table.column("BILLING_END_DATE")[0].as_py() == END
+    assert min(table.column("LINE_ITEM_DATE").to_pylist()) == START
+    acme = table.filter(pc.field("matter") == matters[1])
+    assert acme.num_rows == 30 and sorted(set(acme.column("INVOICE_NUMBER").to_pylist())) == ["INV-1", "INV-3", "INV-5"]
+    # Blank codes are stored as nulls, not empty strings
+    assert table.column("EXPENSE_CODE").null_count == 36 and table.column("TASK_CODE").null_count == 24
+
+
+def test_unknown_format_is_rejected(tmp_path):
+    with pytest.raises(ValueError):
+        LineItemExporter(str(tmp_path), "csv")
@@ -0,0 +1,110 @@
+"""Generation service over HTTP: an in-process server on an ephemeral port, driven with http.client."""
+import http.client
+import json
+import os
+import threading
+from concurrent.futures.process import BrokenProcessPool
+
+import pytest
+
+import generation_service
+from generation_service import GenerationService, make_server
+
+ROSTER = [{"TIMEKEEPER_NAME": "Ann Lee", "TIMEKEEPER_CLASSIFICATION": "Partner", "TIMEKEEPER_ID": "TK001", "RATE": 450.0}]
+JOB = {
+    "entries": [{"matter_number": "M-1", "billing_start_date": "2025-01-01", "billing_end_date": "2025-01-31", "fees": 5, "expenses": 1}],
+    "timekeepers": ROSTER,
+}
+
+
+@pytest.fixture
+def serve(tmp_path):
+    """Start a server for a service; yields a request(method, path, body=None, headers=None) -> (status, headers, body) helper."""
+    servers = []
+
+    def start(**service_kwargs):
+        service = GenerationService(str(tmp_path / "jobs"), **{"use_processes": False, **service_kwargs})
+        server = make_server(service, "127.0.0.1", 0)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append((server, service))
+
+        def request(method, path, body=None, headers=None):
+            conn = http.client.HTTPConnection("127.0.0.1", server.server_address[1], timeout=30)
+            try:
+                data = json.dumps(body).encode() if body is not None and not isinstance(body, bytes) else body
+                conn.request(method, path, body=data, headers=headers or {})
+                response = conn.getresponse()
+                return response.status, dict(response.getheaders()), response.read()
+            finally:
+                conn.close()
+        return service, request
+
+    yield start
+    for server, service in servers:
+        server.shutdown()
+        server.server_close()
+        service.shutdown(wait=True)
+
+
+def test_submit_poll_and_download(serve):
+    service, request = serve()
+    status, headers, body = request("POST", "/jobs", JOB)
+    assert status == 202
+    job = json.loads(body)
+    assert headers["Location"] == f"/jobs/{job['job_id']}" and job["invoices"] == 1
+    status, _, body = request("GET", f"/jobs/{job['job_id']}?wait=30")
+    job = json.loads(body)
+    assert status == 200 and job["status"] == "done", job
+    assert job["summary"]["invoices"] == 1 and job["artifacts"]
+    name = job["artifacts"][0]
+    status, headers, body = request("GET", f"/jobs/{job['job_id']}/artifacts/{name}")
+    assert status == 200 and int(headers["Content-Length"]) == len(body)
+    with open(os.path.join(service.root, job["job_id"], name), "rb") as f:
+        assert f.read() == body
+    assert request("GET", f"/jobs/{job['job_id']}/artifacts/missing.zip")[0] == 404
+    assert request("GET", "/jobs/" + "0" * 32)[0] == 404
+    listed = json.loads(request("GET", "/jobs")[2])
+    assert [j["job_id"] for j in listed] == [job["job_id"]]
+    assert json.loads(request("GET", "/health")[2])["jobs"] == {"done": 1}
+
+
+def test_full_queue_is_refused_with_retry_after(serve, monkeypatch):
+    release = threading.Event()
+    monkeypatch.setattr(generation_service, "_run_job", lambda *args, **kwargs: release.wait(30) and {})
+    _, request = serve(max_queued=1)
+    assert request("POST", "/jobs", JOB)[0] == 202
+    assert request("POST", "/jobs", JOB)[0] == 202
+    status, headers, body = request("POST", "/jobs", JOB)
+    assert status == 429 and headers["Retry-After"] == "5" and "full" in json.loads(body)["error"]
+    release.set()
+
+
+@pytest.mark.parametrize("body, headers, expected", [
+    (b"{not json", {}, 400),
+    (b"[1, 2]", {}, 400),
+    (json.dumps({**JOB, "bogus": 1}).encode(), {}, 400),
+    (json.dumps({"entries": [{"billing_start_date": "2025-01-01"}]}).encode(), {}, 400),
+    (json.dumps({**JOB, "validation": "maybe"}).encode(), {}, 400),
+    (b"{}", {"Content-Length": "-1"}, 400),
+    (b"{}", {"Content-Length": "abc"}, 400),
+    (b"{}", {"Content-Length": str(generation_service.SERVICE_MAX_BODY_BYTES + 1)}, 413),
+    (json.dumps({**JOB, "entries": [{**JOB["entries"][0], "fees": 10**9}]}).encode(), {}, 413),
+    (json.dumps({**JOB, "entries": [{**JOB["entries"][0], "fees": 1000, "invoices": generation_service.SERVICE_MAX_JOB_LINES // 1000}]}).encode(), {}, 413),
+], ids=["invalid-json", "not-an-object", "unknown-field", "no-matter", "bad-validation", "negative-length", "non-numeric-length", "too-large",
+        "too-many-lines", "too-many-lines-across-invoices"])
+def test_malformed_submissions(serve, body, headers, expected):
+    _, request = serve()
+    status, _, response = request("POST", "/jobs", body, headers)
+    assert status == expected and json.loads(response)["error"]
+
+
+def test_broken_worker_pool_is_replaced(tmp_path):
+    service = GenerationService(str(tmp_path / "jobs"), max_workers=1)
+    try:
+        crashed = service._executor.submit(os._exit, 1)   # a worker dying outright, as on OOM
+        with pytest.raises(BrokenProcessPool):
+            crashed.result(timeout=60)
+        job = service.submit(JOB)
+        assert service.get(job.job_id, wait=60).status == "done", job.error
+    finally:
+        service.shutdown()
@@ -0,0 +1,45 @@
+"""Golden-file regression tests: seeded invoices must render byte-for-byte as recorded in tests/golden."""
+import re
+
+import pandas as pd
+
+from invoice_engine import LEDES_1998B_FIELDS, LEDES_1998B_HEADER, PdfOutputOptions, _create_pdf_invoice
+from invoice_summary import summarize_invoice, summary_to_json
+from strategies import CLIENT_ID, LAW_FIRM_ID, fixed_invoice, ledes_content
+
+
+def _pdf_text(pdf: bytes) -> str:
+    """Text runs of an uncompressed PDF, one per line (dates and IDs in the file itself vary per build)."""
+    runs = re.findall(rb"\((.*?)(?<!\\)\) Tj", pdf)
+    return "\n".join(run.decode("latin-1").replace("\\(", "(").replace("\\)", ")") for run in runs) + "\n"
+
+
+def test_ledes_single_invoice(golden):
+    content = ledes_content(fixed_invoice(seed=7))
+    assert content.startswith(f"{LEDES_1998B_HEADER}\r\n{LEDES_1998B_FIELDS}\r\n")
+    golden("ledes_single.txt", content)
+
+
+def test_ledes_combined_file(golden):
+    parts = [ledes_content(fixed_invoice(seed=7, invoice_index=i), is_first_invoice=i == 0) for i in range(3)]
+    content = "".join(parts)
+    assert content.count(LEDES_1998B_HEADER) == 1
+    assert content.count(LEDES_1998B_FIELDS) == 1
+    golden("ledes_combined.txt", content)
+
+
+def test_pdf_invoice_text(golden):
+    invoice = fixed_invoice(seed=7)
+    pdf = _create_pdf_invoice(
+        pd.DataFrame(invoice["rows"]), invoice["total"], invoice["invoice_number"], invoice["end"],
+        invoice["start"], invoice["end"], CLIENT_ID, LAW_FIRM_ID,
+        summary=summarize_invoice(invoice["rows"]), summary_sections=("timekeeper", "task_code"),
+        output=PdfOutputOptions(compression="off"),
+    ).getvalue()
+    assert pdf.startswith(b"%PDF-")
+    golden("invoice_pdf.txt", _pdf_text(pdf))
+
+
+def test_invoice_summary(golden):
+    summary = summarize_invoice(fixed_invoice(seed=7)["rows"])
+    golden("invoice_summary.json", summary_to_json(summary, invoice_number="GOLD-1"))
@@ -0,0 +1,69 @@
+"""CSV ingest: per-row errors carry file line numbers across chunks, duplicates drop, padded headers parse."""
+import io
+
+import pytest
+
+from ingest import IngestError, ingest_task_activity, ingest_timekeepers, load_timekeeper_records
+
+TIMEKEEPER_HEADER = "TIMEKEEPER_NAME,TIMEKEEPER_CLASSIFICATION,TIMEKEEPER_ID,RATE,EFFECTIVE_DATE"
+
+
+def _csv(*lines):
+    return io.BytesIO(("\n".join(lines) + "\n").encode("utf-8"))
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 2, 3, 100])
+def test_timekeeper_errors_and_duplicates_across_chunks(chunk_rows):
+    result = ingest_timekeepers(_csv(
+        TIMEKEEPER_HEADER,
+        "Ann Lee,Partner,AL1,300,",            # line 2
+        ",Associate,X1,200,",                  # line 3: blank name
+        "Bob Roe,Associate,,200,",             # line 4: blank ID
+        "Cy Poe,Paralegal,CP1,abc,",           # line 5: bad rate
+        "Di Fox,Paralegal,DF1,-5,",            # line 6: negative rate
+        "Ann Lee,Partner,AL1,999,",            # line 7: duplicate of line 2
+        "Fay Day,Partner,FD1,1000000,",        # line 8: absurd rate
+        "Ed Ng,Associate,EN1,\"$1,250.00\",2025-13-01",  # line 9: bad date
+        "Ed Ng,Associate,EN1,\"$1,250.00\",2025-03-01",  # line 10
+    ), chunk_rows=chunk_rows)
+    assert result.rows_read == 9
+    assert [line for line, _ in result.errors] == [3, 4, 5, 6, 8, 9]
+    assert "TIMEKEEPER_NAME" in result.errors[0][1] and "TIMEKEEPER_ID" in result.errors[1][1]
+    assert "RATE" in result.errors[2][1] and "RATE" in result.errors[3][1] and "EFFECTIVE_DATE" in result.errors[5][1]
+    assert result.duplicates == 1 and result.error_count == 6
+    assert [(r["TIMEKEEPER_ID"], r["RATE"]) for r in result.records] == [("AL1", 300.0), ("EN1", 1250.0)]
+
+
+def test_padded_headers_are_normalised(tmp_path):
+    text = " TIMEKEEPER_NAME ,TIMEKEEPER_CLASSIFICATION , TIMEKEEPER_ID,RATE \nAnn Lee,Partner,AL1, 300 \n"
+    path = tmp_path / "tk.csv"
+    path.write_text(text, encoding="utf-8")
+    records = load_timekeeper_records(str(path))
+    assert records == [{"TIMEKEEPER_NAME": "Ann Lee", "TIMEKEEPER_CLASSIFICATION": "Partner", "TIMEKEEPER_ID": "AL1", "RATE": 300.0}]
+    tasks = ingest_task_activity(_csv("TASK_CODE , ACTIVITY_CODE ,DESCRIPTION ", "l110,a101,Reviewed file"))
+    assert tasks.records == [("L110", "A101", "Reviewed file")]
+
+
+@pytest.mark.parametrize("chunk_rows", [1, 2, 100])
+def test_task_codes_are_validated_and_deduped(chunk_rows):
+    result = ingest_task_activity(_csv(
+        "TASK_CODE,ACTIVITY_CODE,DESCRIPTION",
+        "L110,A101,Reviewed file",     # line 2
+        "110,A101,Bad task",           # line 3
+        "L120,A1,Bad activity",        # line 4
+        "L130,A102,",                  # line 5: blank description
+        "l110, a101 ,Reviewed file",   # line 6: duplicate once normalised
+        "L140,A103,Drafted motion",    # line 7
+    ), chunk_rows=chunk_rows)
+    assert [line for line, _ in result.errors] == [3, 4, 5]
+    assert result.duplicates == 1
+    assert result.records == [("L110", "A101", "Reviewed file"), ("L140", "A103", "Drafted motion")]
+    assert result.digest == ingest_task_activity(_csv("TASK_CODE,ACTIVITY_CODE,DESCRIPTION", "L110,A101,Reviewed file",
+                                                      "L140,A103,Drafted motion")).digest
+
+
+def test_unusable_files_raise_ingest_error():
+    with pytest.raises(IngestError, match="missing: RATE"):
+        ingest_timekeepers(_csv("TIMEKEEPER_NAME,TIMEKEEPER_CLASSIFICATION,TIMEKEEPER_ID", "Ann,Partner,A1"))
+    with pytest.raises(IngestError, match="empty"):
+        ingest_timekeepers(io.BytesIO(b""))
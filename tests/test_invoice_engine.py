@@ -0,0 +1,14 @@
+"""Generation settings: named expense rates and explicit per-code overrides."""
+from invoice_engine import GenerationSettings, _resolve_expense_models
+
+
+def test_expense_overrides_win_over_named_rates():
+    settings = GenerationSettings(mileage_rate_e109=0.65, expense_model_overrides=(("E109", (10, 10), (2.0, 2.0)),))
+    models = _resolve_expense_models(settings.expense_models())
+    assert models["E109"] == {"units": (10, 10), "rate": (2.0, 2.0)}
+    assert models["E101"]["rate"] == (settings.copying_rate_e101, settings.copying_rate_e101)
+
+
+def test_named_rates_apply_without_overrides():
+    models = _resolve_expense_models(GenerationSettings(mileage_rate_e109=0.7).expense_models())
+    assert models["E109"]["rate"] == (0.7, 0.7)
@@ -0,0 +1,141 @@
+"""Email delivery: streamed MIME parses back to the original attachments, and the size policy splits or links."""
+import email
+import email.header
+import random
+
+import pytest
+
+from mail_delivery import (
+    DeliveryPolicy, encoded_size, link_folder, message_chunks, plan_delivery, publish_links, send_plan, send_streaming,
+)
+from spool import SpooledArtifact
+from strategies import examples
+
+
+class FakeSMTP:
+    """Records the DATA stream the way smtplib would write it to the socket."""
+
+    def __init__(self):
+        self.stream, self.replies, self.envelope = [], [], []
+
+    def has_extn(self, name):
+        return name == "size"
+
+    def mail(self, sender, options=()):
+        self.envelope.append((sender, list(options)))
+        return 250, b"ok"
+
+    def rcpt(self, recipient):
+        return 250, b"ok"
+
+    def putcmd(self, cmd):
+        self.replies.append(354 if cmd == "data" else 250)
+
+    def getreply(self):
+        return self.replies.pop(0) if self.replies else 250, b"ok"
+
+    def send(self, data):
+        self.stream.append(data)
+
+
+@examples(5)
+def test_streamed_message_round_trips(seed):
+    rng = random.Random(seed)
+    files = [(f"file{n}.{rng.choice(['pdf', 'txt', 'zip'])}", rng.randbytes(rng.randint(0, 200_000))) for n in range(rng.randint(0, 4))]
+    spool = SpooledArtifact("LEDES_Combined.txt", max_memory=1024)
+    spool.write(b"LEDES1998B[]\r\n" * rng.randint(1, 500))
+    files.append((spool.name, spool))
+    body = ".leading dot\nline two\n.\n"
+    server = FakeSMTP()
+    send_streaming(server, "a@example.com", "b@example.com", "Invoice – test", body, files)
+    raw = b"".join(server.stream)
+    assert raw.endswith(b"\r\n.\r\n") and all(len(line) <= 998 for line in raw.split(b"\r\n"))
+    message = email.message_from_bytes(raw[:-3].replace(b"\r\n..", b"\r\n."))
+    parts = [part for part in message.walk() if not part.is_multipart()]
+    assert parts[0].get_payload(decode=True).decode("utf-8") == body
+    expected = [(name, data if isinstance(data, bytes) else data.getvalue()) for name, data in files]
+    assert [(p.get_filename(), p.get_payload(decode=True)) for p in parts[1:]] == expected
+    assert str(email.header.make_header(email.header.decode_header(message["Subject"]))) == "Invoice – test"
+
+
+def test_base64_sizes_are_exact():
+    for size in (0, 1, 56, 57, 58, 1000, 57 * 18396 + 5):
+        chunks = b"".join(message_chunks("a", "b", "s", "", [("x.bin", b"\xff" * size)], boundary="B"))
+        encoded = chunks.split(b"\r\n\r\n")[-1].split(b"--B--")[0]
+        assert len(encoded) == encoded_size(size)
+
+
+def test_policy_splits_in_order():
+    policy = DeliveryPolicy(max_message_bytes=60_000, max_messages=3)
+    files = [(f"f{n}.pdf", b"x" * 20_000) for n in range(5)]
+    plan = plan_delivery(files, policy)
+    assert [name for message in plan.messages for name, _ in message] == [name for name, _ in files]
+    assert len(plan.messages) == 3 and not plan.linked
+    with pytest.raises(ValueError):
+        plan_delivery(files, DeliveryPolicy(max_message_bytes=60_000, max_messages=2))
+
+
+def test_policy_links_what_does_not_fit(tmp_path):
+    big = ("receipts.zip", b"z" * 100_000)
+    files = [("Invoice_1.pdf", b"p" * 1000), big]
+    with pytest.raises(ValueError):
+        plan_delivery(files, DeliveryPolicy(max_message_bytes=50_000))
+    policy = DeliveryPolicy(max_message_bytes=50_000, link_dir=str(tmp_path), link_base_url="https://files.example.com/out/")
+    plan = plan_delivery(files, policy)
+    assert plan.messages == ((files[0],),) and plan.linked == (big,)
+    manifest = publish_links(list(plan.linked), policy, "run1")
+    assert "https://files.example.com/out/run1/receipts.zip" in manifest
+    assert (tmp_path / "run1" / "receipts.zip").read_bytes() == big[1]
+    odd = [("Invoice #7 (final)?.pdf", b"q" * 10)]
+    manifest = publish_links(odd, policy, "run 2")
+    assert "https://files.example.com/out/run%202/Invoice%20%237%20%28final%29%3F.pdf" in manifest
+    assert (tmp_path / "run 2" / "Invoice #7 (final)?.pdf").read_bytes() == odd[0][1]
+    everything = plan_delivery(files * 3, DeliveryPolicy(max_message_bytes=3000, max_messages=1, link_dir=str(tmp_path)))
+    assert everything.messages == ((),) and len(everything.linked) == 6
+
+
+def _sent_messages(server):
+    raw = b"".join(server.stream)
+    return [email.message_from_bytes(m.replace(b"\r\n..", b"\r\n.")) for m in raw.split(b"\r\n.\r\n") if m]
+
+
+def _attachments(message):
+    return [(p.get_filename(), p.get_payload(decode=True)) for p in message.walk() if p.get_filename()]
+
+
+def test_split_send_numbers_each_part(tmp_path):
+    files = [(f"Invoice_{n}.pdf", bytes([n]) * 20_000) for n in range(5)]
+    policy = DeliveryPolicy(max_message_bytes=60_000, max_messages=3, link_dir=str(tmp_path))
+    server = FakeSMTP()
+    send_plan(server, "a@example.com", "b@example.com", "Invoices", "See attached.", plan_delivery(files, policy))
+    messages = _sent_messages(server)
+    assert [m["Subject"] for m in messages] == [f"Invoices (part {n} of 3)" for n in (1, 2, 3)]
+    assert [a for m in messages for a in _attachments(m)] == files
+    assert all(len(m.as_bytes()) <= policy.max_message_bytes for m in messages)
+    assert not list(tmp_path.iterdir())
+
+
+def test_send_that_needs_too_many_parts_links_everything(tmp_path):
+    files = [(f"Invoice_{n}.pdf", bytes([n]) * 20_000) for n in range(5)]
+    policy = DeliveryPolicy(max_message_bytes=60_000, max_messages=2, link_dir=str(tmp_path), link_base_url="https://files.example.com")
+    plan = plan_delivery(files, policy)
+    folder = link_folder("run42")
+    body = "See below.\n\n" + publish_links(list(plan.linked), policy, folder)
+    server = FakeSMTP()
+    send_plan(server, "a@example.com", "b@example.com", "Invoices", body, plan)
+    [message] = _sent_messages(server)
+    assert message["Subject"] == "Invoices" and not _attachments(message)
+    text = next(p for p in message.walk() if p.get_content_type() == "text/plain").get_payload(decode=True).decode("utf-8")
+    for name, data in files:
+        assert f"https://files.example.com/{folder}/{name}" in text
+        assert (tmp_path / folder / name).read_bytes() == data
+
+
+def test_link_folders_are_unique_per_send():
+    assert link_folder("abc123").endswith("_abc123")
+    assert len({link_folder() for _ in range(50)}) == 50
+
+
+def test_policy_from_secrets():
+    policy = DeliveryPolicy.from_mapping({"email_from": "x", "max_message_mb": "10", "max_messages": 2, "link_dir": ""})
+    assert policy == DeliveryPolicy(max_message_bytes=10 * 1024 * 1024, max_messages=2)
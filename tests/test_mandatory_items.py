@@ -0,0 +1,61 @@
+"""Mandatory-item plans: every selected rule lands on every invoice, and line counts add up."""
+import random
+
+import pytest
+
+from invoice_engine import GenerationSettings
+from mandatory_items import MANDATORY_ITEM_RULES, compile_mandatory_items
+from rng import invoice_random
+from strategies import CLIENT_ID, LAW_FIRM_ID, billing_period, examples, timekeeper_roster
+
+
+@examples()
+def test_plan_keeps_requested_line_counts(seed):
+    rng = random.Random(seed)
+    roster = timekeeper_roster(rng)
+    rules = {
+        f"item{n}": (
+            {"desc": "Expense {uber_amount}", "expense_code": "E110", "is_expense": True, "quantity": rng.randint(0, 3)}
+            if rng.random() < 0.4 else
+            {"desc": "Fee", "tk_name": rng.choice(roster)["TIMEKEEPER_NAME"] if rng.random() < 0.8 else "Nobody Here",
+             "task": "L100", "activity": "A101", "is_expense": False, "quantity": rng.randint(0, 3),
+             "dates": rng.choice(["any", "start", "end"])}
+        )
+        for n in range(rng.randint(1, 12))
+    }
+    settings = GenerationSettings(uber_amount=12.5)
+    plan = compile_mandatory_items(list(rules), roster, settings, rules)
+    fees, expenses = rng.randint(0, 40), rng.randint(0, 10)
+    fee_count, expense_count = plan.generated_counts(fees, expenses)
+    assert fee_count + plan.fee_lines == max(fees, plan.fee_lines)
+    assert expense_count + plan.expense_lines == max(expenses, plan.expense_lines)
+    start, end = billing_period(rng)
+    invoice_random.seed(seed)
+    generated = [{"DESCRIPTION": "generated"}] * rng.randint(0, 5)
+    rows, skipped = plan.inject(list(generated), roster, "Desc", CLIENT_ID, LAW_FIRM_ID, start, end, settings)
+    assert rows[:len(generated)] == generated
+    assert sum(1 for row in rows if row.get("EXPENSE_CODE")) == plan.expense_lines
+    assert len(rows) - len(generated) == plan.fee_lines + plan.expense_lines
+    assert set(skipped) == {name for name, rule in rules.items() if rule.get("tk_name") == "Nobody Here"}
+    calendar = settings.calendar_index(start, end)
+    for row in rows[len(generated):]:
+        assert row["LINE_ITEM_DATE"] in calendar.date_strs
+        assert abs(float(row["HOURS"]) * float(row["RATE"]) - float(row["LINE_ITEM_TOTAL"])) <= 0.005 + 1e-9
+
+
+def test_airfare_rule_renders_settings():
+    settings = GenerationSettings(airfare_airline="UA", airfare_flight_number="UA1", airfare_roundtrip=True, airfare_amount=450.75)
+    plan = compile_mandatory_items(["Airfare E110"], [], settings)
+    assert plan.expense_lines == 1 and plan.generated_counts(5, 3) == (5, 2)
+    rows, skipped = plan.inject([], [], "Desc", CLIENT_ID, LAW_FIRM_ID, *billing_period(random.Random(0)), settings)
+    assert not skipped
+    assert rows[0]["DESCRIPTION"] == "Airfare (Economy/Coach): UA UA1, N/A to N/A (Roundtrip)"
+    assert rows[0]["LINE_ITEM_TOTAL"] == 450.75 and rows[0]["airfare_details"]["is_roundtrip"] is True
+
+
+def test_unknown_items_and_templates_are_rejected():
+    with pytest.raises(ValueError):
+        compile_mandatory_items(["No such item"], [], GenerationSettings())
+    with pytest.raises(ValueError):
+        compile_mandatory_items(["x"], [], GenerationSettings(), {"x": {"desc": "{missing}", "is_expense": True, "expense_code": "E101"}})
+    assert set(MANDATORY_ITEM_RULES) >= {"Uber E110", "Airfare E110"}
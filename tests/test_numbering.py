@@ -0,0 +1,65 @@
+"""Persistent numbering: concurrent leases on one counter file never overlap or leave holes."""
+import multiprocessing
+import threading
+
+from numbering import NumberCounter, NumberLease
+
+WORKERS = 8
+BLOCK = 7
+BLOCKS_PER_WORKER = 15
+
+
+def _lease_numbers(path, out):
+    lease = NumberLease(NumberCounter(path), "invoice", BLOCK)
+    out.extend(lease.next() for _ in range(BLOCK * BLOCKS_PER_WORKER))
+
+
+def _reserve_blocks(path):
+    counter = NumberCounter(path)
+    return [n for _ in range(BLOCKS_PER_WORKER) for n in counter.reserve("invoice", BLOCK)]
+
+
+def _assert_contiguous(numbers):
+    total = WORKERS * BLOCK * BLOCKS_PER_WORKER
+    assert len(numbers) == total
+    assert sorted(numbers) == list(range(1, total + 1))
+
+
+def test_threads_leasing_from_one_file(tmp_path):
+    path = str(tmp_path / "numbers.sqlite")
+    NumberCounter(path)
+    results = [[] for _ in range(WORKERS)]
+    threads = [threading.Thread(target=_lease_numbers, args=(path, out)) for out in results]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    _assert_contiguous([n for out in results for n in out])
+
+
+def test_processes_reserving_from_one_file(tmp_path):
+    path = str(tmp_path / "numbers.sqlite")
+    NumberCounter(path)
+    with multiprocessing.get_context("spawn").Pool(WORKERS) as pool:
+        results = pool.map(_reserve_blocks, [path] * WORKERS)
+    _assert_contiguous([n for out in results for n in out])
+    assert NumberCounter(path).peek("invoice") == WORKERS * BLOCK * BLOCKS_PER_WORKER + 1
+
+
+def test_shared_lease_across_threads(tmp_path):
+    lease = NumberLease(NumberCounter(str(tmp_path / "numbers.sqlite")), "invoice", BLOCK)
+    numbers = []
+    lock = threading.Lock()
+
+    def draw():
+        for _ in range(BLOCK * BLOCKS_PER_WORKER):
+            value = lease.next()
+            with lock:
+                numbers.append(value)
+
+    threads = [threading.Thread(target=draw) for _ in range(WORKERS)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    _assert_contiguous(numbers)
@@ -0,0 +1,42 @@
+"""PDF layouts: compiled once per template, and each billing profile renders with its own layout."""
+import pandas as pd
+import pytest
+
+from invoice_engine import _create_pdf_invoice
+from invoice_summary import summarize_invoice
+from pdf_layouts import DEFAULT_PDF_LAYOUT, PDF_LAYOUTS, compile_layout, layout_hash, resolve_layout_template
+from strategies import generated_invoice
+
+
+def test_compiled_layouts_are_memoised_by_template():
+    assert compile_layout("Unity") is compile_layout("Unity")
+    assert compile_layout(resolve_layout_template("Unity")) is compile_layout("Unity")
+    assert compile_layout(None) is compile_layout("Onit ELM")          # same template as the default
+    assert compile_layout("SimpleLegal") is not compile_layout("Unity")
+    assert compile_layout({"grid_width": 0.25}).template_hash == layout_hash({"grid_width": 0.25}) != layout_hash(None)
+    embedded = compile_layout("Unity", embed_fonts=True)
+    assert embedded is compile_layout("Unity", embed_fonts=True) and embedded is not compile_layout("Unity")
+    assert embedded.styles["table_data"].fontName == "Vera"
+
+
+@pytest.mark.parametrize("profile", sorted(PDF_LAYOUTS))
+def test_each_profile_selects_its_layout(profile):
+    template = {**DEFAULT_PDF_LAYOUT, **PDF_LAYOUTS[profile]}
+    compiled = compile_layout(profile)
+    assert compiled.styles["table_data"].fontName == template["font"]
+    assert compiled.styles["table_header"].fontName == template["bold_font"]
+    invoice = generated_invoice(7)
+    rows = invoice["rows"]
+    pdf = _create_pdf_invoice(
+        df=pd.DataFrame(rows), total_amount=invoice["total"], invoice_number=invoice["invoice_number"],
+        invoice_date=invoice["end"], billing_start_date=invoice["start"], billing_end_date=invoice["end"],
+        client_id="C1", law_firm_id="F1", summary=summarize_invoice(rows), layout=profile,
+    ).getvalue()
+    assert f"/{template['font']}".encode("ascii") in pdf
+    assert (b"/Times-Roman" in pdf) == (template["font"] == "Times-Roman")
+
+
+def test_unknown_profiles_fall_back_to_the_default(caplog):
+    assert resolve_layout_template("No such profile") == DEFAULT_PDF_LAYOUT
+    assert "No PDF layout for profile" in caplog.text
+    assert compile_layout("No such profile").template_hash == layout_hash(None)
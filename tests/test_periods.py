@@ -0,0 +1,110 @@
+"""
+Per-period dispatch: inline runs are isolated between threads, job errors are not retried serially, the
+generator's total travels with the rows, and pool workers log under the caller's context.
+"""
+import dataclasses
+import datetime
+import json
+import logging
+import random
+import threading
+
+import pytest
+
+import invoice_engine
+from invoice_engine import CONFIG, GenerationSettings
+from ledes_validation import validate_invoice
+from mandatory_items import MANDATORY_ITEM_RULES, compile_mandatory_items
+from periods import PARALLEL_MIN_JOBS, dispatch_period_rows
+from telemetry import log_context, shutdown_logging
+from strategies import CLIENT_ID, LAW_FIRM_ID, task_catalog, timekeeper_roster
+
+
+def _shared(seed):
+    rng = random.Random(seed)
+    return {
+        "seed": seed, "fee_count": 40, "expense_count": 5, "timekeepers": timekeeper_roster(rng, 2, 6),
+        "client_id": CLIENT_ID, "law_firm_id": LAW_FIRM_ID, "task_activity_desc": task_catalog(rng),
+        "major_task_codes": CONFIG['MAJOR_TASK_CODES'], "max_daily_hours": 16, "include_block_billed": True,
+        "settings": GenerationSettings(), "mandatory_items": None,
+    }
+
+
+def _jobs(count):
+    start = datetime.date(2025, 1, 1)
+    return [{"invoice_index": i, "start": start, "end": start + datetime.timedelta(days=27), "invoice_desc": "Dispatch"}
+            for i in range(count)]
+
+
+def _run(shared, jobs, workers=1):
+    return {r["invoice_index"]: r["rows"] for r in dispatch_period_rows(shared, jobs, workers)}
+
+
+def test_concurrent_inline_runs_do_not_mix(monkeypatch):
+    expected = {seed: _run(_shared(seed), _jobs(6)) for seed in range(4)}
+    results, errors = {}, []
+
+    def session(seed):
+        try:
+            for _ in range(3):
+                results.setdefault(seed, []).append(_run(_shared(seed), _jobs(6)))
+        except Exception as e:  # pragma: no cover - reported below
+            errors.append(e)
+
+    threads = [threading.Thread(target=session, args=(seed,)) for seed in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert not errors
+    for seed, runs in results.items():
+        roster_ids = {tk["TIMEKEEPER_ID"] for tk in _shared(seed)["timekeepers"]}
+        for run in runs:
+            assert run == expected[seed]
+            assert all(row["TIMEKEEPER_ID"] in roster_ids for rows in run.values() for row in rows if not row["EXPENSE_CODE"])
+
+
+def test_job_errors_propagate_without_serial_retry(caplog):
+    shared = _shared(0)
+    del shared["fee_count"]
+    with caplog.at_level(logging.ERROR), pytest.raises(KeyError):
+        list(dispatch_period_rows(shared, _jobs(PARALLEL_MIN_JOBS), max_workers=2))
+    assert "finishing serially" not in caplog.text
+
+
+def test_results_carry_the_generator_total_across_mandatory_items(monkeypatch):
+    shared = _shared(3)
+    names = [name for name, rule in MANDATORY_ITEM_RULES.items() if rule.get("is_expense")][:2]
+    shared["mandatory_items"] = compile_mandatory_items(names, shared["timekeepers"], shared["settings"])
+    (result,) = dispatch_period_rows(shared, _jobs(1))
+    assert result["total"] == pytest.approx(sum(float(row["LINE_ITEM_TOTAL"]) for row in result["rows"]))
+    assert result["total"] == pytest.approx(result["summary"]["total"])
+
+    # A generator whose total disagrees with its lines must reach the invoice_total rule
+    generate = invoice_engine._generate_invoice_data
+
+    def _overstated(*args):
+        rows, total = generate(*args)
+        return rows, total + 100
+
+    monkeypatch.setattr(invoice_engine, "_generate_invoice_data", _overstated)
+    (result,) = dispatch_period_rows(shared, _jobs(1))
+    job = _jobs(1)[0]
+    violations = validate_invoice(result["rows"], "INV-1", job["start"], job["end"], result["total"], result["skipped"])
+    assert [v.rule for v in violations if v.severity == "error"] == ["invoice_total"]
+
+
+def test_pool_workers_log_under_the_callers_context(queued_logs):
+    shared = _shared(5)
+    shared["settings"] = dataclasses.replace(shared["settings"], business_days_only=True)
+    saturday = datetime.date(2025, 1, 4)
+    jobs = [{"invoice_index": i, "start": saturday + datetime.timedelta(weeks=i),
+             "end": saturday + datetime.timedelta(weeks=i, days=1), "invoice_desc": "Weekend"}
+            for i in range(PARALLEL_MIN_JOBS)]
+    with log_context(run_id="run-7"):
+        assert len(list(dispatch_period_rows(shared, jobs, max_workers=2))) == len(jobs)
+    shutdown_logging()
+    records = [json.loads(line) for line in queued_logs.getvalue().splitlines()]
+    weekend = [r for r in records if r["message"].startswith("No billable days")]
+    assert sorted(r["invoice_index"] for r in weekend) == list(range(len(jobs)))
+    assert all(r["run_id"] == "run-7" for r in weekend)
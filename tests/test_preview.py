@@ -0,0 +1,48 @@
+"""Invoice browser views: filtered totals agree with the invoice summary, and pages cover every match once."""
+import pytest
+
+from invoice_summary import summarize_invoice
+from preview import PREVIEW_COLUMNS, facets, filter_rows, page_count, page_frame, summary_totals
+from strategies import examples, generated_invoice
+
+
+@examples()
+def test_filters_agree_with_the_summary(seed):
+    rows = generated_invoice(seed)["rows"]
+    summary = summarize_invoice(rows)
+    everything = filter_rows(rows)
+    assert everything.indices == list(range(len(rows)))
+    assert everything.totals == pytest.approx(summary_totals(summary))
+    values = facets(summary)
+    for name in values["timekeepers"]:
+        view = filter_rows(rows, timekeeper=name)
+        expected = summary["by_timekeeper"][name]
+        assert (view.totals["lines"], view.totals["hours"]) == (expected["lines"], pytest.approx(expected["hours"]))
+        assert view.totals["fees"] == pytest.approx(expected["amount"]) and view.totals["expenses"] == 0
+    for code in values["task_codes"]:
+        view = filter_rows(rows, task_code=code)
+        assert view.totals["fees"] == pytest.approx(summary["by_task_code"][code]["amount"])
+    for code in values["expense_codes"]:
+        view = filter_rows(rows, expense_code=code)
+        expected = summary["by_expense_code"][code]
+        assert (view.totals["lines"], view.totals["fees"]) == (expected["lines"], 0)
+        assert view.totals["expenses"] == pytest.approx(expected["amount"])
+    if values["timekeepers"] and values["expense_codes"]:
+        assert filter_rows(rows, timekeeper=values["timekeepers"][0], expense_code=values["expense_codes"][0]).indices == []
+
+
+@pytest.mark.parametrize("total, pages", [(0, 1), (1, 1), (50, 1), (51, 2), (120, 3)])
+def test_page_count(total, pages):
+    assert page_count(total, 50) == pages
+
+
+def test_pages_cover_each_selected_row_once():
+    rows = [{"LINE_ITEM_DATE": f"2025-01-{n % 28 + 1:02d}", "EXPENSE_CODE": "" if n % 3 else "E101",
+             "LINE_ITEM_TOTAL": float(n), "HOURS": 1.0} for n in range(23)]
+    view = filter_rows(rows, expense_code="E101")
+    frames = [page_frame(rows, view.indices, page, page_size=3) for page in range(1, page_count(len(view.indices), 3) + 1)]
+    assert list(frames[0].columns) == PREVIEW_COLUMNS
+    assert [i for f in frames for i in f.index] == list(range(1, len(view.indices) + 1))
+    assert [t for f in frames for t in f["LINE_ITEM_TOTAL"]] == [rows[i]["LINE_ITEM_TOTAL"] for i in view.indices]
+    assert page_frame(rows, view.indices, 0, page_size=3).equals(frames[0])
+    assert page_frame(rows, view.indices, 99, page_size=3).empty
@@ -0,0 +1,102 @@
+"""Property tests: invariants that must hold for every generated invoice, over random catalogs and periods."""
+import collections
+import random
+
+from invoice_engine import LEDES_1998B_FIELDS, LEDES_1998B_HEADER
+from invoice_summary import summarize_invoice
+from ledes_validation import ValidationRules, has_errors, validate_invoice
+from numbering import UniqueNames
+from strategies import LEDES_FIELD_COUNT, examples, generated_invoice, ledes_content, ledes_records
+
+
+@examples()
+def test_ledes_lines_are_well_formed(seed):
+    invoice = generated_invoice(seed)
+    content = ledes_content(invoice)
+    lines = content.split("\r\n")
+    assert lines[0] == LEDES_1998B_HEADER and lines[1] == LEDES_1998B_FIELDS
+    assert lines[-1] == "" and "\n" not in content.replace("\r\n", "")
+    assert all(line.endswith("[]") for line in lines[:-1])
+    assert len(LEDES_1998B_FIELDS[:-2].split("|")) == LEDES_FIELD_COUNT
+    records = ledes_records(content)
+    assert len(records) == len(invoice["rows"])
+    for line_no, (record, row) in enumerate(zip(records, invoice["rows"]), start=1):
+        assert len(record) == LEDES_FIELD_COUNT
+        assert record[1] == invoice["invoice_number"]
+        assert record[3] == record[23] == invoice["matter_number"]
+        assert record[8] == str(line_no)
+        assert record[9] == ("E" if row["EXPENSE_CODE"] else "F")
+        assert record[5] == f"{invoice['start']:%Y%m%d}" and record[0] == record[6] == f"{invoice['end']:%Y%m%d}"
+
+
+@examples()
+def test_totals_reconcile(seed):
+    invoice = generated_invoice(seed)
+    rows = invoice["rows"]
+    records = ledes_records(ledes_content(invoice))
+    cents = sum(round(float(r["LINE_ITEM_TOTAL"]) * 100) for r in rows)
+    assert abs(invoice["total"] * 100 - cents) < 0.5
+    assert all(record[4] == f"{invoice['total']:.2f}" for record in records)
+    assert sum(round(float(record[12]) * 100) for record in records) == cents
+    summary = summarize_invoice(rows)
+    assert round(summary["fees_total"] + summary["expenses_total"], 2) == summary["total"] == round(invoice["total"], 2)
+    assert summary["fee_lines"] + summary["expense_lines"] == len(rows)
+    for row in rows:
+        # Block-billed lines sum already-rounded line totals, so allow a few cents of drift
+        assert abs(float(row["HOURS"]) * float(row["RATE"]) - float(row["LINE_ITEM_TOTAL"])) <= 0.05
+
+
+@examples()
+def test_hours_caps_hold(seed):
+    invoice = generated_invoice(seed)
+    daily = collections.Counter()
+    for row in invoice["rows"]:
+        if not row["EXPENSE_CODE"]:
+            assert 0 < float(row["HOURS"])
+            daily[(row["TIMEKEEPER_ID"], row["LINE_ITEM_DATE"])] += float(row["HOURS"])
+    assert all(hours <= invoice["max_daily_hours"] + 1e-9 for hours in daily.values())
+
+
+@examples()
+def test_rows_stay_on_the_billing_calendar(seed):
+    invoice = generated_invoice(seed)
+    billable = set(invoice["settings"].calendar_index(invoice["start"], invoice["end"]).date_strs)
+    roster = {tk["TIMEKEEPER_ID"]: tk for tk in invoice["roster"]}
+    for row in invoice["rows"]:
+        assert row["LINE_ITEM_DATE"] in billable
+        if not row["EXPENSE_CODE"]:
+            tk = roster[row["TIMEKEEPER_ID"]]
+            assert row["TIMEKEEPER_NAME"] == tk["TIMEKEEPER_NAME"]
+            assert (row["TASK_CODE"], row["ACTIVITY_CODE"]) in {(t, a) for t, a, _ in invoice["catalog"]}
+
+
+@examples()
+def test_generated_invoices_pass_validation(seed):
+    invoice = generated_invoice(seed)
+    rules = ValidationRules(max_daily_hours=float(invoice["max_daily_hours"]))
+    violations = validate_invoice(invoice["rows"], invoice["invoice_number"], invoice["start"], invoice["end"],
+                                  invoice_total=invoice["total"], rules=rules)
+    assert not has_errors(violations), violations
+
+
+@examples(5)
+def test_generation_is_deterministic(seed):
+    assert ledes_content(generated_invoice(seed)) == ledes_content(generated_invoice(seed))
+
+
+@examples()
+def test_combined_file_has_one_header(seed):
+    invoices = [generated_invoice(seed * 10 + i) for i in range(random.Random(seed).randint(2, 5))]
+    content = "".join(ledes_content(inv, is_first_invoice=i == 0) for i, inv in enumerate(invoices))
+    assert content.count(LEDES_1998B_HEADER + "\r\n") == 1 and content.startswith(LEDES_1998B_HEADER + "\r\n")
+    assert content.count(LEDES_1998B_FIELDS + "\r\n") == 1
+    assert len(ledes_records(content)) == sum(len(inv["rows"]) for inv in invoices)
+
+
+@examples()
+def test_unique_names_never_repeat(seed):
+    rng = random.Random(seed)
+    pool = [f"Receipt_E{rng.randint(101, 103)}_2025050{rng.randint(1, 3)}.pdf" for _ in range(6)] + ["Receipt_E101_20250501_2.pdf"]
+    names = UniqueNames()
+    claimed = [names.claim(rng.choice(pool)) for _ in range(rng.randint(1, 60))]
+    assert len(claimed) == len(set(claimed))
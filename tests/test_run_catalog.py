@@ -0,0 +1,67 @@
+"""Run catalog: rosters and task catalogs are stored once by digest, reruns resolve them, and blocked runs are failed."""
+import json
+import os
+import sqlite3
+
+import pytest
+
+import manifest
+from manifest import load_manifest, rerun_manifest, run_manifest
+from run_catalog import RunCatalog
+from stress_mode import run_stress_generation
+from strategies import fail_second_invoice
+
+ROSTER = [{"TIMEKEEPER_NAME": f"Lawyer {n}", "TIMEKEEPER_CLASSIFICATION": "Associate", "TIMEKEEPER_ID": f"TK{n:03d}", "RATE": 200.0 + n}
+          for n in range(50)]
+TASKS = [("L110", "A101", f"Reviewed file section {n}") for n in range(40)]
+MANIFEST = json.dumps({"entries": [{"matter_number": "M-1", "billing_start_date": "2025-01-01", "billing_end_date": "2025-01-31",
+                                    "fees": 8, "expenses": 2, "invoices": 2}]})
+
+
+def _totals(catalog, run_id):
+    return [(i["invoice_number"], i["total"]) for i in catalog.get_run(run_id)["invoices_detail"]]
+
+
+def test_inputs_are_stored_once_and_rerun(tmp_path):
+    catalog = RunCatalog(str(tmp_path / "catalog.sqlite"))
+    entries = load_manifest(MANIFEST, "m.json")
+    first = run_manifest(entries, str(tmp_path / "a"), timekeeper_data=ROSTER, task_activity_desc=TASKS, catalog=catalog)
+    run_manifest(entries, str(tmp_path / "b"), timekeeper_data=ROSTER, task_activity_desc=TASKS, catalog=catalog)
+    with sqlite3.connect(catalog.path) as conn:
+        assert conn.execute("SELECT kind, count(*) FROM inputs GROUP BY kind ORDER BY kind").fetchall() == [("task_activity", 1), ("timekeepers", 1)]
+        configs = [row[0] for row in conn.execute("SELECT config FROM runs")]
+    assert all("Lawyer 7" not in config and "Reviewed file section" not in config for config in configs)
+    config = catalog.get_run(first["run_id"])["config"]
+    assert catalog.load_input(config["timekeepers_digest"]) == ROSTER
+    rerun = rerun_manifest(catalog, first["run_id"], str(tmp_path / "c"))
+    assert _totals(catalog, rerun["run_id"]) == _totals(catalog, first["run_id"])
+
+
+def test_blocked_manifest_run_is_failed_and_leaves_no_bundles(tmp_path, monkeypatch):
+    fail_second_invoice(monkeypatch, manifest)
+    catalog = RunCatalog(str(tmp_path / "catalog.sqlite"))
+    entries = load_manifest(json.dumps({"entries": [
+        {"matter_number": "M-1", "billing_start_date": "2025-01-01", "billing_end_date": "2025-01-31", "fees": 8, "expenses": 2, "invoices": 1},
+        {"matter_number": "M-2", "billing_start_date": "2025-01-01", "billing_end_date": "2025-01-31", "fees": 8, "expenses": 2, "invoices": 1},
+    ]}), "m.json")
+    out_dir = tmp_path / "out"
+    with pytest.raises(ValueError, match="failed validation"):
+        run_manifest(entries, str(out_dir), timekeeper_data=ROSTER, catalog=catalog, line_items_format="arrow", validation="block")
+    assert os.listdir(out_dir) == ["validation_report.csv"]
+    [run] = catalog.runs()
+    assert run["status"] == "failed" and "failed validation" in run["error"]
+
+
+@pytest.mark.parametrize("failing", ["start_run", "record_invoice", "finish_run"])
+def test_catalog_errors_do_not_fail_bulk_runs(tmp_path, monkeypatch, caplog, failing):
+    catalog = RunCatalog(str(tmp_path / "catalog.sqlite"))
+
+    def locked(*args, **kwargs):
+        raise sqlite3.OperationalError("database is locked")
+
+    monkeypatch.setattr(catalog, failing, locked)
+    summary = run_manifest(load_manifest(MANIFEST, "m.json"), str(tmp_path / "out"), timekeeper_data=ROSTER, catalog=catalog)
+    assert summary["invoices"] == 2 and "database is locked" in caplog.text
+    assert ("run_id" in summary) == (failing != "start_run")
+    stress = run_stress_generation(str(tmp_path / "stress"), 2, 5, 1, catalog=catalog, seed=1)
+    assert stress["invoices"] == 2
@@ -0,0 +1,51 @@
+"""Spooled artifacts: written once, streamed back byte-for-byte, rolled to disk past the memory budget."""
+import io
+import random
+
+import pytest
+
+from spool import SpooledArtifact, artifact_bytes, artifact_chunks, open_artifact
+from strategies import examples, fixed_invoice, ledes_content
+
+
+@examples(5)
+def test_spool_round_trips_in_chunks(seed):
+    rng = random.Random(seed)
+    parts = [rng.randbytes(rng.randint(0, 5000)) for _ in range(rng.randint(1, 20))]
+    with SpooledArtifact("out.bin", max_memory=rng.choice([0, 1024, 1 << 20])) as spool:
+        for part in parts:
+            spool.write(part)
+        expected = b"".join(parts)
+        assert len(spool) == len(expected)
+        assert b"".join(spool.chunks(rng.randint(1, 4096))) == expected == spool.getvalue() == artifact_bytes(spool)
+        spool.write(b"tail")    # reading does not move the write position
+        assert spool.getvalue() == expected + b"tail"
+
+
+def test_combined_ledes_spills_to_disk():
+    parts = [ledes_content(fixed_invoice(seed=7, invoice_index=i), is_first_invoice=i == 0).encode("utf-8") for i in range(3)]
+    with SpooledArtifact("LEDES_Combined.txt", max_memory=len(parts[0]) + 1) as spool:
+        spool.write(parts[0])
+        assert not spool.on_disk
+        for part in parts[1:]:
+            spool.write(part)
+        assert spool.on_disk and spool.getvalue() == b"".join(parts)
+
+
+@pytest.mark.parametrize("max_memory", [1 << 20, 16], ids=["memory", "disk"])
+def test_reader_is_a_file_download_button_accepts(max_memory):
+    with SpooledArtifact("out.bin", max_memory=max_memory) as spool:
+        spool.write(b"LEDES1998B[]\r\n" * 50)
+        with spool.reader() as reader:
+            assert isinstance(reader, (io.BytesIO, io.BufferedReader))
+            assert reader.read() == spool.getvalue()
+        spool.write(b"tail")    # the spool outlives its readers
+        with open_artifact(spool) as reader:
+            assert reader.read().endswith(b"tail")
+        assert spool.on_disk == (max_memory == 16)
+
+
+def test_bytes_are_chunked_without_spooling():
+    data = bytes(range(256)) * 10
+    assert list(map(len, artifact_chunks(data, 1000))) == [1000, 1000, 560]
+    assert b"".join(artifact_chunks(data, 7)) == data and artifact_bytes(data) is data
@@ -0,0 +1,40 @@
+"""Stress runs: reported throughput counts the bytes actually written to disk; blocked runs leave no output."""
+import os
+
+import pytest
+
+import stress_mode
+from run_catalog import RunCatalog
+from stress_mode import run_stress_generation
+from strategies import fail_second_invoice
+
+ROSTER = [
+    {"TIMEKEEPER_NAME": "Zoë Müller", "TIMEKEEPER_CLASSIFICATION": "Partner", "TIMEKEEPER_ID": "ZM1", "RATE": 500.0},
+    {"TIMEKEEPER_NAME": "José Ñúñez", "TIMEKEEPER_CLASSIFICATION": "Associate", "TIMEKEEPER_ID": "JN1", "RATE": 300.0},
+]
+TASKS = [("L110", "A101", "Prüfung der Akten für {NAME_PLACEHOLDER} – Überblick"), ("L120", "A102", "Análisis de daños")]
+
+
+@pytest.mark.parametrize("combine", [True, False], ids=["combined", "separate"])
+def test_bytes_written_are_encoded_bytes(tmp_path, combine):
+    stats = run_stress_generation(
+        str(tmp_path), 3, 15, 3, timekeeper_data=ROSTER, task_activity_desc=TASKS,
+        invoice_desc="Servicios jurídicos – März", combine_ledes=combine, include_summaries=True, seed=3,
+    )
+    on_disk = sum(os.path.getsize(tmp_path / name) for name in os.listdir(tmp_path) if name != "stress_summary.json")
+    assert stats["bytes_written"] == on_disk
+
+
+@pytest.mark.parametrize("combine", [True, False], ids=["combined", "separate"])
+def test_blocked_run_removes_partial_output(tmp_path, monkeypatch, combine):
+    fail_second_invoice(monkeypatch, stress_mode)
+    catalog = RunCatalog(str(tmp_path / "catalog.sqlite"))
+    out_dir = tmp_path / "out"
+    with pytest.raises(ValueError, match="failed validation"):
+        run_stress_generation(
+            str(out_dir), 3, 15, 3, timekeeper_data=ROSTER, task_activity_desc=TASKS, combine_ledes=combine,
+            include_summaries=True, seed=3, line_items_format="arrow", catalog=catalog, validation="block",
+        )
+    assert os.listdir(out_dir) == ["validation_report.csv"]
+    [run] = catalog.runs()
+    assert run["status"] == "failed" and "failed validation" in run["error"]
@@ -0,0 +1,92 @@
+"""
+Telemetry: Prometheus exposition of the metrics registry, JSON log records with bound context,
+and metrics and logs forwarded from spawn-started pool workers.
+"""
+import io
+import json
+import logging
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import pytest
+
+from telemetry import (
+    INVOICES_GENERATED, LINES_PER_SECOND, JsonFormatter, MetricsRegistry, _ContextFilter, _Metric, bind_log_context,
+    log_context, shutdown_logging, worker_initializer,
+)
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    runs = registry.counter("runs_total", "Runs", ("source",))
+    latency = registry.histogram("render_seconds", "Render latency", buckets=(0.1, 1.0))
+    runs.inc(source="app")
+    runs.inc(2, source="app")
+    latency.observe(0.05)
+    latency.observe(5.0)
+    text = registry.render()
+    assert "# TYPE invoicegen_runs_total counter" in text
+    assert 'invoicegen_runs_total{source="app"} 3' in text
+    assert 'invoicegen_render_seconds_bucket{le="0.1"} 1' in text
+    assert 'invoicegen_render_seconds_bucket{le="1"} 1' in text
+    assert 'invoicegen_render_seconds_bucket{le="+Inf"} 2' in text
+    assert "invoicegen_render_seconds_count 2" in text
+    assert runs.value(source="app") == 3 and latency.count() == 2
+
+
+def test_gauge_inc_and_dec_are_deltas():
+    registry = MetricsRegistry()
+    jobs = registry.gauge("jobs_running", "Jobs running", ("source",))
+    jobs.set(5, source="app")
+    jobs.inc(source="app")
+    jobs.inc(2, source="app")
+    jobs.dec(source="app")
+    assert jobs.value(source="app") == 7
+    registry.apply(jobs.name, ("app",), 3.0)               # forwarded delta from a worker
+    registry.apply(jobs.name, ("app",), 1.0, delta=False)  # forwarded set
+    assert 'invoicegen_jobs_running{source="app"} 1' in registry.render()
+    with pytest.raises(TypeError):
+        _Metric(registry, "x", "x", ())
+
+
+def test_json_records_carry_bound_context():
+    stream = io.StringIO()
+    handler = logging.StreamHandler(stream)
+    handler.setFormatter(JsonFormatter())
+    handler.addFilter(_ContextFilter())
+    logger = logging.getLogger("invoicegen.test")
+    logger.addHandler(handler)
+    logger.propagate = False
+    try:
+        restore = bind_log_context(run_id="r1")
+        with log_context(invoice_number="INV-1"):
+            logger.error("failed")
+        restore()
+        logger.error("after")
+    finally:
+        logger.removeHandler(handler)
+    first, second = (json.loads(line) for line in stream.getvalue().splitlines())
+    assert first["message"] == "failed" and first["run_id"] == "r1" and first["invoice_number"] == "INV-1"
+    assert "run_id" not in second and "invoice_number" not in second
+
+
+def _pool_task(n):
+    with log_context(task=n):
+        INVOICES_GENERATED.inc(2, source="pool-test")
+        LINES_PER_SECOND.set(n, source="pool-test")
+        logging.getLogger("invoicegen.test").error(f"task {n} done")
+    return n
+
+
+def test_pool_workers_forward_metrics_and_logs(queued_logs):
+    before = INVOICES_GENERATED.value(source="pool-test")
+    initializer, initargs = worker_initializer()
+    assert initializer is not None
+    with ProcessPoolExecutor(max_workers=2, mp_context=multiprocessing.get_context("spawn"),
+                             initializer=initializer, initargs=initargs) as pool:
+        assert sorted(pool.map(_pool_task, range(4))) == [0, 1, 2, 3]
+    shutdown_logging()   # drains the queue: every forwarded record has been handled
+    assert INVOICES_GENERATED.value(source="pool-test") - before == 8
+    assert LINES_PER_SECOND.value(source="pool-test") in (0, 1, 2, 3)
+    records = [json.loads(line) for line in queued_logs.getvalue().splitlines()]
+    assert sorted((r["message"], r["task"]) for r in records) == [(f"task {n} done", n) for n in range(4)]
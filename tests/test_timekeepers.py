@@ -0,0 +1,25 @@
+"""Timekeeper registry: the first row wins for duplicates, and dated rows form a rate history."""
+import datetime
+
+from timekeepers import TimekeeperRegistry
+
+
+def _row(rate, effective=None):
+    row = {"TIMEKEEPER_NAME": "Ann Lee", "TIMEKEEPER_CLASSIFICATION": "Partner", "TIMEKEEPER_ID": "AL1", "RATE": rate}
+    if effective:
+        row["EFFECTIVE_DATE"] = effective
+    return row
+
+
+def test_undated_duplicates_keep_the_first_rate():
+    registry = TimekeeperRegistry.from_records([_row(300), _row(200)])
+    pos = registry.position_by_id("AL1")
+    assert len(registry) == 1 and not registry.has_rate_changes()
+    assert registry.rate_for(pos) == registry.rate_for(pos, datetime.date(2025, 6, 1)) == registry.record(pos)["RATE"] == 300
+
+
+def test_dated_rows_form_a_rate_history():
+    registry = TimekeeperRegistry.from_records([_row(300), _row(350, "2025-03-01"), _row(200), _row(400, "2025-03-01")])
+    pos = registry.position_by_id("AL1")
+    assert registry.rate_for(pos) == registry.rate_for(pos, "2025-02-28") == 300
+    assert registry.rate_for(pos, datetime.date(2025, 3, 1)) == 350
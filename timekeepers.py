@@ -0,0 +1,147 @@
+"""Indexed timekeeper registry: O(1) name/ID lookups and effective-dated rate resolution."""
+import bisect
+import datetime
+import logging
+from array import array
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+
+def _normalize_name(name: Any) -> str:
+    return str(name).strip().lower()
+
+
+def _parse_effective_date(value: Any) -> Optional[datetime.date]:
+    """Parse an EFFECTIVE_DATE cell; blank/NaN means 'always effective'."""
+    if value is None or value != value or str(value).strip() == "":  # value != value catches NaN
+        return None
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.datetime.strptime(str(value).strip()[:10], "%Y-%m-%d").date()
+
+
+class TimekeeperRegistry:
+    """
+    Timekeepers stored as compact columns and indexed by normalized name and by ID.
+
+    Each timekeeper gets a dense position. Names and IDs are plain lists, rates
+    are an array('d'), and classifications are small integer codes into a
+    category list. A CSV may repeat a TIMEKEEPER_ID with different EFFECTIVE_DATE
+    values. Those rows become a rate schedule, and rate_for() resolves it per
+    line date with a binary search.
+    """
+
+    def __init__(self) -> None:
+        self.names: List[str] = []
+        self.ids: List[str] = []
+        self.rates = array("d")
+        self.class_codes = array("H")
+        self.classifications: List[str] = []
+        self._class_index: Dict[str, int] = {}
+        self._by_name: Dict[str, int] = {}
+        self._by_id: Dict[str, int] = {}
+        # position -> (sorted effective-date ordinals, matching rates)
+        self._schedules: Dict[int, Tuple[List[int], List[float]]] = {}
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict[str, Any]]) -> "TimekeeperRegistry":
+        """Build a registry from timekeeper CSV records (one pass, later duplicates add rate history)."""
+        registry = cls()
+        dated: Dict[int, List[Tuple[int, float]]] = {}
+        for record in records:
+            tk_id = str(record.get("TIMEKEEPER_ID", "")).strip()
+            name = str(record.get("TIMEKEEPER_NAME", "")).strip()
+            try:
+                rate = float(record.get("RATE", 0.0))
+            except (TypeError, ValueError):
+                logging.error(f"Invalid rate for timekeeper {tk_id or name}: {record.get('RATE')!r}")
+                rate = 0.0
+            try:
+                effective = _parse_effective_date(record.get("EFFECTIVE_DATE"))
+            except ValueError:
+                logging.error(f"Invalid EFFECTIVE_DATE for timekeeper {tk_id or name}: {record.get('EFFECTIVE_DATE')!r}")
+                effective = None
+            key = tk_id or _normalize_name(name)
+            pos = registry._by_id.get(key)
+            if pos is None:
+                pos = registry._add(name, key, str(record.get("TIMEKEEPER_CLASSIFICATION", "")), rate)
+            dated.setdefault(pos, []).append((effective.toordinal() if effective else 0, rate))
+
+        for pos, entries in dated.items():
+            # Stable on the date alone: among rows with the same (or no) date the first one wins
+            entries.sort(key=lambda e: e[0])
+            entries = [e for i, e in enumerate(entries) if i == 0 or e[0] != entries[i - 1][0]]
+            # The earliest entry is the base rate (also used before the first effective date)
+            registry.rates[pos] = entries[0][1]
+            if len(entries) > 1:
+                registry._schedules[pos] = ([d for d, _ in entries], [r for _, r in entries])
+        return registry
+
+    def _add(self, name: str, tk_id: str, classification: str, rate: float) -> int:
+        pos = len(self.names)
+        self.names.append(name)
+        self.ids.append(tk_id)
+        self.rates.append(rate)
+        code = self._class_index.get(classification)
+        if code is None:
+            code = self._class_index[classification] = len(self.classifications)
+            self.classifications.append(classification)
+        self.class_codes.append(code)
+        self._by_id[tk_id] = pos
+        self._by_name.setdefault(_normalize_name(name), pos)
+        return pos
+
+    def __len__(self) -> int:
+        return len(self.names)
+
+    def position_by_name(self, name: str) -> Optional[int]:
+        return self._by_name.get(_normalize_name(name))
+
+    def position_by_id(self, tk_id: str) -> Optional[int]:
+        return self._by_id.get(str(tk_id).strip())
+
+    def classification(self, pos: int) -> str:
+        return self.classifications[self.class_codes[pos]]
+
+    def rate_for(self, pos: int, on_date: Optional[Any] = None) -> float:
+        """Rate in effect for timekeeper `pos` on `on_date` (a date or 'YYYY-MM-DD' string)."""
+        schedule = self._schedules.get(pos)
+        if schedule is None or on_date is None:
+            return self.rates[pos]
+        if isinstance(on_date, str):
+            on_date = datetime.date.fromisoformat(on_date)
+        idx = bisect.bisect_right(schedule[0], on_date.toordinal()) - 1
+        return schedule[1][max(idx, 0)]
+
+    def has_rate_changes(self) -> bool:
+        return bool(self._schedules)
+
+    def record(self, pos: int, on_date: Optional[Any] = None) -> Dict[str, Any]:
+        """Timekeeper as a CSV-shaped dict (rate resolved for on_date)."""
+        return {
+            "TIMEKEEPER_NAME": self.names[pos],
+            "TIMEKEEPER_CLASSIFICATION": self.classification(pos),
+            "TIMEKEEPER_ID": self.ids[pos],
+            "RATE": self.rate_for(pos, on_date),
+        }
+
+
+_REGISTRY_CACHE: Dict[int, Tuple[Any, int, TimekeeperRegistry]] = {}
+
+
+def as_registry(timekeepers: Any) -> TimekeeperRegistry:
+    """Return `timekeepers` as a registry, building (and memoising) one from a list of records."""
+    if isinstance(timekeepers, TimekeeperRegistry):
+        return timekeepers
+    if not timekeepers:
+        return TimekeeperRegistry()
+    key = id(timekeepers)
+    hit = _REGISTRY_CACHE.get(key)
+    if hit and hit[0] is timekeepers and hit[1] == len(timekeepers):
+        return hit[2]
+    registry = TimekeeperRegistry.from_records(timekeepers)
+    if len(_REGISTRY_CACHE) > 32:
+        _REGISTRY_CACHE.clear()
+    _REGISTRY_CACHE[key] = (timekeepers, len(timekeepers), registry)
+    return registry